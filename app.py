@@ -55,6 +55,8 @@
 #     st.header(st.session_state.selected_module)
 #     module_options[st.session_state.selected_module]()
 
+import importlib
+import os
 import streamlit as st
 
 # ✅ Must be first command
@@ -147,30 +149,30 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-# --- Import Module UIs ---
-from models import (
-    profile_management,
-    disease_prediction,
-    treatment_plan,
-    health_analytics,
-    patient_chat,
-    xray_analysis,
-    voice_query,
-    document_summary
-)
-
 # --- Dashboard Navigation ---
+# Feature modules pull in torch, transformers, PyPDF2, matplotlib, pandas...
+# so each one is imported only when the user opens it.
 module_options = {
-    "📋 Profile & Vitals": profile_management.patient_profile_ui,
-    "💊 Treatment Plan": treatment_plan.treatment_plan_ui,
-    "🔍 Disease Prediction": disease_prediction.disease_prediction_ui,
-    "📊 Health Analytics": health_analytics.run_health_analytics,
-    "🗣️ Patient Chat": patient_chat.patient_chat_ui,
-    "🩻 X‑Ray Analysis": xray_analysis.xray_analysis_ui,
-    "📁 Report Summary": document_summary.document_summary_ui,
-    "🎙️ Voice Query": voice_query.voice_query_ui,
+    "📋 Profile & Vitals": ("models.profile_management", "patient_profile_ui"),
+    "💊 Treatment Plan": ("models.treatment_plan", "treatment_plan_ui"),
+    "🔍 Disease Prediction": ("models.disease_prediction", "disease_prediction_ui"),
+    "📊 Health Analytics": ("models.health_analytics", "run_health_analytics"),
+    "🗣️ Patient Chat": ("models.patient_chat", "patient_chat_ui"),
+    "🩻 X‑Ray Analysis": ("models.xray_analysis", "xray_analysis_ui"),
+    "📁 Report Summary": ("models.document_summary", "document_summary_ui"),
+    "🎙️ Voice Query": ("models.voice_query", "voice_query_ui"),
 }
 
+def load_module_ui(key):
+    module_name, ui_name = module_options[key]
+    return getattr(importlib.import_module(module_name), ui_name)
+
+# Optionally start loading the chat model once per process, after the page renders
+@st.cache_resource(show_spinner=False)
+def start_model_warmup():
+    from utils.health_llm import warm_up_in_background
+    return warm_up_in_background()
+
 if "selected_module" not in st.session_state:
     st.session_state.selected_module = "🏠 Dashboard"
 
@@ -191,11 +193,17 @@ else:
         st.experimental_rerun()
 
     st.markdown(f"## {st.session_state.selected_module}")
-    module_options[st.session_state.selected_module]()
+    with st.spinner("Loading module..."):
+        module_ui = load_module_ui(st.session_state.selected_module)
+    module_ui()
 
 # --- Footer ---
 st.markdown(
     f"<div style='text-align:center; margin-top:50px; color:{text_color};'>© 2025 <b>HealthAI</b> | Built with ❤️ using Streamlit</div>",
     unsafe_allow_html=True
 )
+
+# Set HEALTHAI_WARMUP=1 to load the chat model in the background right after startup
+if os.getenv("HEALTHAI_WARMUP", "0") == "1":
+    start_model_warmup()
     
\ No newline at end of file
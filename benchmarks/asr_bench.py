@@ -0,0 +1,173 @@
+# benchmarks/asr_bench.py
+
+"""
+Speed/accuracy of the speech models in utils/asr_models.py.
+
+Transcribes every clip listed in the reference manifest with each model,
+through the same windowed pipeline the voice query page uses
+(utils/transcription.py), and reports real-time factor (processing seconds
+per second of audio, excluding model load) and word error rate against the
+reference transcripts. --save merges the results into the profiles file
+that HEALTHAI_ASR_MODEL=auto selects from.
+
+    python -m benchmarks.asr_bench --models tiny base small distil-small.en --save
+    python -m benchmarks.asr_bench --synthetic   # offline, tiny random Whisper
+
+The manifest (default data/asr_reference/manifest.jsonl) has one JSON object
+per line, with audio paths relative to the manifest:
+
+    {"audio": "clip_001.wav", "text": "I have had a dry cough and a fever for three days"}
+
+Reference recordings are not checked in; record a handful of typical voice
+queries from your own deployment (any format torchaudio reads). Without a
+manifest the benchmark runs the --synthetic pipeline check instead and
+saves nothing, so "auto" keeps its default until real numbers exist.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import time
+
+import torch
+import torchaudio
+
+from utils.asr_models import ASR_MODELS, LATENCY_BUDGET_S, WINDOW_S, load_asr_model, save_profiles, select_asr_model
+from utils.transcription import BATCH_SIZE, iter_transcription
+
+MANIFEST = os.path.join("data", "asr_reference", "manifest.jsonl")
+
+
+def load_manifest(path):
+    base = os.path.dirname(path)
+    with open(path, encoding="utf-8") as f:
+        clips = [json.loads(line) for line in f if line.strip()]
+    return [(os.path.join(base, clip["audio"]), clip["text"]) for clip in clips]
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def duration(path):
+    info = torchaudio.info(path)
+    return info.num_frames / info.sample_rate
+
+
+def evaluate(processor, model, clips, batch_size, **generate_kwargs):
+    """(real-time factor, WER %) over all clips, counted over the whole set rather than per clip."""
+    list(iter_transcription(clips[0][0], processor, model, batch_size, **generate_kwargs))  # warm-up
+
+    audio_s = seconds = 0.0
+    errors = words = 0
+    for path, reference in clips:
+        started = time.perf_counter()
+        text = " ".join(s["text"] for s in iter_transcription(path, processor, model, batch_size, **generate_kwargs))
+        seconds += time.perf_counter() - started
+        audio_s += duration(path)
+        reference = normalize(reference)
+        errors += word_errors(reference, normalize(text))
+        words += len(reference)
+    return seconds / audio_s, 100.0 * errors / max(words, 1)
+
+
+def synthetic_clips(directory, count=4, seed=0):
+    """Tone sweeps of 20-90 s at 44.1 kHz with placeholder transcripts (WER is meaningless here)."""
+    generator = torch.Generator().manual_seed(seed)
+    clips = []
+    for i in range(count):
+        seconds = 20 + 70 * i / max(count - 1, 1)
+        t = torch.arange(int(seconds * 44100)) / 44100
+        wave = 0.3 * torch.sin(2 * math.pi * (200 + 50 * t) * t) + 0.01 * torch.randn(t.shape, generator=generator)
+        path = os.path.join(directory, f"clip_{i:03d}.wav")
+        torchaudio.save(path, wave[None], 44100)
+        clips.append((path, "patient describes a cough and mild fever"))
+    return clips
+
+
+def run_synthetic(batch_size, **generate_kwargs):
+    """Time the pipeline with a tiny random Whisper on generated tones."""
+    from benchmarks.tiny_lm import load_tiny_asr
+
+    with tempfile.TemporaryDirectory() as directory:
+        clips = synthetic_clips(directory)
+        processor, model = load_tiny_asr()
+        generate_kwargs.setdefault("max_new_tokens", 16)
+        rtf, _ = evaluate(processor, model, clips, batch_size, **generate_kwargs)
+        audio_s = sum(duration(path) for path, _ in clips)
+    print(f"tiny stand-in: {len(clips)} clips, {audio_s:.0f}s of audio, "
+          f"RTF {rtf:.3f} ({rtf * WINDOW_S:.2f}s per 30s window)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speech models: real-time factor and WER")
+    parser.add_argument("--models", nargs="+", default=list(ASR_MODELS), choices=list(ASR_MODELS))
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="30 s windows per generate call")
+    parser.add_argument("--budget", type=float, default=LATENCY_BUDGET_S,
+                        help="Seconds allowed per 30 s window when showing the automatic choice")
+    parser.add_argument("--save", action="store_true", help="Write results to the profiles used by auto selection")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Tiny random Whisper on generated tones (offline pipeline check; no accuracy)")
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    args = parser.parse_args()
+
+    generate_kwargs = {"max_new_tokens": args.max_new_tokens} if args.max_new_tokens else {}
+
+    if not args.synthetic and not os.path.exists(args.manifest):
+        print(f"No reference manifest at {args.manifest} (see the module docstring for the format); "
+              f"running the synthetic pipeline check instead, nothing is saved")
+        args.synthetic = True
+
+    if args.synthetic:
+        run_synthetic(args.batch_size, **generate_kwargs)
+        return
+
+    clips = load_manifest(args.manifest)
+    audio_s = sum(duration(path) for path, _ in clips)
+    print(f"{len(clips)} clips, {audio_s:.0f}s of audio, {torch.get_num_threads()} threads")
+
+    results = {}
+    print(f"{'model':<16} {'load':>7} {'RTF':>7} {'s/30s':>7} {'WER':>7}")
+    for name in args.models:
+        started = time.perf_counter()
+        try:
+            processor, model = load_asr_model(name)
+        except Exception as e:
+            print(f"{name:<16} skipped: could not load {ASR_MODELS[name]['model_id']} ({e})", flush=True)
+            continue
+        load_s = time.perf_counter() - started
+        rtf, wer = evaluate(processor, model, clips, args.batch_size, **generate_kwargs)
+        del processor, model
+        results[name] = {"rtf": round(rtf, 4), "wer": round(wer, 2), "clips": len(clips),
+                         "audio_s": round(audio_s, 1), "threads": torch.get_num_threads(),
+                         "measured": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        print(f"{name:<16} {load_s:>6.1f}s {rtf:>7.3f} {rtf * WINDOW_S:>6.2f}s {wer:>6.1f}%", flush=True)
+
+    if not results:
+        print("No model could be loaded; nothing to report")
+        return
+    if args.save:
+        profiles = save_profiles(results)
+        print(f"Saved {len(results)} profiles; auto choice for a {args.budget:g}s budget: "
+              f"{select_asr_model(args.budget, profiles)}")
+    else:
+        print(f"Auto choice for a {args.budget:g}s budget: {select_asr_model(args.budget, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/image_preprocess_bench.py
+
+"""
+X-ray preprocessing: full-resolution decode vs utils/image_preprocess.py.
+
+For synthetic 3000x3000 chest-film-sized images (8-bit PNG, 16-bit PNG,
+JPEG) times, per image:
+
+- full: Image.open(...).convert("RGB") and the processor on the full-size
+  image (what the X-ray page did on every rerun)
+- prepared: draft/reduce decode to the processor's input size, then the
+  processor, with an empty cache
+- cached: pixel_inputs() again for the same bytes
+- thumbnail: the display rendition
+
+and the size of the decoded RGB image each path holds in memory.
+
+    python -m benchmarks.image_preprocess_bench --size 3000 --input-size 518
+"""
+
+import argparse
+import io
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from transformers import ViTImageProcessor
+
+from utils.image_preprocess import clear_memory_cache, pixel_inputs, prepare_image, thumbnail
+
+
+def synthetic_images(size, seed=0):
+    rng = np.random.default_rng(seed)
+    # Smooth gradient plus noise, so PNG/JPEG compression behaves like a real film
+    gradient = np.add.outer(np.linspace(0, 1, size), np.linspace(0, 1, size)) / 2
+    base = gradient + rng.normal(0, 0.05, (size, size))
+    images = {}
+    for name, mode, dtype, scale, fmt in (
+        ("png8", "L", np.uint8, 255, "PNG"),
+        ("png16", "I;16", np.uint16, 65535, "PNG"),
+        ("jpeg", "L", np.uint8, 255, "JPEG"),
+    ):
+        buffer = io.BytesIO()
+        Image.fromarray((np.clip(base, 0, 1) * scale).astype(dtype), mode=mode).save(buffer, format=fmt)
+        images[name] = buffer.getvalue()
+    return images
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark X-ray image preprocessing")
+    parser.add_argument("--size", type=int, default=3000)
+    parser.add_argument("--input-size", type=int, default=518, help="Processor input resolution")
+    args = parser.parse_args()
+
+    processor = ViTImageProcessor(size={"height": args.input_size, "width": args.input_size})
+    print(f"{'image':<6} {'bytes':>8} {'full':>8} {'prepared':>9} {'cached':>8} {'thumb':>7} "
+          f"{'full RGB':>9} {'prep RGB':>9}")
+    for name, data in synthetic_images(args.size).items():
+        def full():
+            image = Image.open(io.BytesIO(data)).convert("RGB")
+            processor(images=image, return_tensors="pt")
+            return image
+
+        full_seconds, full_image = timed(full)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            def cold():
+                clear_memory_cache()
+                with tempfile.TemporaryDirectory() as empty:
+                    return pixel_inputs(data, processor, cache_dir=empty)
+
+            prepared_seconds, _ = timed(cold)
+            pixel_inputs(data, processor, cache_dir=cache_dir)
+            cached_seconds, _ = timed(lambda: pixel_inputs(data, processor, cache_dir=cache_dir))
+        clear_memory_cache()
+        thumb_seconds, _ = timed(lambda: thumbnail(data), repeat=1)
+        prepared = prepare_image(data, args.input_size)
+
+        def megabytes(image):
+            return image.width * image.height * 3 / 1024 ** 2
+
+        print(f"{name:<6} {len(data) / 1024:>6.0f}KB {full_seconds * 1000:>6.0f}ms {prepared_seconds * 1000:>7.0f}ms "
+              f"{cached_seconds * 1000:>6.2f}ms {thumb_seconds * 1000:>5.0f}ms "
+              f"{megabytes(full_image):>7.1f}MB {megabytes(prepared):>7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
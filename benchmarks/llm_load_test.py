@@ -0,0 +1,136 @@
+# benchmarks/llm_load_test.py
+
+"""
+Concurrent-user load test for text generation, fully offline on CPU.
+
+Compares the old one-thread-per-request ``model.generate`` path with the
+static batching scheduler and the continuous batching engine in
+utils/llm_engine.py, using the tiny local model from benchmarks/tiny_lm.py,
+and reports aggregate tokens/second and latency.
+
+    python -m benchmarks.llm_load_test --users 8 16 32 --max-new-tokens 64
+
+With ``--mixed`` every other user asks for a long generation (treatment
+plan sized) and the rest for short ones (disease prediction sized); the
+"short TTFT" column shows how long the short requests wait for their first
+token while long ones are in flight.
+
+    python -m benchmarks.llm_load_test --mixed --modes batched continuous
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from transformers import TextIteratorStreamer
+
+from benchmarks.tiny_lm import load_tiny_lm
+from utils.llm_engine import BatchingScheduler, ContinuousBatchingEngine
+
+PROMPTS = [
+    "You are an empathetic healthcare assistant.\nQuestion: What are the symptoms of diabetes?\n\nAnswer:",
+    "You are a trusted medical assistant.\nPatient symptoms: fever, cough\nDiagnosis: flu\n\nTreatment Plan:",
+    "Based on the patient's symptoms listed below, predict the most likely disease.\n\nSymptoms: headache\n\n",
+    "You are an empathetic healthcare assistant.\nQuestion: How can I lower my blood pressure?\n\nAnswer:",
+]
+
+
+def thread_per_request(tokenizer, model):
+    """The original generate_streaming_text strategy, for comparison."""
+    def generate(prompt, max_new_tokens, temperature):
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        inputs = tokenizer(prompt, return_tensors="pt")
+        kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens,
+                  "temperature": temperature, "do_sample": True, "pad_token_id": tokenizer.eos_token_id}
+        threading.Thread(target=model.generate, kwargs=kwargs).start()
+        yield from streamer
+    return generate
+
+
+def batched(engine_class, tokenizer, model, max_batch_size, max_wait_ms):
+    scheduler = engine_class(tokenizer, model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def generate(prompt, max_new_tokens, temperature):
+        yield from scheduler.submit(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+    generate.scheduler = scheduler
+    return generate
+
+
+def run_load(generate, tokenizer, users, requests_per_user, max_new_tokens, long_tokens=None):
+    latencies, ttfts, short_ttfts, tokens = [], [], [], []
+    lock = threading.Lock()
+
+    def user(user_id):
+        is_long = long_tokens is not None and user_id % 2 == 0
+        for i in range(requests_per_user):
+            prompt = PROMPTS[(user_id + i) % len(PROMPTS)]
+            if is_long:
+                max_new_tokens_i = long_tokens
+            else:
+                # Short users arrive a little after the long generations started
+                time.sleep(0.05 if long_tokens is not None else 0)
+                max_new_tokens_i = max_new_tokens
+            start = time.perf_counter()
+            first = None
+            text = []
+            for chunk in generate(prompt, max_new_tokens_i, 0.7):
+                if first is None:
+                    first = time.perf_counter()
+                text.append(chunk)
+            end = time.perf_counter()
+            with lock:
+                latencies.append(end - start)
+                ttfts.append((first or end) - start)
+                if not is_long:
+                    short_ttfts.append((first or end) - start)
+                tokens.append(len(tokenizer("".join(text)).input_ids))
+
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "tokens_per_s": sum(tokens) / elapsed,
+        "p50_latency": statistics.median(latencies),
+        "p50_ttft": statistics.median(ttfts),
+        "p50_short_ttft": statistics.median(short_ttfts) if short_ttfts else 0.0,
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test batched vs per-request generation")
+    parser.add_argument("--users", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--mixed", action="store_true", help="Half the users request --long-tokens instead")
+    parser.add_argument("--long-tokens", type=int, default=300)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--modes", nargs="+", default=["thread", "batched", "continuous"],
+                        choices=["thread", "batched", "continuous"])
+    args = parser.parse_args()
+
+    tokenizer, model = load_tiny_lm()
+    long_tokens = args.long_tokens if args.mixed else None
+    print(f"{'mode':<10} {'users':>5} {'tok/s':>9} {'p50 latency':>12} {'p50 TTFT':>9} {'short TTFT':>11}")
+    for users in args.users:
+        for mode in args.modes:
+            if mode == "thread":
+                generate = thread_per_request(tokenizer, model)
+            else:
+                engine_class = BatchingScheduler if mode == "batched" else ContinuousBatchingEngine
+                generate = batched(engine_class, tokenizer, model, args.max_batch_size, args.max_wait_ms)
+            result = run_load(generate, tokenizer, users, args.requests_per_user, args.max_new_tokens, long_tokens)
+            if mode != "thread":
+                generate.scheduler.close()
+            print(f"{mode:<10} {users:>5} {result['tokens_per_s']:>9.1f} "
+                  f"{result['p50_latency']:>11.2f}s {result['p50_ttft']:>8.2f}s {result['p50_short_ttft']:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
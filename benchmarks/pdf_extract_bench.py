@@ -0,0 +1,87 @@
+# benchmarks/pdf_extract_bench.py
+
+"""
+PDF text extraction: the old serial PyPDF2 join vs utils/pdf_extract.py.
+
+Builds a synthetic multi-page medical report with fpdf and times:
+
+- serial: PdfReader over every page, joined into one string (what
+  read_uploaded_file used to do on every rerun)
+- cold: iter_pdf_pages with an empty cache (process pool above the
+  page threshold), plus the time until the first page is available
+- warm: iter_pdf_pages again, served from the per-page cache
+
+    python -m benchmarks.pdf_extract_bench --pages 300 --workers 4
+"""
+
+import argparse
+import io
+import random
+import tempfile
+import time
+
+import PyPDF2
+from fpdf import FPDF
+
+from utils.pdf_extract import PDF_PARALLEL_PAGES, iter_pdf_pages
+
+WORDS = ("patient reports fever cough fatigue headache blood pressure pulse temperature prescribed "
+         "paracetamol ibuprofen follow-up examination normal abnormal chest x-ray clear mild moderate "
+         "severe history allergy diabetes hypertension medication dosage daily twice review").split()
+
+
+def build_pdf(pages, lines_per_page=40, seed=0):
+    rng = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=10)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.cell(0, 6, f"Medical report - page {page + 1}", ln=1)
+        for _ in range(lines_per_page):
+            pdf.cell(0, 6, " ".join(rng.choice(WORDS) for _ in range(14)), ln=1)
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def serial(data):
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() or "" for page in reader.pages).strip()
+
+
+def timed_pages(data, **kwargs):
+    """(seconds to first page, seconds to all pages, stats)"""
+    stats = {}
+    started = time.perf_counter()
+    first = None
+    for _ in iter_pdf_pages(data, stats=stats, **kwargs):
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cached/parallel PDF extraction")
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 300])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'pages':>5} {'size':>8} {'serial':>8} {'cold':>8} {'first':>8} {'warm':>8}")
+    for pages in args.pages:
+        data = build_pdf(pages)
+        serial_seconds = time.perf_counter()
+        serial(data)
+        serial_seconds = time.perf_counter() - serial_seconds
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            if args.workers > 1:
+                # Start the pool outside the measurement, as a running app would have
+                list(iter_pdf_pages(build_pdf(PDF_PARALLEL_PAGES, 2), workers=args.workers, cache_dir=None))
+            first, cold, stats = timed_pages(data, workers=args.workers, cache_dir=cache_dir)
+            _, warm, warm_stats = timed_pages(data, workers=args.workers, cache_dir=cache_dir)
+        assert warm_stats["cached"] == pages and stats["extracted"] == pages
+
+        print(f"{pages:>5} {len(data) / 1024:>6.0f}KB {serial_seconds:>7.2f}s {cold:>7.2f}s "
+              f"{first:>7.3f}s {warm:>7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
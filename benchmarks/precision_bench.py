@@ -0,0 +1,83 @@
+# benchmarks/precision_bench.py
+
+"""
+float32 vs bfloat16 vs int8 dynamic quantization for CPU inference, offline.
+
+Builds the same tiny phi-architecture model (benchmarks/tiny_lm.py) once per
+precision mode from utils/precision.py and reports weight memory, greedy
+decoding tokens/second and how closely each mode's output matches float32
+on a fixed prompt set.
+
+    python -m benchmarks.precision_bench --layers 6 --embd 512 --max-new-tokens 32
+"""
+
+import argparse
+import time
+
+import torch
+
+from benchmarks.llm_load_test import PROMPTS
+from benchmarks.tiny_lm import build_model, build_tokenizer
+from utils.model_registry import resident_bytes
+from utils.precision import apply_precision, load_dtype
+
+
+def load(tokenizer, precision, **kwargs):
+    model = build_model(tokenizer, arch="phi", **kwargs).to(load_dtype(precision))
+    return apply_precision(model, precision)
+
+
+@torch.no_grad()
+def run(tokenizer, model, max_new_tokens):
+    outputs, tokens = [], 0
+    started = time.perf_counter()
+    for prompt in PROMPTS:
+        inputs = tokenizer(prompt, return_tensors="pt")
+        generated = model.generate(
+            **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.eos_token_id
+        )[0, inputs.input_ids.shape[1]:].tolist()
+        outputs.append(generated)
+        tokens += len(generated)
+    return outputs, tokens / (time.perf_counter() - started)
+
+
+def agreement(reference, outputs):
+    """(share of prompts with identical output, mean share of tokens matching before the first divergence)"""
+    exact, prefix = 0, 0.0
+    for ref, out in zip(reference, outputs):
+        exact += ref == out
+        same = next((i for i, (a, b) in enumerate(zip(ref, out)) if a != b), min(len(ref), len(out)))
+        prefix += same / max(len(ref), 1)
+    return exact / len(reference), prefix / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare precision modes on a tiny local model")
+    parser.add_argument("--modes", nargs="+", default=["float32", "bfloat16", "int8"])
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--embd", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 = torch default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tokenizer = build_tokenizer()
+    config = dict(n_layer=args.layers, n_embd=args.embd, n_head=args.heads)
+
+    reference = None
+    print(f"{'mode':<9} {'weights':>9} {'tok/s':>8} {'exact':>6} {'prefix':>7}")
+    for precision in ["float32"] + [mode for mode in args.modes if mode != "float32"]:
+        model = load(tokenizer, precision, **config)
+        run(tokenizer, model, 4)  # warm-up
+        outputs, tokens_per_s = run(tokenizer, model, args.max_new_tokens)
+        if reference is None:
+            reference = outputs
+        exact, prefix = agreement(reference, outputs)
+        print(f"{precision:<9} {resident_bytes(model) / 1024 ** 2:>7.1f}MB {tokens_per_s:>8.1f} "
+              f"{exact:>6.0%} {prefix:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
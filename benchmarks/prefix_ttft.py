@@ -0,0 +1,66 @@
+# benchmarks/prefix_ttft.py
+
+"""
+Time-to-first-token with and without prompt-prefix KV reuse, offline on CPU.
+
+Short questions are sent one at a time behind a fixed instruction preamble,
+first with the preamble unregistered (full prefill every time), then with it
+registered so the continuous batching engine starts from its cached KV.
+
+    python -m benchmarks.prefix_ttft --requests 20 --preamble-repeat 3
+"""
+
+import argparse
+import statistics
+
+from benchmarks.tiny_lm import load_tiny_lm
+from utils.llm_engine import ContinuousBatchingEngine
+
+PREAMBLE = (
+    "You are an empathetic healthcare assistant.\n"
+    "Answer the following question clearly and professionally. Be concise, avoid jargon, "
+    "mention when the patient should see a doctor, and never give a definitive diagnosis.\n\n"
+)
+
+QUESTIONS = [
+    "Question: What are the symptoms of diabetes?\n\nAnswer:",
+    "Question: Is a fever of 38C dangerous?\n\nAnswer:",
+    "Question: How can I lower my blood pressure?\n\nAnswer:",
+    "Question: When should I worry about a headache?\n\nAnswer:",
+]
+
+
+def measure(engine, preamble, requests, max_new_tokens):
+    ttfts = []
+    for i in range(requests):
+        request = engine.submit(preamble + QUESTIONS[i % len(QUESTIONS)], max_new_tokens=max_new_tokens, do_sample=False)
+        for _ in request:
+            pass
+        ttfts.append(request.first_token_at - request.submitted_at)
+    return ttfts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFT with and without prefix KV reuse")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=8)
+    parser.add_argument("--preamble-repeat", type=int, default=3, help="Lengthen the preamble this many times")
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--embd", type=int, default=256)
+    args = parser.parse_args()
+
+    tokenizer, model = load_tiny_lm(n_layer=args.layers, n_embd=args.embd)
+    preamble = PREAMBLE * args.preamble_repeat
+    print(f"preamble: {len(tokenizer(preamble).input_ids)} tokens")
+
+    for label, prefixes in (("full prefill", []), ("cached prefix", [preamble])):
+        engine = ContinuousBatchingEngine(tokenizer, model, max_batch_size=1, max_wait_ms=0, prefixes=prefixes)
+        measure(engine, preamble, 2, args.max_new_tokens)  # warm-up (and prefix KV build)
+        ttfts = measure(engine, preamble, args.requests, args.max_new_tokens)
+        engine.close()
+        print(f"{label:<14} p50 TTFT {statistics.median(ttfts) * 1000:7.1f} ms   "
+              f"mean {statistics.mean(ttfts) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
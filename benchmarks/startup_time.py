@@ -0,0 +1,115 @@
+# benchmarks/startup_time.py
+
+"""
+Cold-start profile of the dashboard.
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+
+- per-module import time, parsed from ``python -X importtime``, with the
+  heaviest third-party packages each module drags in
+- time to first render of app.py (Streamlit's AppTest runs the script
+  headless), next to a bare ``import streamlit`` baseline
+
+    python -m benchmarks.startup_time
+    python -m benchmarks.startup_time --modules models.patient_chat utils.health_llm --top 5
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "streamlit",
+    "models.profile_management",
+    "models.treatment_plan",
+    "models.disease_prediction",
+    "models.health_analytics",
+    "models.patient_chat",
+    "models.xray_analysis",
+    "models.document_summary",
+    "models.voice_query",
+]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+RENDER_SCRIPT = """
+import time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({path!r}, default_timeout={timeout})
+at.run()
+if at.exception:
+    raise SystemExit(str(at.exception[0].value))
+print(time.perf_counter() - started)
+"""
+
+
+def _python(*args, timeout=600):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True, timeout=timeout
+    )
+
+
+def import_profile(module):
+    """
+    Return (seconds to import ``module``, {package: cumulative seconds}) for
+    the other top-level packages it pulls in, e.g. torch or transformers.
+    """
+    result = _python("-X", "importtime", "-c", f"import {module}")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total, packages = 0, {}
+    own_root = module.split(".")[0]
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(2)), match.group(3)
+        if name == module:
+            total = cumulative
+        root = name.split(".")[0]
+        if root != own_root and not root.startswith("_"):
+            # A package's outermost import line carries its full cumulative time
+            packages[root] = max(packages.get(root, 0), cumulative)
+    return total / 1e6, {name: us / 1e6 for name, us in packages.items()}
+
+
+def time_to_first_render(script, timeout):
+    result = _python("-c", RENDER_SCRIPT.format(path=script, timeout=timeout), timeout=timeout + 60)
+    if result.returncode != 0:
+        raise RuntimeError((result.stderr or result.stdout).strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure dashboard import and first-render time")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=3, help="Heaviest packages to list per module")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    print(f"{'module':<28} {'import':>8}   heaviest packages")
+    for module in args.modules:
+        try:
+            total, packages = import_profile(module)
+        except RuntimeError as e:
+            print(f"{module:<28} {'failed':>8}   {e}")
+            continue
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{module:<28} {total:>7.2f}s   " + ", ".join(f"{name} {secs:.2f}s" for name, secs in heaviest))
+
+    print()
+    baseline, _ = import_profile("streamlit")
+    render = time_to_first_render(args.app, args.timeout)
+    print(f"import streamlit:           {baseline:.2f}s")
+    print(f"{args.app} first render:     {render:.2f}s  (includes importing streamlit's test harness)")
+
+
+if __name__ == "__main__":
+    main()
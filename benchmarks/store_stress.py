@@ -0,0 +1,128 @@
+# benchmarks/store_stress.py
+
+"""
+Multi-process stress test for the patient store.
+
+N worker processes append visits (spread over a pool of patients that all
+workers share) and perform versioned read-modify-write updates, while the
+parent optionally compacts the JSON journal. Afterwards every visit is
+checked for, so lost or duplicated writes are reported.
+
+    python -m benchmarks.store_stress --backend json --workers 8 --visits 100
+    python -m benchmarks.store_stress --backend sqlite --workers 8 --visits 100
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from utils.storage import ConcurrentUpdateError, JSONPatientStore, SQLitePatientStore
+
+
+def _make_store(backend, path):
+    if backend == "sqlite":
+        return SQLitePatientStore(path)
+    return JSONPatientStore(path)
+
+
+def _worker(backend, path, worker_id, visits, patients, result_queue):
+    store = _make_store(backend, path)
+    conflicts = 0
+    start = time.perf_counter()
+    for i in range(visits):
+        patient_id = f"patient-{(worker_id + i) % patients}"
+        store.append_visit(patient_id, {"worker": worker_id, "seq": i, "bp": "120/80", "pulse": 72})
+
+        # Every tenth write is a versioned update of a shared counter
+        if i % 10 == 0:
+            while True:
+                record = store.get_patient("shared")
+                if not record:
+                    record = {"metadata": {"updates": 0}, "visits": [], "version": 0}
+                record["metadata"]["updates"] = record["metadata"].get("updates", 0) + 1
+                try:
+                    store.put_patient("shared", record)
+                    break
+                except ConcurrentUpdateError:
+                    conflicts += 1
+                    time.sleep(random.uniform(0, 0.002 * min(conflicts, 10)))
+    result_queue.put((worker_id, time.perf_counter() - start, conflicts))
+
+
+def run(backend, workers, visits, patients, compact_every):
+    workdir = tempfile.mkdtemp(prefix="healthai-stress-")
+    path = os.path.join(workdir, "patients.db" if backend == "sqlite" else "patients.json")
+    _make_store(backend, path)
+
+    result_queue = mp.Queue()
+    procs = [
+        mp.Process(target=_worker, args=(backend, path, w, visits, patients, result_queue))
+        for w in range(workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    compactions = 0
+    if backend == "json" and compact_every:
+        store = JSONPatientStore(path)
+        while any(p.is_alive() for p in procs):
+            time.sleep(compact_every)
+            store.compact()
+            compactions += 1
+
+    results = [result_queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    db = _make_store(backend, path).load_all()
+    seen = {}
+    for patient_id, record in db.items():
+        if patient_id == "shared":
+            continue
+        for visit in record["visits"]:
+            key = (visit["worker"], visit["seq"])
+            seen[key] = seen.get(key, 0) + 1
+
+    expected = {(w, i) for w in range(workers) for i in range(visits)}
+    lost = len(expected - set(seen))
+    duplicated = sum(1 for count in seen.values() if count > 1)
+    shared_updates = db.get("shared", {}).get("metadata", {}).get("updates", 0)
+    expected_updates = workers * len(range(0, visits, 10))
+    conflicts = sum(r[2] for r in results)
+    total = workers * visits
+
+    print(f"backend={backend} workers={workers} visits/worker={visits} patients={patients}")
+    print(f"  elapsed:          {elapsed:.2f}s ({total / elapsed:.0f} visits/s)")
+    print(f"  lost visits:      {lost}")
+    print(f"  duplicate visits: {duplicated}")
+    print(f"  versioned updates: {shared_updates}/{expected_updates} ({conflicts} conflict retries)")
+    if backend == "json":
+        print(f"  compactions:      {compactions}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return lost == 0 and duplicated == 0 and shared_updates == expected_updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress-test concurrent writes to the patient store")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--visits", type=int, default=100, help="visits appended per worker")
+    parser.add_argument("--patients", type=int, default=16)
+    parser.add_argument("--compact-every", type=float, default=0.2,
+                        help="seconds between journal compactions (json only, 0 to disable)")
+    args = parser.parse_args()
+
+    ok = run(args.backend, args.workers, args.visits, args.patients, args.compact_every)
+    print("OK" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
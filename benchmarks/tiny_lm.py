@@ -0,0 +1,152 @@
+# benchmarks/tiny_lm.py
+
+"""
+A tiny, randomly initialised causal LM with a byte-level tokenizer, built
+entirely in memory so load tests and benchmarks run offline on CPU, and a
+tiny image-to-text model standing in for MAIRA-2 and a tiny Whisper standing
+in for the speech recognition models.
+"""
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import (
+    GPT2Config,
+    GPT2LMHeadModel,
+    PhiConfig,
+    PhiForCausalLM,
+    PreTrainedTokenizerFast,
+    TrOCRProcessor,
+    ViTConfig,
+    ViTImageProcessor,
+    VisionEncoderDecoderConfig,
+    VisionEncoderDecoderModel,
+    WhisperConfig,
+    WhisperFeatureExtractor,
+    WhisperForConditionalGeneration,
+)
+
+EOS_TOKEN = "<|endoftext|>"
+
+
+def build_tokenizer():
+    alphabet = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {ch: i for i, ch in enumerate(sorted(alphabet))}
+    vocab[EOS_TOKEN] = len(vocab)
+
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+
+    # Like phi-1_5's tokenizer, return no token_type_ids (GPT-2 would embed them)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        eos_token=EOS_TOKEN,
+        pad_token=EOS_TOKEN,
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    return tokenizer
+
+
+def build_model(tokenizer, n_layer=4, n_embd=128, n_head=4, n_positions=1024, seed=0, arch="gpt2"):
+    """
+    arch="gpt2" is the smallest option; arch="phi" matches phi-1_5's
+    architecture (nn.Linear layers, rotary positions), e.g. for int8
+    dynamic quantization, which only touches nn.Linear.
+    """
+    torch.manual_seed(seed)
+    if arch == "phi":
+        config = PhiConfig(
+            vocab_size=len(tokenizer),
+            hidden_size=n_embd,
+            intermediate_size=4 * n_embd,
+            num_hidden_layers=n_layer,
+            num_attention_heads=n_head,
+            max_position_embeddings=n_positions,
+            bos_token_id=tokenizer.eos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+        model = PhiForCausalLM(config)
+        model.eval()
+        return model
+
+    config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=n_positions,
+        n_embd=n_embd,
+        n_layer=n_layer,
+        n_head=n_head,
+        bos_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    model = GPT2LMHeadModel(config)
+    model.eval()
+    return model
+
+
+def load_tiny_lm(**kwargs):
+    """Return (tokenizer, model), mirroring utils.health_llm.load_model()."""
+    tokenizer = build_tokenizer()
+    return tokenizer, build_model(tokenizer, **kwargs)
+
+
+def load_tiny_vlm(image_size=64, n_layer=2, n_embd=64, n_head=2, seed=0):
+    """
+    Return (processor, model) like models.xray_analysis.load_xray_model(): a
+    ViT encoder + GPT-2 decoder whose processor takes ``images=`` and has
+    batch_decode.
+    """
+    torch.manual_seed(seed)
+    tokenizer = build_tokenizer()
+    encoder = ViTConfig(
+        image_size=image_size, patch_size=16, hidden_size=n_embd, num_hidden_layers=n_layer,
+        num_attention_heads=n_head, intermediate_size=4 * n_embd,
+    )
+    decoder = GPT2Config(
+        vocab_size=len(tokenizer), n_embd=n_embd, n_layer=n_layer, n_head=n_head,
+        add_cross_attention=True, is_decoder=True,
+    )
+    config = VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder)
+    config.decoder_start_token_id = config.pad_token_id = config.eos_token_id = tokenizer.eos_token_id
+    model = VisionEncoderDecoderModel(config)
+    model.eval()
+
+    image_processor = ViTImageProcessor(size={"height": image_size, "width": image_size})
+    return TrOCRProcessor(image_processor=image_processor, tokenizer=tokenizer), model
+
+
+class TinyASRProcessor:
+    """WhisperProcessor's interface (features in, batch_decode out) on the byte-level tokenizer."""
+
+    def __init__(self, feature_extractor, tokenizer):
+        self.feature_extractor = feature_extractor
+        self.tokenizer = tokenizer
+
+    def __call__(self, audio, sampling_rate=None, return_tensors=None):
+        return self.feature_extractor(audio, sampling_rate=sampling_rate, return_tensors=return_tensors)
+
+    def batch_decode(self, ids, skip_special_tokens=True):
+        # Ids past the byte vocabulary are the decoder start token and padding
+        ids = [[i for i in row.tolist() if i < len(self.tokenizer)] for row in ids]
+        return self.tokenizer.batch_decode(ids, skip_special_tokens=skip_special_tokens)
+
+
+def load_tiny_asr(n_layer=1, d_model=64, n_head=2, seed=0):
+    """
+    Return (processor, model) like models.voice_query.load_whisper_model():
+    a randomly initialised Whisper encoder-decoder taking 80-bin log-mel
+    features of 30 s windows.
+    """
+    torch.manual_seed(seed)
+    tokenizer = build_tokenizer()
+    eos = tokenizer.eos_token_id
+    config = WhisperConfig(
+        vocab_size=len(tokenizer) + 1, num_mel_bins=80, d_model=d_model,
+        encoder_layers=n_layer, decoder_layers=n_layer,
+        encoder_attention_heads=n_head, decoder_attention_heads=n_head,
+        encoder_ffn_dim=4 * d_model, decoder_ffn_dim=4 * d_model,
+        decoder_start_token_id=len(tokenizer), eos_token_id=eos, pad_token_id=eos,
+        bos_token_id=eos, suppress_tokens=[], begin_suppress_tokens=[],
+    )
+    model = WhisperForConditionalGeneration(config)
+    model.eval()
+    return TinyASRProcessor(WhisperFeatureExtractor(feature_size=80), tokenizer), model
@@ -0,0 +1,64 @@
+# benchmarks/xray_batch_bench.py
+
+"""
+Batch X-ray analysis throughput with a tiny local image-to-text model.
+
+Writes synthetic grayscale "films" to a temporary folder and runs
+utils/xray_batch.run_batch over them with the stand-in model from
+benchmarks/tiny_lm.py (MAIRA-2 itself is not needed), once per batch size,
+reporting images/minute. A final run over a finished job checks that
+resuming skips everything already reported.
+
+    python -m benchmarks.xray_batch_bench --images 64 --batch-sizes 1 8 --size 1024
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.tiny_lm import load_tiny_vlm
+from models.xray_analysis import analyze_xray_images
+from utils.xray_batch import iter_sources, run_batch
+
+
+def write_images(directory, count, size, seed=0):
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        pixels = rng.integers(0, 256, (size, size), dtype=np.uint8)
+        Image.fromarray(pixels, mode="L").save(os.path.join(directory, f"film_{i:04d}.png"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched X-ray analysis on a tiny local model")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--size", type=int, default=1024, help="Synthetic image width/height in pixels")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--workers", type=int, default=2, help="Image decoding processes")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    processor, model = load_tiny_vlm()
+
+    def analyze(images):
+        return analyze_xray_images(images, processor, model, max_new_tokens=args.max_new_tokens)
+
+    with tempfile.TemporaryDirectory() as root:
+        films = os.path.join(root, "films")
+        os.makedirs(films)
+        write_images(films, args.images, args.size)
+
+        print(f"{'batch':>5} {'images':>6} {'seconds':>8} {'images/min':>11}")
+        for batch_size in args.batch_sizes:
+            output = os.path.join(root, f"job_{batch_size}")
+            stats = run_batch(iter_sources([films]), output, analyze, batch_size, args.workers)
+            print(f"{batch_size:>5} {stats['analysed']:>6} {stats['seconds']:>8.2f} {stats['images_per_minute']:>11.1f}")
+
+        resumed = run_batch(iter_sources([films]), output, analyze, args.batch_sizes[-1], args.workers)
+        print(f"resume: {resumed['skipped']} skipped, {resumed['analysed']} re-analysed")
+
+
+if __name__ == "__main__":
+    main()
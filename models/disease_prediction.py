@@ -40,26 +40,296 @@
 #         else:
 #             st.warning("⚠️ Please enter some symptoms to get a prediction.")
 
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+import numpy as np
 import streamlit as st
-from utils.health_llm import generate_streaming_text
-from utils.helper import log_event
+from utils.health_llm import generate_short_answer, generate_short_answers, register_prompt_prefix
+from utils.helper import add_visit_listener, log_event
+from utils.storage import get_store
+
+# Shared by every prediction prompt, so its KV cache is reused
+PREDICTION_PREAMBLE = register_prompt_prefix(
+    "You are an intelligent and reliable healthcare assistant.\n"
+    "Based on the patient's symptoms listed below, predict the most likely disease or condition.\n\n"
+)
+
+# With HEALTHAI_CONSTRAIN_PREDICTIONS=1 the model can only answer with a name
+# from CONDITIONS_PATH (one per line)
+CONSTRAIN_PREDICTIONS = os.getenv("HEALTHAI_CONSTRAIN_PREDICTIONS", "0") == "1"
+CONDITIONS_PATH = os.getenv("HEALTHAI_CONDITIONS_PATH", "data/conditions.txt")
+
+_conditions = None
+
+def load_conditions(path=CONDITIONS_PATH):
+    """Known condition names, skipping blank lines and # comments."""
+    global _conditions
+    if _conditions is None:
+        with open(path, encoding="utf-8") as f:
+            _conditions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return _conditions
+
+def normalize_symptoms(symptoms):
+    """Case- and whitespace-insensitive form used to deduplicate symptom strings."""
+    return " ".join(str(symptoms or "").lower().split())
+
+# First tier: nearest past visits by TF-IDF similarity of their symptoms. An
+# answer is returned without the LLM when the neighbours' similarity-weighted
+# vote for one diagnosis reaches PRESCREEN_THRESHOLD (0 disables the tier).
+PRESCREEN_THRESHOLD = float(os.getenv("HEALTHAI_PRESCREEN_THRESHOLD", 0.8))
+PRESCREEN_NEIGHBOURS = int(os.getenv("HEALTHAI_PRESCREEN_NEIGHBOURS", 5))
+
+# Diagnoses that say nothing about the condition
+_UNINFORMATIVE = {"", "none", "n/a", "na", "unknown", "-", "nil"}
+
+def _terms(text):
+    return re.findall(r"[a-z0-9]+", normalize_symptoms(text))
+
+
+class SymptomIndex:
+    """
+    Inverted index of past visits' symptom terms, labelled with their
+    diagnosis, scored by TF-IDF cosine similarity. Only the postings of a
+    query's terms are touched, and visits can be added one at a time.
+    Visits may carry a group (the patient id) that queries can leave out.
+    """
+
+    def __init__(self, examples=()):
+        self.labels = []
+        self._groups = {}  # group -> code
+        self._doc_groups = array("i")  # doc id -> group code (-1: none)
+        self.vocabulary = {}
+        self._postings = []  # term id -> (doc ids, counts)
+        self._arrays = {}  # term id -> the same postings as numpy arrays, until the term gets a new doc
+        # Every (doc, term, count) entry, for the document norms
+        self._entry_docs = array("i")
+        self._entry_terms = array("i")
+        self._entry_counts = array("f")
+        self._weights = None  # (idf, document norms), recomputed after additions
+        self.add_many(examples)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, symptoms, diagnosis, group=None):
+        """Index one visit; returns False if it has no usable symptoms or diagnosis."""
+        terms = Counter(_terms(symptoms))
+        diagnosis = str(diagnosis or "").strip()
+        if not terms or diagnosis.lower() in _UNINFORMATIVE:
+            return False
+        doc = len(self.labels)
+        self.labels.append(diagnosis)
+        self._doc_groups.append(-1 if group is None else self._groups.setdefault(group, len(self._groups)))
+        for term, count in terms.items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = self.vocabulary[term] = len(self._postings)
+                self._postings.append((array("i"), array("f")))
+            docs, counts = self._postings[term_id]
+            docs.append(doc)
+            counts.append(count)
+            self._arrays.pop(term_id, None)
+            self._entry_docs.append(doc)
+            self._entry_terms.append(term_id)
+            self._entry_counts.append(count)
+        self._weights = None
+        return True
+
+    def add_many(self, examples):
+        """Index (symptoms, diagnosis) or (symptoms, diagnosis, group) tuples."""
+        return sum(self.add(*example) for example in examples)
+
+    def _posting_arrays(self, term_id):
+        arrays = self._arrays.get(term_id)
+        if arrays is None:
+            docs, counts = self._postings[term_id]
+            # Copies: a numpy view would stop the array.array from growing
+            arrays = (np.array(docs, dtype=np.int32), np.array(counts, dtype=np.float32))
+            self._arrays[term_id] = arrays
+        return arrays
+
+    def _idf_and_norms(self):
+        # IDF depends on the number of documents, so norms are refreshed (in one
+        # vectorised pass over the entries) after any addition, at query time
+        if self._weights is None:
+            document_frequency = np.array([len(docs) for docs, _ in self._postings], dtype=np.float32)
+            idf = np.log((1 + len(self.labels)) / (1 + document_frequency)) + 1
+            terms = np.array(self._entry_terms, dtype=np.int32)
+            weights = np.array(self._entry_counts, dtype=np.float32) * idf[terms]
+            norms = np.sqrt(np.bincount(np.array(self._entry_docs, dtype=np.int32), weights=weights ** 2,
+                                        minlength=len(self.labels)))
+            self._weights = (idf, norms, np.array(self._doc_groups, dtype=np.int32))
+        return self._weights
+
+    def _similar(self, symptoms, idf, norms, doc_groups, exclude=None):
+        """
+        (doc ids, cosine similarities) of the visits sharing a term with
+        ``symptoms``, leaving out those of group ``exclude``.
+        """
+        query = {self.vocabulary[term]: count for term, count in Counter(_terms(symptoms)).items()
+                 if term in self.vocabulary}
+        if not query:
+            return None, None
+        query_norm = math.sqrt(sum((count * idf[term_id]) ** 2 for term_id, count in query.items()))
+        docs, weights = [], []
+        for term_id, count in query.items():
+            term_docs, term_counts = self._posting_arrays(term_id)
+            docs.append(term_docs)
+            weights.append(term_counts * (count * idf[term_id] ** 2))
+        docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        similarity = np.bincount(inverse, weights=np.concatenate(weights)) / (norms[docs] * query_norm)
+        if exclude in self._groups:
+            keep = doc_groups[docs] != self._groups[exclude]
+            docs, similarity = docs[keep], similarity[keep]
+        if not len(docs):
+            return None, None
+        return docs, similarity
+
+    def query(self, symptoms_list, k=PRESCREEN_NEIGHBOURS, exclude=None):
+        """
+        Return (diagnosis, confidence) per symptom string; confidence is in
+        [0, 1]. ``exclude`` lists a group per string whose visits are not
+        neighbours (leave-one-out scoring of indexed visits).
+        """
+        if not self.labels:
+            return [(None, 0.0)] * len(symptoms_list)
+        idf, norms, doc_groups = self._idf_and_norms()
+        results = []
+        for symptoms, group in zip(symptoms_list, exclude or [None] * len(symptoms_list)):
+            docs, similarity = self._similar(symptoms, idf, norms, doc_groups, group)
+            if docs is None:
+                results.append((None, 0.0))
+                continue
+            if len(docs) > k:
+                top = np.argpartition(-similarity, k - 1)[:k]
+                docs, similarity = docs[top], similarity[top]
+            votes = Counter()
+            for doc, score in zip(docs, similarity):
+                votes[self.labels[doc].lower()] += float(score)
+            label, weight = votes.most_common(1)[0]
+            if weight <= 0:
+                results.append((None, 0.0))
+                continue
+            # Agreement among the neighbours times how close the best one is
+            confidence = weight / sum(votes.values()) * float(similarity.max())
+            best = next(self.labels[doc] for doc in docs[np.argsort(-similarity)]
+                        if self.labels[doc].lower() == label)
+            results.append((best, confidence))
+        return results
+
+
+_index = None
+_index_token = None
+_index_lock = threading.Lock()
+
+def get_symptom_index():
+    """
+    Index over the stored visits. Visits recorded in this process are added
+    as they are written (_on_visit); any other change to the store (another
+    process, edited records) rebuilds it on the next query.
+    """
+    global _index, _index_token
+    store = get_store()
+    token = store.change_token()
+    with _index_lock:
+        if _index is None or token is None or token != _index_token:
+            _index = SymptomIndex(
+                (visit.get("symptoms") or "", str(visit.get("diagnosis") or ""), patient_id)
+                for patient_id, _, visit in store.iter_visits()
+            )
+            _index_token = token
+        return _index
+
+def _on_visit(patient_id, visit, tokens):
+    global _index_token
+    with _index_lock:
+        if _index is None:
+            return
+        if tokens is not None and _index_token is not None and tokens[0] == _index_token:
+            _index.add(visit.get("symptoms") or "", visit.get("diagnosis") or "", patient_id)
+            _index_token = tokens[1]
+        else:
+            _index_token = None  # something else changed too: rebuild on the next query
+
+add_visit_listener(_on_visit)
+
+
+_tier_stats = {"prescreen": {"calls": 0, "hits": 0, "seconds": 0.0}, "llm": {"calls": 0, "seconds": 0.0}}
+_tier_stats_lock = threading.Lock()
+
+def _record_tier(tier, calls, seconds, hits=0):
+    with _tier_stats_lock:
+        stats = _tier_stats[tier]
+        stats["calls"] += calls
+        stats["seconds"] += seconds
+        if tier == "prescreen":
+            stats["hits"] += hits
+
+def get_prediction_stats():
+    """Pre-screen hit rate and mean latency per tier, in milliseconds per prediction."""
+    with _tier_stats_lock:
+        prescreen, llm = dict(_tier_stats["prescreen"]), dict(_tier_stats["llm"])
+    return {
+        "prescreen_hit_rate": prescreen["hits"] / prescreen["calls"] if prescreen["calls"] else 0.0,
+        "prescreen_calls": prescreen["calls"],
+        "prescreen_ms": prescreen["seconds"] * 1000 / prescreen["calls"] if prescreen["calls"] else 0.0,
+        "llm_calls": llm["calls"],
+        "llm_ms": llm["seconds"] * 1000 / llm["calls"] if llm["calls"] else 0.0,
+    }
+
+def prescreen(symptoms_list, threshold=PRESCREEN_THRESHOLD, exclude=None):
+    """
+    First-tier answers: a diagnosis where the index is confident enough, else
+    None. ``exclude`` gives a patient id per string whose stored visits are
+    ignored, so a stored visit is never answered with its own diagnosis.
+    """
+    if threshold <= 0 or not symptoms_list:
+        return [None] * len(symptoms_list)
+    started = time.perf_counter()
+    try:
+        results = get_symptom_index().query(symptoms_list, exclude=exclude)
+    except Exception as e:
+        log_event("error", f"Symptom pre-screen failed: {e}")
+        results = [(None, 0.0)] * len(symptoms_list)
+    answers = [diagnosis if diagnosis and confidence >= threshold else None for diagnosis, confidence in results]
+    _record_tier("prescreen", len(symptoms_list), time.perf_counter() - started,
+                 hits=sum(answer is not None for answer in answers))
+    return answers
+
+
+def build_prediction_prompt(symptoms):
+    return (
+        PREDICTION_PREAMBLE +
+        f"Symptoms: {symptoms}\n\n"
+        "Please respond with only the disease name or diagnosis.\n\n"
+        "Diagnosis:"
+    )
 
 # Predict disease based on symptoms using LLM
 def predict_disease(symptoms: str) -> str:
     try:
-        prompt = (
-            "You are an intelligent and reliable healthcare assistant.\n"
-            "Based on the patient's symptoms listed below, predict the most likely disease or condition.\n\n"
-            f"Symptoms: {symptoms}\n\n"
-            "Please respond with only the disease name or diagnosis."
-        )
-
-        response = ""
-        for chunk in generate_streaming_text(prompt, max_new_tokens=50, temperature=0.7):
-            response += chunk
+        started = time.perf_counter()
+        prediction, tier = prescreen([symptoms])[0], "prescreen"
+        if prediction is None:
+            # Greedy, stops at the end of the first line (cached per symptom text)
+            choices = load_conditions() if CONSTRAIN_PREDICTIONS else None
+            llm_started = time.perf_counter()
+            prediction, tier = generate_short_answer(build_prediction_prompt(symptoms), choices=choices,
+                                                     max_new_tokens=16), "llm"
+            _record_tier("llm", 1, time.perf_counter() - llm_started)
+        if not prediction:
+            return "⚠️ Unable to predict disease at the moment."
 
-        prediction = response.strip().split("\n")[0]
-        log_event("disease_prediction", f"Symptoms: {symptoms} => Prediction: {prediction}")
+        log_event(
+            "disease_prediction",
+            f"Symptoms: {symptoms} => Prediction: {prediction} ({tier})",
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
         return prediction
 
     except Exception as e:
@@ -67,6 +337,62 @@ def predict_disease(symptoms: str) -> str:
         return "⚠️ Unable to predict disease at the moment."
 
 
+def predict_diseases(symptoms_list, batch_size=32, engine=None, cache=True, stats=None, exclude=None):
+    """
+    Predict a diagnosis for every symptom string, in order ("" where no
+    prediction could be made). Identical strings (ignoring case and spacing)
+    are predicted once; those the pre-screen can't answer go to the LLM, up
+    to ``batch_size`` prompts decoded together.
+    ``engine`` overrides the shared scheduler, e.g. a ContinuousBatchingEngine
+    over a small local model; its answers are not cached.
+    ``exclude`` gives the patient id of each string when predicting stored
+    visits; the pre-screen then skips that patient's own visits.
+    """
+    stats = stats if stats is not None else {}
+    started = time.perf_counter()
+
+    keys = [(normalize_symptoms(symptoms), group)
+            for symptoms, group in zip(symptoms_list, exclude or [None] * len(symptoms_list))]
+    unique = {}
+    for key, symptoms in zip(keys, symptoms_list):
+        if key[0] and key not in unique:
+            unique[key] = str(symptoms).strip()
+
+    predictions = dict(zip(unique, prescreen(list(unique.values()), exclude=[group for _, group in unique])))
+    prescreened = sum(1 for answer in predictions.values() if answer is not None)
+    # The LLM doesn't see the patient, so each symptom string is generated once
+    remaining = {}
+    for key, answer in predictions.items():
+        if answer is None:
+            remaining.setdefault(key[0], unique[key])
+
+    choices = load_conditions() if CONSTRAIN_PREDICTIONS else None
+    llm_started = time.perf_counter()
+    answers = generate_short_answers(
+        [build_prediction_prompt(symptoms) for symptoms in remaining.values()],
+        choices=choices, max_new_tokens=16, cache=cache, engine=engine, window=batch_size
+    )
+    if remaining:
+        _record_tier("llm", len(remaining), time.perf_counter() - llm_started)
+    answers = dict(zip(remaining, answers))
+    for key, answer in predictions.items():
+        if answer is None:
+            predictions[key] = answers[key[0]]
+
+    stats["records"] = len(keys)
+    stats["unique"] = len(unique)
+    stats["prescreened"] = prescreened
+    stats["predicted"] = sum(1 for answer in predictions.values() if answer)
+    stats["seconds"] = time.perf_counter() - started
+    log_event(
+        "disease_prediction",
+        f"Batch prediction: {stats['records']} record(s), {stats['unique']} unique, "
+        f"{stats['prescreened']} pre-screened, {stats['predicted']} predicted",
+        latency_ms=stats["seconds"] * 1000
+    )
+    return [predictions.get(key, "") for key in keys]
+
+
 # 🌟 Modern, Beautiful UI for Disease Prediction
 def disease_prediction_ui():
     st.markdown("""
@@ -1,63 +1,196 @@
+import itertools
+import os
 import streamlit as st
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from utils.helper import log_event
-import PyPDF2
+from utils.llm_cache import cached_generate_batch
+from utils.model_registry import get_registry
+from utils.model_store import model_revision, model_source
+from utils.pdf_extract import iter_pdf_pages
+from utils.precision import apply_precision, load_dtype, model_precision, resolve_precision
 import torch
 
 # ✅ HuggingFace Model
 MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.3"
 
-@st.cache_resource
-def load_model():
+def _load_mistral():
     try:
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, use_auth_token=True)
+        # HEALTHAI_PRECISION_MISTRAL: auto, float32, bfloat16 or int8
+        precision = resolve_precision(model_precision("mistral"))
+        source, local = model_source("mistral", MODEL_ID)
+        tokenizer = AutoTokenizer.from_pretrained(source, use_auth_token=True, local_files_only=local)
         model = AutoModelForCausalLM.from_pretrained(
-            MODEL_ID,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device_map="auto",
-            use_auth_token=True
+            source,
+            torch_dtype=load_dtype(precision),
+            device_map="auto" if precision != "int8" else None,
+            use_auth_token=True,
+            local_files_only=local
         )
-        return tokenizer, model
+        return tokenizer, apply_precision(model, precision)
     except Exception as e:
         log_event("error", f"Model load failed: {e}")
         st.error("❌ Could not load Mistral-7B model. Ensure proper access.")
         raise e
 
-def read_uploaded_file(file):
+get_registry().register(MODEL_ID, _load_mistral, size_hint=28 * 1024 ** 3,
+                        describe=lambda: model_revision("mistral"))
+
+def load_model():
+    return get_registry().get(MODEL_ID)
+
+def iter_uploaded_pages(file):
+    """Yield the uploaded report's text page by page (PDF pages are cached by content hash)."""
     try:
         if file.name.endswith(".txt"):
-            return file.read().decode("utf-8")
+            yield file.getvalue().decode("utf-8")
         elif file.name.endswith(".pdf"):
-            pdf_reader = PyPDF2.PdfReader(file)
-            return "\n".join(page.extract_text() or "" for page in pdf_reader.pages).strip()
-        else:
-            return ""
+            yield from iter_pdf_pages(file.getvalue())
     except Exception as e:
         log_event("error", f"File parsing failed: {e}")
-        return ""
-
-def summarize_document(text):
-    tokenizer, model = load_model()
-    prompt = (
-        "You are a professional medical summarization assistant.\n"
-        "Read the following medical report and provide a structured, accurate summary:\n\n"
-        f"{text}\n\n"
-        "Summary:"
-    )
 
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048)
+def read_uploaded_file(file):
+    return "\n".join(iter_uploaded_pages(file)).strip()
+
+# Long reports are summarised map-reduce style: the text is split into
+# overlapping chunks of CHUNK_TOKENS tokens, each chunk is summarised (BATCH_SIZE
+# chunks per generate call), and the partial summaries are reduced into the
+# final structured summary. Pages are consumed lazily, so memory stays bounded
+# by one batch of chunks plus the short partial summaries.
+CHUNK_TOKENS = int(os.getenv("HEALTHAI_SUMMARY_CHUNK_TOKENS", 1536))
+CHUNK_OVERLAP = int(os.getenv("HEALTHAI_SUMMARY_CHUNK_OVERLAP", 128))
+BATCH_SIZE = int(os.getenv("HEALTHAI_SUMMARY_BATCH_SIZE", 4))
+CHUNK_SUMMARY_TOKENS = int(os.getenv("HEALTHAI_SUMMARY_CHUNK_SUMMARY_TOKENS", 200))
+SUMMARY_TOKENS = 350
+
+SUMMARY_PROMPT = (
+    "You are a professional medical summarization assistant.\n"
+    "Read the following medical report and provide a structured, accurate summary:\n\n"
+    "{text}\n\n"
+    "Summary:"
+)
+CHUNK_PROMPT = (
+    "You are a professional medical summarization assistant.\n"
+    "Summarize the findings, diagnoses, medications and recommendations in this part of a medical report:\n\n"
+    "{text}\n\n"
+    "Summary:"
+)
+REDUCE_PROMPT = (
+    "You are a professional medical summarization assistant.\n"
+    "Below are summaries of consecutive sections of one medical report. "
+    "Combine them into a structured, accurate summary of the whole report:\n\n"
+    "{text}\n\n"
+    "Summary:"
+)
+
+
+def chunk_text(pages, tokenizer, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """
+    Yield chunks of at most ``chunk_tokens`` tokens from an iterable of page
+    texts (or a single string); consecutive chunks share ``overlap`` tokens.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    buffer, fresh = [], 0  # fresh: tokens not yet emitted in any chunk
+    for page in pages:
+        if not page or not page.strip():
+            continue
+        ids = tokenizer(page.strip() + "\n", add_special_tokens=False).input_ids
+        buffer.extend(ids)
+        fresh += len(ids)
+        while len(buffer) >= chunk_tokens:
+            yield tokenizer.decode(buffer[:chunk_tokens]).strip()
+            buffer = buffer[chunk_tokens - overlap:]
+            fresh = max(len(buffer) - overlap, 0)
+    if fresh:
+        yield tokenizer.decode(buffer).strip()
+
+
+def _generate_batch(tokenizer, model, prompts, max_new_tokens):
+    """Greedy generation for several prompts in one left-padded batch; returns only the new text."""
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
     with torch.no_grad():
         outputs = model.generate(
-            **inputs,
-            max_new_tokens=350,
-            temperature=0.6,
-            top_k=50,
-            top_p=0.9
+            **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id
         )
+    new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+    return [text.strip() for text in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+
+def _summarize(tokenizer, model, template, texts, max_new_tokens):
+    prompts = [template.format(text=text) for text in texts]
+    # A report summarised before is served from cache, chunk by chunk
+    return cached_generate_batch(
+        MODEL_ID, prompts, lambda batch: _generate_batch(tokenizer, model, batch, max_new_tokens),
+        max_new_tokens=max_new_tokens, do_sample=False
+    )
+
+
+def _pack(texts, tokenizer, max_tokens):
+    """
+    Group consecutive texts into groups of at most ``max_tokens`` tokens, but
+    at least two texts per group so every reduce round shrinks the list.
+    """
+    group, size = [], 0
+    for text in texts:
+        length = len(tokenizer(text, add_special_tokens=False).input_ids)
+        if len(group) > 1 and size + length > max_tokens:
+            yield group
+            group, size = [], 0
+        group.append(text)
+        size += length
+    if group:
+        yield group
+
 
-    decoded = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    summary_start = decoded.lower().find("summary:")
-    return decoded[summary_start + len("summary:"):].strip() if summary_start != -1 else decoded.strip()
+def iter_summary(pages, tokenizer, model, batch_size=BATCH_SIZE, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """
+    Summarise a document given as page texts (or one string), yielding progress
+    events: ("chunks", n) after each batch of chunk summaries, ("reduce", n)
+    after each reduce round with n summaries left, then ("summary", text).
+    """
+    chunks = chunk_text(pages, tokenizer, chunk_tokens, overlap)
+    # Peek at two chunks (whatever the batch size) to tell a one-chunk document apart
+    head = list(itertools.islice(chunks, 2))
+    if len(head) <= 1:
+        # Fits in one chunk: a single generate, as before
+        text = head[0] if head else ""
+        yield "summary", _summarize(tokenizer, model, SUMMARY_PROMPT, [text], SUMMARY_TOKENS)[0] if text else ""
+        return
+
+    chunks = itertools.chain(head, chunks)
+    partials = []
+    batch = list(itertools.islice(chunks, batch_size))
+    while batch:
+        partials.extend(_summarize(tokenizer, model, CHUNK_PROMPT, batch, CHUNK_SUMMARY_TOKENS))
+        yield "chunks", len(partials)
+        batch = list(itertools.islice(chunks, batch_size))
+
+    # Reduce until the partial summaries fit in one prompt
+    groups = list(_pack(partials, tokenizer, chunk_tokens))
+    while len(groups) > 1:
+        texts = ["\n\n".join(group) for group in groups]
+        partials = []
+        for start in range(0, len(texts), batch_size):
+            partials.extend(_summarize(tokenizer, model, REDUCE_PROMPT, texts[start:start + batch_size],
+                                       CHUNK_SUMMARY_TOKENS))
+        yield "reduce", len(partials)
+        groups = list(_pack(partials, tokenizer, chunk_tokens))
+
+    yield "summary", _summarize(tokenizer, model, REDUCE_PROMPT, ["\n\n".join(groups[0])], SUMMARY_TOKENS)[0]
+
+
+def summarize_document(text, progress=None):
+    """Summarise ``text`` (a string or an iterable of page texts); ``progress(stage, count)`` sees every event."""
+    with get_registry().use(MODEL_ID) as (tokenizer, model):
+        for stage, value in iter_summary(text, tokenizer, model):
+            if stage == "summary":
+                return value
+            if progress is not None:
+                progress(stage, value)
+    return ""
 
 
 def document_summary_ui():
@@ -71,7 +204,14 @@ def document_summary_ui():
     file = st.file_uploader("📤 Upload Report (PDF or TXT)", type=["pdf", "txt"])
 
     if file:
-        raw_text = read_uploaded_file(file)
+        # Only the first pages are needed for the preview; the rest are
+        # extracted (and cached) when the summary is generated
+        preview = ""
+        for page in iter_uploaded_pages(file):
+            preview += page + "\n"
+            if len(preview) >= 3000:
+                break
+        raw_text = preview.strip()
 
         if raw_text:
             st.markdown("### 🔍 Document Preview")
@@ -80,7 +220,16 @@ def document_summary_ui():
             if st.button("🧠 Generate Summary", use_container_width=True):
                 with st.spinner("🌀 Analyzing the document and generating summary..."):
                     try:
-                        summary = summarize_document(raw_text)
+                        # Long reports are summarised section by section; show how far along we are
+                        status = st.empty()
+                        def show_progress(stage, count):
+                            if stage == "chunks":
+                                status.caption(f"🧩 Summarised {count} section(s) of the report...")
+                            else:
+                                status.caption(f"🔗 Combining {count} partial summaries...")
+
+                        summary = summarize_document(iter_uploaded_pages(file), progress=show_progress)
+                        status.empty()
                         st.markdown("### ✅ AI-Generated Summary")
                         st.markdown(
                             f"<div style='padding:20px; background-color:#e3f2fd; border-radius:10px; font-size:16px;'>{summary}</div>",
@@ -64,33 +64,28 @@
 
 
 import streamlit as st
-import json
 import os
 from models.health_score_calculator import calculate_health_score
 from models.vitals_visualizer import generate_vital_chart
 from models.health_summary_generator import generate_health_summary
-
-def load_patient_data(filepath="data/patients.json"):
-    if not os.path.exists(filepath):
-        return {}
-    with open(filepath, "r") as file:
-        return json.load(file)
+from utils.helper import get_all_patient_ids, get_patient_record
 
 def run_health_analytics():
     st.markdown("<h2 style='text-align:center; color:#3d6cb9;'>🩺 Health Analytics Dashboard</h2>", unsafe_allow_html=True)
     st.markdown("<hr style='margin-top: -10px;'>", unsafe_allow_html=True)
 
-    data = load_patient_data()
-    if not data:
+    # Served from the shared record cache, so widget reruns don't re-read the DB
+    patient_ids = get_all_patient_ids()
+    if not patient_ids:
         st.warning("⚠️ No patient data available.")
         return
 
     st.markdown("### 👤 Select a Patient")
-    patient_ids = list(data.keys())
     selected_patient_id = st.selectbox("Choose a Patient ID", patient_ids)
 
     if selected_patient_id:
-        patient_data = data[selected_patient_id]
+        patient_data = get_patient_record(selected_patient_id)
+        data = {selected_patient_id: patient_data}
         metadata = patient_data.get("metadata", {})
         visits = patient_data.get("visits", [])
 
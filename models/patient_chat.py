@@ -1,6 +1,14 @@
+import time
 import streamlit as st
-from utils.health_llm import generate_streaming_text
+from utils.health_llm import generate_streaming_text, register_prompt_prefix
 from utils.helper import log_event
+from utils.streaming import StreamRenderer
+
+# Shared by every chat prompt, so its KV cache is reused
+CHAT_PREAMBLE = register_prompt_prefix(
+    "You are an empathetic healthcare assistant.\n"
+    "Answer the following question clearly and professionally.\n\n"
+)
 
 # Attempt to import optional audio input
 try:
@@ -66,8 +74,7 @@ def patient_chat_ui():
         with st.spinner("HealthAI is thinking..."):
             try:
                 prompt = (
-                    "You are an empathetic healthcare assistant.\n"
-                    "Answer the following question clearly and professionally.\n\n"
+                    CHAT_PREAMBLE +
                     f"Question: {user_input}\n\n"
                     "Answer:"
                 )
@@ -75,16 +82,21 @@ def patient_chat_ui():
                 st.session_state.chat_history.append(("🧑 You", user_input))
 
                 # Streamed AI Response
+                started = time.perf_counter()
                 with st.chat_message("ai"):
-                    stream_output = st.empty()
-                    full_response = ""
-                    for token in generate_streaming_text(prompt, max_new_tokens=300, temperature=0.7):
-                        full_response += token
-                        stream_output.markdown(full_response + "▌")
-                    stream_output.markdown(full_response)
+                    # Throttled: re-renders every ~100 ms instead of on every token
+                    renderer = StreamRenderer(st.empty(), cursor="▌")
+                    for token in generate_streaming_text(prompt, max_new_tokens=300, temperature=0.7, cache=True):
+                        renderer.push(token)
+                    full_response = renderer.finish()
 
                 st.session_state.chat_history.append(("🤖 HealthAI", full_response.strip()))
-                log_event("chat", f"User: {user_input} => AI: {full_response.strip()}")
+                log_event(
+                    "chat",
+                    f"User: {user_input} => AI: {full_response.strip()} "
+                    f"[{renderer.tokens_per_s:.1f} chunks/s, {renderer.renders} renders]",
+                    latency_ms=(time.perf_counter() - started) * 1000
+                )
 
                 # 🔁 Follow-up suggestions
                 st.markdown("#### 🔁 Follow-up Suggestions:")
@@ -74,14 +74,19 @@
 #                 st.success("✅ Treatment Plan Generated")
 
 
+import time
 import streamlit as st
 from utils.helper import (
     get_all_patient_ids,
     get_patient_record,
-    save_patient_db,
+    modify_patient_record,
     log_event
 )
-from utils.health_llm import generate_streaming_text
+from utils.health_llm import generate_streaming_text, register_prompt_prefix
+from utils.streaming import StreamRenderer
+
+# Shared by every treatment-plan prompt, so its KV cache is reused
+PLAN_PREAMBLE = register_prompt_prefix("You are a trusted medical assistant.\n")
 
 def treatment_plan_ui():
     st.markdown("""
@@ -139,23 +144,25 @@ def treatment_plan_ui():
 
         with st.spinner("💬 AI is analyzing... Please wait."):
             prompt = (
-                "You are a trusted medical assistant.\n"
+                PLAN_PREAMBLE +
                 f"Patient symptoms: {symptoms}\n"
                 f"Diagnosis: {diagnosis}\n\n"
                 "Provide a clear, structured, step-by-step, medically accurate treatment plan:\n"
                 "Treatment Plan:"
             )
 
-            output_box = st.empty()
-            full_response = ""
+            # Throttled: the HTML box is re-rendered every ~100 ms, not per token
+            renderer = StreamRenderer(
+                st.empty(),
+                template=lambda text: f"<div class='treatment-box'><pre>{text.strip()}</pre></div>",
+                unsafe_allow_html=True
+            )
+            started = time.perf_counter()
 
             try:
-                for chunk in generate_streaming_text(prompt, max_new_tokens=300, temperature=0.7):
-                    full_response += chunk
-                    output_box.markdown(
-                        f"<div class='treatment-box'><pre>{full_response.strip()}</pre></div>",
-                        unsafe_allow_html=True
-                    )
+                for chunk in generate_streaming_text(prompt, max_new_tokens=300, temperature=0.7, cache=True):
+                    renderer.push(chunk)
+                full_response = renderer.finish()
             except Exception as e:
                 log_event("error", f"Streaming failed: {e}")
                 st.error("❌ An error occurred while generating the treatment plan.")
@@ -164,8 +171,36 @@ def treatment_plan_ui():
             if not full_response.strip():
                 st.warning("⚠️ Sorry, the AI could not generate a valid response.")
             else:
-                recent_visit["ai_treatment_plan"] = full_response.strip()
-                save_patient_db(selected_id, patient_data)
-                log_event("treatment_plan", f"Generated for patient: {selected_id}")
-                st.success("✅ AI Treatment Plan successfully generated and saved.")
+                plan = full_response.strip()
+                visit_index = len(visits) - 1
+                visit_key = [recent_visit.get(field) for field in ("timestamp", "symptoms", "diagnosis")]
+
+                # Another session may have added a visit while we were generating:
+                # visits are only appended, so the one shown keeps its position.
+                # Timestamps alone aren't unique (or may be missing), so the
+                # visit at that position must also still match what was shown.
+                attached = [False]
+
+                def attach_plan(record):
+                    record_visits = record.get("visits", [])
+                    visit = record_visits[visit_index] if visit_index < len(record_visits) else None
+                    attached[0] = visit is not None and [
+                        visit.get(field) for field in ("timestamp", "symptoms", "diagnosis")
+                    ] == visit_key
+                    if attached[0]:
+                        visit["ai_treatment_plan"] = plan
+
+                modify_patient_record(selected_id, attach_plan)
+                log_event(
+                    "treatment_plan",
+                    f"Generated for patient: {selected_id} "
+                    f"[{renderer.tokens_per_s:.1f} chunks/s, {renderer.renders} renders]",
+                    patient_id=selected_id,
+                    latency_ms=(time.perf_counter() - started) * 1000
+                )
+                if attached[0]:
+                    st.success("✅ AI Treatment Plan successfully generated and saved.")
+                else:
+                    log_event("warning", f"Visit {visit_index} of {selected_id} changed meanwhile; plan not saved")
+                    st.warning("⚠️ The visit was changed while the plan was generated, so it was not saved.")
 
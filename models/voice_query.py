@@ -1,9 +1,14 @@
 import streamlit as st
 import torch
-import torchaudio
-from transformers import AutoProcessor, AutoModelForSpeechSeq2Seq
 from transformers import AutoTokenizer, AutoModelForCausalLM
+from utils.asr_models import ASR_MODELS, asr_model_name, load_asr_model
 from utils.helper import log_event
+from utils.llm_cache import cached_generate
+from utils.model_registry import get_registry
+from utils.model_store import model_revision, model_source
+from utils.precision import apply_precision, load_dtype, model_precision, resolve_precision
+from utils.streaming import StreamRenderer
+from utils.transcription import format_timestamp, iter_transcription
 import os
 from tempfile import NamedTemporaryFile
 from huggingface_hub import login, HfApi
@@ -11,55 +16,79 @@ from huggingface_hub import login, HfApi
 # Ensure Hugging Face login (assumes you've already logged in via CLI)
 # login()  # Uncomment if needed to enforce login during runtime
 
-# ✅ Load Whisper model (for transcription)
-@st.cache_resource
-def load_whisper_model():
-    try:
-        processor = AutoProcessor.from_pretrained("openai/whisper-large-v3", use_auth_token=True)
-        model = AutoModelForSpeechSeq2Seq.from_pretrained("openai/whisper-large-v3", use_auth_token=True)
-        return processor, model
-    except Exception as e:
-        log_event("error", f"Failed to load Whisper model: {e}")
-        st.error("❌ Whisper model loading failed. Please ensure it's accessible and you've authenticated.")
-        raise e
+MEDICAL_MODEL_ID = "tiiuae/falcon-7b-instruct"
+
+# ✅ Load a Whisper model (for transcription); the size is HEALTHAI_ASR_MODEL,
+# "auto" meaning the most accurate measured one within the latency budget, or
+# large-v3 until benchmarks/asr_bench.py has been run (utils/asr_models.py)
+def _whisper_loader(name):
+    def load():
+        try:
+            return load_asr_model(name)
+        except Exception as e:
+            log_event("error", f"Failed to load Whisper model {name}: {e}")
+            st.error(f"❌ Whisper model loading failed ({ASR_MODELS[name]['model_id']}). Please ensure it's accessible.")
+            raise e
+    return load
 
 # ✅ Use medical model (Falcon-7B or fallback)
-@st.cache_resource
-def load_medical_model():
+def _load_falcon():
     try:
-        tokenizer = AutoTokenizer.from_pretrained("tiiuae/falcon-7b-instruct", use_auth_token=True)
-        model = AutoModelForCausalLM.from_pretrained("tiiuae/falcon-7b-instruct", use_auth_token=True)
-        return tokenizer, model
+        # HEALTHAI_PRECISION_FALCON: auto, float32, bfloat16 or int8
+        precision = resolve_precision(model_precision("falcon"))
+        source, local = model_source("falcon", MEDICAL_MODEL_ID)
+        tokenizer = AutoTokenizer.from_pretrained(source, use_auth_token=True, local_files_only=local)
+        model = AutoModelForCausalLM.from_pretrained(
+            source, torch_dtype=load_dtype(precision), use_auth_token=True, local_files_only=local
+        )
+        return tokenizer, apply_precision(model, precision)
     except Exception as e:
         log_event("error", f"Failed to load Falcon model: {e}")
         st.error("❌ Falcon model loading failed. Make sure you have access to `tiiuae/falcon-7b-instruct`.")
         raise e
 
-def transcribe_audio(audio_path):
-    processor, model = load_whisper_model()
-    waveform, sample_rate = torchaudio.load(audio_path)
+# All models go through the shared registry, which evicts idle ones when over budget
+for _name, _spec in ASR_MODELS.items():
+    get_registry().register(_spec["model_id"], _whisper_loader(_name), size_hint=int(_spec["size_hint"] * 1024 ** 3))
+get_registry().register(MEDICAL_MODEL_ID, _load_falcon, size_hint=28 * 1024 ** 3,
+                        describe=lambda: model_revision("falcon"))
 
-    inputs = processor(waveform[0], sampling_rate=sample_rate, return_tensors="pt")
-    with torch.no_grad():
-        predicted_ids = model.generate(**inputs)
-    transcription = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-    return transcription
+def whisper_model_id():
+    return ASR_MODELS[asr_model_name()]["model_id"]
 
-def ask_health_question(query):
-    tokenizer, model = load_medical_model()
+def load_whisper_model():
+    return get_registry().get(whisper_model_id())
 
+def load_medical_model():
+    return get_registry().get(MEDICAL_MODEL_ID)
+
+# Long recordings are transcribed in overlapping 30 s windows (see
+# utils/transcription.py); segments are yielded as each batch finishes
+def iter_transcribe_audio(audio_path):
+    with get_registry().use(whisper_model_id()) as (processor, model):
+        yield from iter_transcription(audio_path, processor, model)
+
+def transcribe_audio(audio_path):
+    return " ".join(segment["text"] for segment in iter_transcribe_audio(audio_path)).strip()
+
+def ask_health_question(query):
     prompt = (
         "You are a helpful and reliable medical assistant.\n"
         f"Patient Question: {query}\n\n"
         "Provide a medically accurate and empathetic response:"
     )
 
-    inputs = tokenizer(prompt, return_tensors="pt")
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=256, temperature=0.6)
+    def generate():
+        with get_registry().use(MEDICAL_MODEL_ID) as (tokenizer, model):
+            inputs = tokenizer(prompt, return_tensors="pt")
+            with torch.no_grad():
+                output = model.generate(**inputs, max_new_tokens=256, temperature=0.6)
 
-    response = tokenizer.decode(output[0], skip_special_tokens=True)
-    return response.split("response:")[-1].strip()
+        response = tokenizer.decode(output[0], skip_special_tokens=True)
+        return response.split("response:")[-1].strip()
+
+    # Greedy decoding (generate()'s default here), so repeated questions can be served from cache
+    return cached_generate(MEDICAL_MODEL_ID, prompt, generate, max_new_tokens=256, do_sample=False)
 
 def voice_query_ui():
     st.markdown("""
@@ -112,12 +141,18 @@ def voice_query_ui():
             if st.button("🧠 Transcribe and Analyze", use_container_width=True):
                 with st.spinner("🔍 Transcribing your voice and generating response..."):
                     try:
-                        transcription = transcribe_audio(temp_path)
-
                         col1, col2 = st.columns(2)
                         with col1:
                             st.markdown("### 📝 Transcription")
-                            st.success(transcription)
+                            st.caption(f"🗣️ Speech model: {whisper_model_id()}")
+                            # Partial transcript grows as each part of the recording is done
+                            renderer = StreamRenderer(st.empty(), cursor=" ▌")
+                            segments = []
+                            for segment in iter_transcribe_audio(temp_path):
+                                segments.append(segment["text"])
+                                renderer.push(f"`{format_timestamp(segment['start'])}` {segment['text']}\n\n")
+                            renderer.finish()
+                            transcription = " ".join(segments).strip()
 
                         with col2:
                             st.markdown("### 💬 AI Medical Response")
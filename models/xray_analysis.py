@@ -1,25 +1,31 @@
 # models/xray_analysis.py
 
+import os
 import streamlit as st
 import torch
-from PIL import Image
 from transformers import AutoProcessor, AutoModelForCausalLM
 from utils.helper import log_event
+from utils.model_registry import get_registry
+from utils.image_preprocess import pixel_inputs, thumbnail
+from utils.model_store import model_source
+from utils.xray_batch import REPORTS_FILE, iter_uploads, run_batch, upload_job_id
 
-# Cache the model and processor to avoid reloading on every run
-@st.cache_resource
-def load_xray_model():
+XRAY_MODEL_ID = "microsoft/maira-2"
+
+def _load_maira():
     try:
-        model_id = "microsoft/maira-2"
+        model_id, local = model_source("maira", XRAY_MODEL_ID)
 
         processor = AutoProcessor.from_pretrained(
             model_id,
-            trust_remote_code=True
+            trust_remote_code=True,
+            local_files_only=local
         )
 
         model = AutoModelForCausalLM.from_pretrained(
             model_id,
             trust_remote_code=True,
+            local_files_only=local,
             torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
             device_map="auto" if torch.cuda.is_available() else None
         )
@@ -30,21 +36,32 @@ def load_xray_model():
         st.error(f"🚨 Error loading MAIRA-2 model: {e}")
         raise e
 
+# Loaded through the shared registry so it counts against the memory budget
+get_registry().register(XRAY_MODEL_ID, _load_maira, size_hint=28 * 1024 ** 3)
 
-# Analyze a given X-ray image and return AI-generated report
-def analyze_xray_image(image: Image.Image) -> str:
-    try:
-        processor, model = load_xray_model()
+def load_xray_model():
+    return get_registry().get(XRAY_MODEL_ID)
 
-        inputs = processor(images=image, return_tensors="pt").to(model.device)
 
-        with torch.no_grad():
-            generated_ids = model.generate(
-                **inputs,
-                max_new_tokens=300,
-                do_sample=True,
-                temperature=0.7
-            )
+# Analyze a given X-ray image and return AI-generated report. Pass the
+# uploaded bytes to use the downscaled, cached pixel inputs.
+def analyze_xray_image(image) -> str:
+    try:
+        # Held in use so the registry can't evict it mid-generation
+        with get_registry().use(XRAY_MODEL_ID) as (processor, model):
+            if isinstance(image, bytes):
+                inputs = pixel_inputs(image, processor)
+            else:
+                inputs = processor(images=image, return_tensors="pt")
+            inputs = {key: value.to(model.device) for key, value in inputs.items()}
+
+            with torch.no_grad():
+                generated_ids = model.generate(
+                    **inputs,
+                    max_new_tokens=300,
+                    do_sample=True,
+                    temperature=0.7
+                )
 
         result = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
 
@@ -56,6 +73,23 @@ def analyze_xray_image(image: Image.Image) -> str:
         return "⚠️ AI model failed to generate a valid X-ray report."
 
 
+# Analyze several images with one generate call per batch; returns one report per image
+def analyze_xray_images(images, processor=None, model=None, max_new_tokens=300):
+    if processor is None:
+        with get_registry().use(XRAY_MODEL_ID) as (processor, model):
+            return analyze_xray_images(images, processor, model, max_new_tokens)
+
+    inputs = processor(images=list(images), return_tensors="pt").to(model.device)
+    with torch.no_grad():
+        generated_ids = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=0.7
+        )
+    return [report.strip() for report in processor.batch_decode(generated_ids, skip_special_tokens=True)]
+
+
 # Streamlit UI to upload and analyze X-ray
 def xray_analysis_ui():
     st.markdown(
@@ -96,18 +130,61 @@ def xray_analysis_ui():
     st.markdown('<div class="xray-header">📸 AI-Powered Chest X-Ray Analysis</div>', unsafe_allow_html=True)
     st.markdown("Let the advanced **MAIRA-2** model analyze your X-ray and generate a medical report.")
 
+    single_tab, batch_tab = st.tabs(["🖼️ Single image", "🗂️ Batch"])
+    with single_tab:
+        single_xray_ui()
+    with batch_tab:
+        xray_batch_ui()
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def single_xray_ui():
     uploaded_image = st.file_uploader("🖼️ Upload a Chest X-ray Image", type=["png", "jpg", "jpeg"])
 
     if uploaded_image:
-        image = Image.open(uploaded_image).convert("RGB")
-        st.image(image, caption="✅ Uploaded X-ray", use_column_width=True)
+        # A small thumbnail for display; the model gets cached, downscaled pixels
+        data = uploaded_image.getvalue()
+        st.image(thumbnail(data), caption="✅ Uploaded X-ray", use_column_width=True)
 
         if st.button("🧠 Analyze X-ray with MAIRA-2"):
             with st.spinner("🔍 Generating AI-powered report..."):
-                report = analyze_xray_image(image)
+                report = analyze_xray_image(data)
                 st.markdown('<div class="report-box">', unsafe_allow_html=True)
                 st.markdown(f"### 📄 AI-Generated Medical Report", unsafe_allow_html=True)
                 st.success(report)
                 st.markdown('</div>', unsafe_allow_html=True)
 
-    st.markdown('</div>', unsafe_allow_html=True)
+
+# Many films at once; reports are written to data/xray_reports/<job>/ as they
+# finish, so re-running the same upload set resumes instead of starting over
+def xray_batch_ui():
+    files = st.file_uploader(
+        "🗂️ Upload X-ray images or a .zip of them", type=["png", "jpg", "jpeg", "zip"], accept_multiple_files=True
+    )
+    if not files:
+        return
+    batch_size = st.slider("Images per batch", 1, 16, 8)
+
+    job = upload_job_id(files)
+    output_dir = os.path.join("data", "xray_reports", job)
+
+    if st.button("🧠 Analyze batch with MAIRA-2"):
+        bar = st.progress(0.0)
+        status = st.empty()
+
+        def show(stats):
+            finished = stats["analysed"] + stats["failed"]
+            bar.progress(finished / stats["total"] if stats["total"] else 1.0)
+            status.caption(f"📊 {finished}/{stats['total']} images · {stats['images_per_minute']:.1f} images/min")
+
+        with st.spinner("🔍 Generating reports..."):
+            stats = run_batch(iter_uploads(files), output_dir, analyze_xray_images, batch_size=batch_size, progress=show)
+        bar.progress(1.0)
+        st.success(f"✅ {stats['analysed']} analysed, {stats['failed']} failed, {stats['skipped']} already done "
+                   f"({stats['images_per_minute']:.1f} images/min)")
+
+    reports_path = os.path.join(output_dir, REPORTS_FILE)
+    if os.path.exists(reports_path):
+        with open(reports_path, "rb") as f:
+            st.download_button("📥 Download reports (JSONL)", f.read(), file_name=f"xray_reports_{job}.jsonl")
@@ -0,0 +1,39 @@
+import pytest
+
+import utils.storage as storage
+from utils.bulk import RowError, import_file
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = storage.JSONPatientStore(str(tmp_path / "patients.json"))
+    monkeypatch.setattr(storage, "_store", store)
+    return store
+
+
+def test_invalid_ndjson_lines_are_rejected(tmp_path, store):
+    path = tmp_path / "visits.ndjson"
+    path.write_text('{"patient_id": "a1", "symptoms": "cough", "diagnosis": "cold"}\n'
+                    '{"patient_id": "a2", "sympt\n'
+                    '[1, 2]\n'
+                    '"x"\n', encoding="utf-8")
+
+    stats = import_file(str(path))
+
+    assert stats["imported"] == 1 and stats["rejected"] == 3
+    with pytest.raises(RowError, match="row 2: invalid JSON"):
+        import_file(str(path), strict=True)
+
+
+def test_unknown_columns_are_not_stored(tmp_path, store):
+    path = tmp_path / "visits.csv"
+    path.write_text("patient_id,symptoms,diagnosis,ai_diagnosis,comment\n"
+                    "b1,cough,cold,flu,hello\n"
+                    "b2,fever,flu,,,extra\n", encoding="utf-8")
+
+    stats = import_file(str(path))
+
+    assert stats["imported"] == 1 and stats["rejected"] == 1
+    visit = store.get_patient("b1")["visits"][0]
+    assert visit["ai_diagnosis"] == "flu"
+    assert "comment" not in visit and "null" not in visit and None not in visit
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import models.document_summary as document_summary
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word."""
+
+    def __init__(self):
+        self.words = []
+
+    def __call__(self, text, add_special_tokens=False):
+        ids = []
+        for word in text.split():
+            if word not in self.words:
+                self.words.append(word)
+            ids.append(self.words.index(word))
+        return SimpleNamespace(input_ids=ids)
+
+    def decode(self, ids):
+        return " ".join(self.words[i] for i in ids)
+
+
+def fake_summarize(calls):
+    def summarize(tokenizer, model, template, texts, max_new_tokens):
+        calls.append((template, list(texts)))
+        return [f"summary{len(calls)}-{i}" for i in range(len(texts))]
+    return summarize
+
+
+def test_batch_size_one_summarizes_every_chunk(monkeypatch):
+    calls = []
+    monkeypatch.setattr(document_summary, "_summarize", fake_summarize(calls))
+    pages = [" ".join(f"p{page}w{word}" for word in range(50)) for page in range(10)]
+
+    events = list(document_summary.iter_summary(pages, WordTokenizer(), None, batch_size=1,
+                                                chunk_tokens=100, overlap=10))
+
+    chunk_calls = [texts for template, texts in calls if template == document_summary.CHUNK_PROMPT]
+    assert all(len(texts) == 1 for texts in chunk_calls)
+    assert len(chunk_calls) == 6  # 500 words in chunks of 100 overlapping by 10
+    assert "p9w49" in chunk_calls[-1][0]
+    assert [stage for stage, _ in events].count("chunks") == 6
+    assert events[-1][0] == "summary"
+
+
+def test_single_chunk_document_is_one_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(document_summary, "_summarize", fake_summarize(calls))
+
+    events = list(document_summary.iter_summary("short report text", WordTokenizer(), None, batch_size=1))
+
+    assert [template for template, _ in calls] == [document_summary.SUMMARY_PROMPT]
+    assert events == [("summary", "summary1-0")]
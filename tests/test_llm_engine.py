@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from benchmarks.tiny_lm import load_tiny_lm
+from utils.llm_engine import ContinuousBatchingEngine, GenerationTimeout
+
+
+@pytest.fixture(scope="module")
+def tiny_lm():
+    return load_tiny_lm()
+
+
+def test_worker_failure_fails_waiting_requests(tiny_lm, monkeypatch):
+    engine = ContinuousBatchingEngine(*tiny_lm, max_wait_ms=1)
+    try:
+        retire = engine._retire
+
+        def broken_retire(running):
+            monkeypatch.setattr(engine, "_retire", retire)
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(engine, "_retire", broken_retire)
+        request = engine.submit("hello", max_new_tokens=50, do_sample=False)
+        with pytest.raises(RuntimeError, match="boom"):
+            "".join(request)
+
+        # The worker survived and serves new requests
+        assert isinstance("".join(engine.submit("hello", max_new_tokens=4, do_sample=False)), str)
+    finally:
+        engine.close()
+
+
+def test_deadline_holds_without_the_worker(tiny_lm, monkeypatch):
+    engine = ContinuousBatchingEngine(*tiny_lm, max_wait_ms=1)
+    try:
+        monkeypatch.setattr(engine, "_admit", lambda requests: time.sleep(1))
+        request = engine.submit("hello", max_new_tokens=4, do_sample=False, timeout=0.2)
+        started = time.perf_counter()
+        with pytest.raises(GenerationTimeout):
+            "".join(request)
+        assert time.perf_counter() - started < 0.8
+    finally:
+        engine.close()
+
+
+def test_failed_admission_leaves_the_batch_as_it_was(tiny_lm, monkeypatch):
+    engine = ContinuousBatchingEngine(*tiny_lm, max_wait_ms=200, prefixes=["You are a helpful assistant.\n"])
+    try:
+        start = engine._start
+        calls = []
+
+        def start_then_fail(requests, out, mask):
+            calls.append(len(requests))
+            if len(calls) == 2:
+                raise RuntimeError("prefill failed")
+            start(requests, out, mask)
+
+        monkeypatch.setattr(engine, "_start", start_then_fail)
+        # Both join one admission: the prefix group is merged, then the plain prefill fails
+        requests = [engine.submit("You are a helpful assistant.\nhello", max_new_tokens=50, do_sample=False),
+                    engine.submit("plain prompt", max_new_tokens=50, do_sample=False)]
+        for request in requests:
+            with pytest.raises(RuntimeError, match="prefill failed"):
+                "".join(request)
+        assert calls == [1, 1]
+        assert engine.active_count() == 0
+
+        monkeypatch.setattr(engine, "_start", start)
+        assert isinstance("".join(engine.submit("hello", max_new_tokens=4, do_sample=False)), str)
+    finally:
+        engine.close()
+
+
+def test_batched_engine_checks_choices_afterwards(tiny_lm):
+    from utils.health_llm import generate_short_answers
+    from utils.llm_engine import BatchingScheduler
+
+    engine = BatchingScheduler(*tiny_lm, max_wait_ms=1)
+    try:
+        with pytest.raises(ValueError):
+            engine.submit("hello", constraint=object())
+        free = generate_short_answers(["hello", "world"], max_new_tokens=4, engine=engine)
+        choices = [free[0], "Migraine"]
+        assert generate_short_answers(["hello", "world"], choices=choices, max_new_tokens=4,
+                                      engine=engine) == [free[0], free[1] if free[1] in choices else ""]
+    finally:
+        engine.close()
@@ -0,0 +1,35 @@
+import models.disease_prediction as disease_prediction
+import utils.storage as storage
+from models.disease_prediction import SymptomIndex
+from utils.bulk import predict_store
+
+
+def test_query_can_leave_out_a_group():
+    index = SymptomIndex([("headache fever stomach pain", "Viral fever", "a"),
+                          ("rash itching", "Allergy", "b")])
+
+    label, confidence = index.query(["headache fever stomach pain"])[0]
+    assert label == "Viral fever" and abs(confidence - 1.0) < 1e-6
+    assert index.query(["headache fever stomach pain"], exclude=["a"])[0] == (None, 0.0)
+    assert index.query(["headache fever stomach pain"], exclude=["b"])[0][0] == "Viral fever"
+
+
+def test_stored_visit_is_not_prescreened_to_its_own_diagnosis(tmp_path, monkeypatch):
+    store = storage.JSONPatientStore(str(tmp_path / "patients.json"))
+    store.append_visit("a", {"symptoms": "headache, fever, stomach pain, throat pain", "diagnosis": "viral fever"})
+    store.append_visit("b", {"symptoms": "sneezing, runny nose", "diagnosis": "common cold"})
+    store.append_visit("c", {"symptoms": "sneezing, runny nose", "diagnosis": "common cold"})
+    monkeypatch.setattr(storage, "_store", store)
+    monkeypatch.setattr(disease_prediction, "_index", None)
+    prompts = []
+    monkeypatch.setattr(disease_prediction, "generate_short_answers",
+                        lambda batch, **kwargs: prompts.extend(batch) or [""] * len(batch))
+
+    stats = predict_store()
+
+    # a only matches itself, so it goes to the LLM; b and c vouch for each other
+    assert len(prompts) == 1 and "throat pain" in prompts[0]
+    assert stats["prescreened"] == 2
+    visits = {patient_id: visit for patient_id, _, visit in store.iter_visits()}
+    assert "ai_diagnosis" not in visits["a"]
+    assert visits["b"]["ai_diagnosis"] == visits["c"]["ai_diagnosis"] == "common cold"
@@ -0,0 +1,137 @@
+# utils/asr_models.py
+
+"""
+Speech recognition model choices for the voice query page.
+
+Every entry in ASR_MODELS is a Whisper-family checkpoint with the same
+processor/model interface, so utils/transcription.py works with any of
+them. HEALTHAI_ASR_MODEL picks one by name, or "auto" (the default) picks
+the most accurate model measured to transcribe one 30 s window within
+HEALTHAI_ASR_LATENCY_BUDGET_S seconds on this machine.
+
+Measurements come from the profiles benchmarks/asr_bench.py writes to
+HEALTHAI_ASR_PROFILES (default data/asr_profiles.json): real-time factor
+(processing seconds per audio second) and word error rate on your own
+reference clips. Only measured models are candidates; until the benchmark
+has been run, "auto" keeps large-v3, the model the page always used.
+
+    python -m benchmarks.asr_bench --models tiny small distil-large-v3 --save
+    HEALTHAI_ASR_LATENCY_BUDGET_S=5 streamlit run app.py
+
+Weights load with HEALTHAI_PRECISION_WHISPER (see utils/precision.py) and
+from the model store under "whisper" (large-v3) or "whisper-<name>".
+"""
+
+import json
+import os
+import threading
+
+from utils.helper import log_event
+
+# name -> Hub id and registry size hint (GB)
+ASR_MODELS = {
+    "tiny": {"model_id": "openai/whisper-tiny", "size_hint": 0.2},
+    "base": {"model_id": "openai/whisper-base", "size_hint": 0.3},
+    "small": {"model_id": "openai/whisper-small", "size_hint": 1.0},
+    "distil-small.en": {"model_id": "distil-whisper/distil-small.en", "size_hint": 0.7},
+    "distil-large-v3": {"model_id": "distil-whisper/distil-large-v3", "size_hint": 3.0},
+    "large-v3": {"model_id": "openai/whisper-large-v3", "size_hint": 6.0},
+}
+DEFAULT_ASR_MODEL = "large-v3"
+WINDOW_S = 30.0
+
+ASR_MODEL = os.getenv("HEALTHAI_ASR_MODEL", "auto")
+LATENCY_BUDGET_S = float(os.getenv("HEALTHAI_ASR_LATENCY_BUDGET_S", 10))
+PROFILES_PATH = os.getenv("HEALTHAI_ASR_PROFILES", "data/asr_profiles.json")
+
+_profiles = {"mtime": None, "data": {}}
+_profiles_lock = threading.Lock()
+
+
+def store_name(name):
+    """Model store name; large-v3 keeps the "whisper" snapshots made before the other sizes existed."""
+    return "whisper" if name == "large-v3" else f"whisper-{name}"
+
+
+def load_profiles(path=PROFILES_PATH):
+    """Measured {name: {"rtf", "wer", ...}} from the benchmark, re-read when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _profiles_lock:
+        if _profiles["mtime"] != mtime:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _profiles["data"] = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                log_event("warning", f"Ignoring unreadable ASR profiles {path}: {e}")
+                _profiles["data"] = {}
+            _profiles["mtime"] = mtime
+        return _profiles["data"]
+
+
+def save_profiles(results, path=PROFILES_PATH):
+    """Merge benchmark results ({name: {"rtf", "wer", ...}}) into the profiles file."""
+    profiles = dict(load_profiles(path))
+    profiles.update(results)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return profiles
+
+
+def measured(profiles=None):
+    """{name: (real-time factor, WER)} for the models the benchmark has measured."""
+    profiles = load_profiles() if profiles is None else profiles
+    return {
+        name: (profile["rtf"], profile["wer"])
+        for name, profile in profiles.items()
+        if name in ASR_MODELS and "rtf" in profile and "wer" in profile
+    }
+
+
+def select_asr_model(budget_s=LATENCY_BUDGET_S, profiles=None):
+    """
+    Most accurate measured model whose time for a 30 s window fits
+    ``budget_s``, else the fastest measured one; DEFAULT_ASR_MODEL when
+    nothing has been measured.
+    """
+    scored = measured(profiles)
+    if not scored:
+        return DEFAULT_ASR_MODEL
+    fitting = [name for name, (rtf, _) in scored.items() if rtf * WINDOW_S <= budget_s]
+    if not fitting:
+        fastest = min(scored, key=lambda name: scored[name][0])
+        log_event("warning", f"No measured ASR model fits a {budget_s:g}s budget per 30s window; using {fastest}")
+        return fastest
+    return min(fitting, key=lambda name: scored[name][1])
+
+
+def asr_model_name(setting=None):
+    """Resolve HEALTHAI_ASR_MODEL (or ``setting``) to a key of ASR_MODELS."""
+    setting = setting or ASR_MODEL
+    if setting == "auto":
+        return select_asr_model()
+    if setting not in ASR_MODELS:
+        log_event("warning", f"Unknown ASR model {setting!r}; choosing automatically")
+        return select_asr_model()
+    return setting
+
+
+def load_asr_model(name):
+    """(processor, model) for ``name``, at the configured Whisper precision."""
+    from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
+
+    from utils.model_store import model_source
+    from utils.precision import apply_precision, load_dtype, model_precision, resolve_precision
+
+    precision = resolve_precision(model_precision("whisper"))
+    source, local = model_source(store_name(name), ASR_MODELS[name]["model_id"])
+    processor = AutoProcessor.from_pretrained(source, local_files_only=local)
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        source, torch_dtype=load_dtype(precision), local_files_only=local
+    )
+    model.eval()
+    return processor, apply_precision(model, precision)
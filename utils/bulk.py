@@ -0,0 +1,332 @@
+# utils/bulk.py
+
+"""
+Bulk import/export of patient visits.
+
+    python -m utils.bulk import visits.csv
+    python -m utils.bulk import visits.ndjson --chunk-size 5000
+    python -m utils.bulk export backup.ndjson
+    python -m utils.bulk export visits.csv
+    python -m utils.bulk predict                      # every visit in the store
+    python -m utils.bulk predict visits.csv --output predicted.csv
+
+Rows are flat records with the patient fields (patient_id, name, age,
+gender) next to the visit fields used by the Profile & Vitals form (bp,
+pulse, temperature, symptoms, diagnosis, treatment, timestamp). Input is
+streamed in chunks, validated, scored with calculate_health_score and
+written to the configured store in a single transaction. Export streams
+visits out of the store one row at a time.
+
+predict runs batched disease prediction over the symptoms of every stored
+visit (or of every row of a file) and writes the result to each visit's
+ai_diagnosis field (or an ai_diagnosis column of the output file).
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+from models.health_score_calculator import calculate_health_score
+from utils.helper import log_event
+from utils.storage import get_store
+
+METADATA_FIELDS = ["name", "age", "gender"]
+VISIT_FIELDS = ["bp", "pulse", "temperature", "symptoms", "diagnosis", "treatment", "timestamp"]
+# Other visit fields an import keeps (those written by export); other columns are dropped
+EXTRA_VISIT_FIELDS = ["ai_treatment_plan", "ai_diagnosis"]
+CSV_COLUMNS = ["patient_id"] + METADATA_FIELDS + VISIT_FIELDS + ["health_score", "ai_treatment_plan", "ai_diagnosis"]
+
+BP_PATTERN = re.compile(r"^\d{2,3}/\d{2,3}$")
+
+
+class RowError(ValueError):
+    """A single input row failed validation."""
+
+
+def _read_rows(path):
+    """
+    Yield raw row dicts from a CSV or NDJSON file without loading it whole.
+    An NDJSON line that isn't a JSON object is yielded as a RowError, so it
+    is rejected like any other invalid row.
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield RowError(f"invalid JSON: {e}")
+                    continue
+                yield row if isinstance(row, dict) else RowError(f"expected a JSON object, got {type(row).__name__}")
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def validate_row(row):
+    """
+    Check one input row against the visit schema and normalise its types.
+    Returns (patient_id, visit, metadata); raises RowError if invalid.
+    """
+    if isinstance(row, RowError):
+        raise row
+    if None in row:
+        # csv.DictReader puts cells beyond the header under None
+        raise RowError(f"{len(row[None])} more cell(s) than header columns")
+    patient_id = str(row.get("patient_id") or "").strip()
+    if not patient_id:
+        raise RowError("missing patient_id")
+
+    visit = {field: row[field] for field in EXTRA_VISIT_FIELDS if not _blank(row.get(field))}
+
+    for field in ("symptoms", "diagnosis"):
+        if _blank(row.get(field)):
+            raise RowError(f"missing {field}")
+        visit[field] = str(row[field]).strip()
+    visit["treatment"] = str(row.get("treatment") or "").strip()
+
+    bp = str(row.get("bp") or "").strip()
+    if bp and not BP_PATTERN.match(bp):
+        raise RowError(f"invalid bp {bp!r} (expected e.g. 120/80)")
+    visit["bp"] = bp
+
+    try:
+        if not _blank(row.get("pulse")):
+            visit["pulse"] = int(float(row["pulse"]))
+        if not _blank(row.get("temperature")):
+            visit["temperature"] = float(row["temperature"])
+    except (TypeError, ValueError):
+        raise RowError(f"non-numeric pulse/temperature: {row.get('pulse')!r}, {row.get('temperature')!r}")
+
+    timestamp = row.get("timestamp")
+    if _blank(timestamp):
+        visit["timestamp"] = datetime.now().isoformat()
+    else:
+        try:
+            visit["timestamp"] = datetime.fromisoformat(str(timestamp).strip()).isoformat()
+        except ValueError:
+            raise RowError(f"invalid timestamp {timestamp!r}")
+
+    metadata = {}
+    for field in METADATA_FIELDS:
+        if not _blank(row.get(field)):
+            metadata[field] = str(row[field]).strip()
+    if "age" in metadata:
+        try:
+            metadata["age"] = int(float(metadata["age"]))
+        except ValueError:
+            raise RowError(f"invalid age {metadata['age']!r}")
+
+    return patient_id, visit, metadata
+
+
+def prepare_rows(raw_rows, chunk_size=1000, strict=False, stats=None):
+    """
+    Validate and score rows chunk by chunk, yielding (patient_id, visit,
+    metadata) tuples ready for PatientStore.import_visits().
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("read", 0)
+    stats.setdefault("rejected", 0)
+    stats.setdefault("errors", [])
+
+    raw_rows = iter(raw_rows)
+    while True:
+        chunk = list(itertools.islice(raw_rows, chunk_size))
+        if not chunk:
+            return
+        valid = []
+        for raw in chunk:
+            stats["read"] += 1
+            try:
+                valid.append(validate_row(raw))
+            except RowError as e:
+                if strict:
+                    raise RowError(f"row {stats['read']}: {e}")
+                stats["rejected"] += 1
+                if len(stats["errors"]) < 20:
+                    stats["errors"].append(f"row {stats['read']}: {e}")
+
+        for _, visit, _ in valid:
+            visit["health_score"] = calculate_health_score(visit)
+        yield from valid
+
+
+def import_file(path, chunk_size=1000, strict=False):
+    stats = {}
+    start = time.perf_counter()
+    rows = prepare_rows(_read_rows(path), chunk_size=chunk_size, strict=strict, stats=stats)
+    stats["imported"] = get_store().import_visits(rows)
+    stats["seconds"] = time.perf_counter() - start
+    log_event("info", f"Bulk import of {path}: {stats['imported']} visit(s), {stats['rejected']} rejected")
+    return stats
+
+
+def _export_row(patient_id, metadata, visit):
+    row = {"patient_id": patient_id}
+    row.update({field: metadata[field] for field in METADATA_FIELDS if field in metadata})
+    row.update(visit)
+    return row
+
+
+def export_file(path):
+    start = time.perf_counter()
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row) + "\n")
+
+        for patient_id, metadata, visit in get_store().iter_visits():
+            write(_export_row(patient_id, metadata, visit))
+            count += 1
+    return {"exported": count, "seconds": time.perf_counter() - start}
+
+
+def predict_store(batch_size=32, overwrite=False):
+    """Fill in ai_diagnosis for stored visits that have symptoms (all of them with ``overwrite``)."""
+    from models.disease_prediction import normalize_symptoms, predict_diseases
+
+    todo = {}
+    for patient_id, _, visit in get_store().iter_visits():
+        if visit.get("symptoms") and (overwrite or not visit.get("ai_diagnosis")):
+            todo.setdefault(patient_id, []).append(visit["symptoms"])
+    symptoms = [s for patient_symptoms in todo.values() for s in patient_symptoms]
+    patients = [patient_id for patient_id, patient_symptoms in todo.items() for _ in patient_symptoms]
+
+    # The symptom index holds these very visits: leave each patient's own
+    # visits out of its pre-screen, or every visit would get its recorded diagnosis back
+    stats = {}
+    predictions = dict(zip(zip(patients, map(normalize_symptoms, symptoms)),
+                           predict_diseases(symptoms, batch_size, stats=stats, exclude=patients)))
+
+    def fill(patient_id, record):
+        for visit in record.get("visits", []):
+            prediction = predictions.get((patient_id, normalize_symptoms(visit.get("symptoms"))))
+            if prediction and (overwrite or not visit.get("ai_diagnosis")):
+                visit["ai_diagnosis"] = prediction
+
+    # One bulk write re-reads each record inside the store's lock/transaction,
+    # so visits added meanwhile aren't lost
+    stats["patients"] = get_store().modify_patients(todo, fill)
+    return stats
+
+
+def predict_file(path, output, batch_size=32, chunk_size=1000):
+    """
+    Copy a .csv/.ndjson file to ``output`` with an ai_diagnosis column added,
+    streaming ``chunk_size`` rows at a time.
+    """
+    from models.disease_prediction import predict_diseases
+
+    stats = {"records": 0, "unique": 0, "prescreened": 0, "predicted": 0, "rejected": 0}
+    start = time.perf_counter()
+
+    def read_rows():
+        for row in _read_rows(path):
+            if isinstance(row, RowError):
+                stats["rejected"] += 1
+                continue
+            row.pop(None, None)  # CSV cells beyond the header
+            yield row
+
+    rows = read_rows()
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        write = None
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            if write is None:
+                if output.endswith(".csv"):
+                    # Columns come from the first chunk; later extra keys are dropped
+                    fieldnames = list(dict.fromkeys([key for row in chunk for key in row] + ["ai_diagnosis"]))
+                    writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+                    writer.writeheader()
+                    write = writer.writerow
+                else:
+                    write = lambda row: f.write(json.dumps(row) + "\n")
+            chunk_stats = {}
+            predictions = predict_diseases([row.get("symptoms") or "" for row in chunk], batch_size, stats=chunk_stats)
+            for key in ("records", "unique", "prescreened", "predicted"):
+                stats[key] += chunk_stats.get(key, 0)
+            for row, prediction in zip(chunk, predictions):
+                row["ai_diagnosis"] = prediction
+                write(row)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else float("inf")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.bulk", description="Bulk patient/visit import and export")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Import visits from a .csv or .ndjson file")
+    imp.add_argument("path")
+    imp.add_argument("--chunk-size", type=int, default=1000)
+    imp.add_argument("--strict", action="store_true", help="Abort on the first invalid row")
+
+    exp = sub.add_parser("export", help="Export all visits to a .csv or .ndjson file")
+    exp.add_argument("path")
+
+    pred = sub.add_parser("predict", help="Predict diagnoses from visit symptoms in batches")
+    pred.add_argument("path", nargs="?", help="A .csv or .ndjson file instead of the patient store")
+    pred.add_argument("--output", help="Where to write the file with predictions (default: <path>.predicted.<ext>)")
+    pred.add_argument("--batch-size", type=int, default=32, help="Prompts decoded together")
+    pred.add_argument("--chunk-size", type=int, default=1000, help="File rows read and written at a time")
+    pred.add_argument("--overwrite", action="store_true", help="Re-predict visits that already have ai_diagnosis")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        try:
+            stats = import_file(args.path, chunk_size=args.chunk_size, strict=args.strict)
+        except RowError as e:
+            print(f"Import aborted, nothing written: {e}", file=sys.stderr)
+            raise SystemExit(1)
+        print(f"Imported {stats['imported']} visit(s) from {args.path} "
+              f"in {stats['seconds']:.2f}s ({_rate(stats['read'], stats['seconds']):.0f} rows/s)")
+        if stats["rejected"]:
+            print(f"Rejected {stats['rejected']} invalid row(s):")
+            for error in stats["errors"]:
+                print(f"  {error}")
+    elif args.command == "predict":
+        if args.path:
+            root, ext = os.path.splitext(args.path)
+            target = args.output or f"{root}.predicted{ext}"
+            stats = predict_file(args.path, target, args.batch_size, args.chunk_size)
+        else:
+            target = "the patient store"
+            stats = predict_store(args.batch_size, args.overwrite)
+        print(f"Predicted {stats['predicted']} of {stats['unique']} unique symptom set(s) "
+              f"({stats['records']} record(s)) in {stats['seconds']:.2f}s "
+              f"({_rate(stats['records'], stats['seconds']):.1f} records/s), written to {target}")
+        if stats.get("rejected"):
+            print(f"Skipped {stats['rejected']} line(s) that aren't JSON objects")
+    else:
+        stats = export_file(args.path)
+        print(f"Exported {stats['exported']} visit(s) to {args.path} "
+              f"in {stats['seconds']:.2f}s ({_rate(stats['exported'], stats['seconds']):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
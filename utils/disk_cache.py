@@ -0,0 +1,93 @@
+# utils/disk_cache.py
+
+"""
+Helpers shared by the on-disk caches (data/pdf_cache, data/image_cache).
+
+- write_atomic(): write through a uniquely named temp file in the target
+  directory and rename it into place, so concurrent writers of the same
+  entry never see (or leave) a torn file
+- prune(): keep a cache directory under a size limit by deleting its least
+  recently used entries (each top-level file or directory is one entry;
+  readers touch() entries they use)
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from utils.helper import log_event
+
+
+def write_atomic(path, data, mode="w"):
+    """Write ``data`` (str, or bytes with mode="wb") to ``path`` atomically."""
+    encoding = None if "b" in mode else "utf-8"
+    with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path) or ".", prefix=".tmp-",
+                                     encoding=encoding, delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.remove(f.name)
+        raise
+
+
+def touch(path):
+    """Mark an entry as recently used."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _entry_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+    return total
+
+
+def prune(directory, max_bytes, keep=()):
+    """
+    Delete the least recently used entries of ``directory`` until it is
+    under 90% of ``max_bytes``; entries named in ``keep`` are never removed.
+    Returns the number of entries removed.
+    """
+    if not max_bytes or not os.path.isdir(directory):
+        return 0
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            entries.append((os.path.getmtime(path), _entry_size(path), name, path))
+        except OSError:
+            continue  # removed by another process meanwhile
+    total = sum(size for _, size, _, _ in entries)
+    if total <= max_bytes:
+        return 0
+
+    started = time.perf_counter()
+    removed = 0
+    for _, size, name, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        if name in keep or name.startswith(".tmp-"):
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    log_event("info", f"Pruned {removed} entr{'y' if removed == 1 else 'ies'} from {directory} "
+                      f"in {time.perf_counter() - started:.2f}s")
+    return removed
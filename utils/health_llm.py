@@ -1,59 +1,236 @@
 # utils/health_llm.py
 
-import torch
-import streamlit as st
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+# torch, transformers and the model itself are only loaded on first use (or by
+# warm_up_in_background), so importing this module is cheap.
+
+import os
 import threading
+import streamlit as st
 from utils.helper import log_event
+from utils.llm_cache import CACHE_GREEDY, get_response_cache, make_key, replay
+from utils.model_registry import get_registry
+from utils.model_store import model_revision, model_source
+from utils.precision import apply_precision, load_dtype, model_precision, resolve_precision
 
 # Load model from Hugging Face
 MODEL_ID = "microsoft/phi-1_5"
 
-# Cache the model and tokenizer to avoid reloading on every run
-@st.cache_resource(show_spinner="🔄 Loading AI model...")
-def load_model():
-    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-    model = AutoModelForCausalLM.from_pretrained(MODEL_ID, torch_dtype=torch_dtype)
+# "continuous" admits and retires prompts at every decoding step; "batched"
+# runs groups of prompts through one generate() call from start to finish
+LLM_ENGINE = os.getenv("HEALTHAI_LLM_ENGINE", "continuous")
+
+# How many prompts decode together, and how long an idle engine waits for
+# more prompts to arrive before starting
+MAX_BATCH_SIZE = int(os.getenv("HEALTHAI_LLM_MAX_BATCH", 8))
+MAX_WAIT_MS = float(os.getenv("HEALTHAI_LLM_MAX_WAIT_MS", 20))
+
+# Admission control: prompts allowed to wait for a slot before new ones are
+# turned away, and the longest a single generation may run
+MAX_QUEUE = int(os.getenv("HEALTHAI_LLM_MAX_QUEUE", 64))
+GENERATION_TIMEOUT_S = float(os.getenv("HEALTHAI_LLM_TIMEOUT_S", 120))
+
+# Fixed instruction preambles registered by the feature modules; their KV
+# cache is computed once and reused by every prompt that starts with them
+MAX_CACHED_PREFIXES = int(os.getenv("HEALTHAI_LLM_PREFIX_CACHE", 8))
+_prompt_prefixes = []
+
+def register_prompt_prefix(prefix):
+    """Register a prompt preamble for KV reuse and return it unchanged."""
+    if prefix not in _prompt_prefixes:
+        _prompt_prefixes.append(prefix)
+    return prefix
+
+def _load_phi():
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    # HEALTHAI_PRECISION_PHI: auto, float32, bfloat16 or int8 (see utils/precision.py)
+    precision = resolve_precision(model_precision("phi"))
+    # Prefer the local safetensors snapshot (python -m utils.model_store snapshot phi)
+    source, local = model_source("phi", MODEL_ID)
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+    model = AutoModelForCausalLM.from_pretrained(source, torch_dtype=load_dtype(precision), local_files_only=local)
     model.to("cuda" if torch.cuda.is_available() else "cpu")
-    return tokenizer, model
+    return tokenizer, apply_precision(model, precision)
+
+# Pinned: the generation engine keeps a reference for the life of the process
+get_registry().register(MODEL_ID, _load_phi, pinned=True, size_hint=6 * 1024 ** 3,
+                        describe=lambda: model_revision("phi"))
+
+def load_model():
+    return get_registry().get(MODEL_ID)
 
-# Load model and tokenizer at module level
-tokenizer, model = load_model()
+def warm_up_in_background():
+    """Start loading the model on a daemon thread so the first request doesn't wait for it."""
+    def warm_up():
+        try:
+            load_model()
+        except Exception as e:
+            log_event("error", f"Model warm-up failed: {e}")
+
+    thread = threading.Thread(target=warm_up, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# One scheduler per process, shared by every Streamlit session
+@st.cache_resource(show_spinner="🔄 Loading AI model...")
+def get_scheduler():
+    from utils.llm_engine import BatchingScheduler, ContinuousBatchingEngine
+
+    tokenizer, model = load_model()
+    if LLM_ENGINE == "batched":
+        return BatchingScheduler(
+            tokenizer, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE
+        )
+    return ContinuousBatchingEngine(
+        tokenizer, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE,
+        prefixes=_prompt_prefixes, max_prefixes=MAX_CACHED_PREFIXES
+    )
+
+# Queue depth, active/cancelled/timed-out/rejected request counters
+def get_generation_stats():
+    return get_scheduler().stats()
+
+# Answer tries for generate_short_answer, one per tokenizer and choice list
+# (token ids differ between tokenizers). The tokenizer is kept alongside its
+# tries so its id can't be reused by another one.
+_answer_tries = {}
+_answer_tries_lock = threading.Lock()
+
+def _answer_trie(tokenizer, choices):
+    from utils.llm_engine import TokenTrie
+
+    key = (id(tokenizer), choices)
+    with _answer_tries_lock:
+        entry = _answer_tries.get(key)
+        if entry is None or entry[0] is not tokenizer:
+            entry = _answer_tries[key] = (tokenizer, TokenTrie.from_strings(tokenizer, choices))
+        return entry[1]
+
+# Short-answer mode for prompts that want a single line back (a diagnosis, a
+# label): greedy, stops at the first newline after some text and, with
+# ``choices``, can only produce one of those strings. The continuous engine
+# constrains decoding; with HEALTHAI_LLM_ENGINE=batched free-form answers are
+# checked against ``choices`` afterwards and anything else becomes "".
+# Answers are cached like generate_streaming_text(cache=True).
+def generate_short_answer(prompt, choices=None, max_new_tokens=16, cache=True):
+    if not prompt.strip():
+        return ""
+    return generate_short_answers([prompt], choices, max_new_tokens, cache)[0]
+
+_unconstrained_warned = []  # logged once per process
+
+# Batch version: every prompt is queued at once (``window`` at a time, so a
+# long list can't overflow the admission queue) and the engine decodes them
+# together. ``engine`` defaults to the shared scheduler; pass a
+# ContinuousBatchingEngine over another model to run offline (the response
+# cache is keyed by the app's model, so it is not used then). A prompt that
+# fails, times out or is rejected gets "".
+def generate_short_answers(prompts, choices=None, max_new_tokens=16, cache=True, engine=None, window=None):
+    from utils.llm_engine import EngineBusy, GenerationTimeout
+
+    choices = tuple(choices) if choices else None
+    response_cache = get_response_cache() if cache and engine is None else None
+    answers = [""] * len(prompts)
+    keys = {}
+    pending = []
+    for i, prompt in enumerate(prompts):
+        if not prompt.strip():
+            continue
+        if response_cache is not None:
+            keys[i] = make_key(MODEL_ID, prompt, max_new_tokens=max_new_tokens, do_sample=False,
+                               mode="short", choices=choices)
+            cached = response_cache.get(keys[i])
+            if cached is not None:
+                answers[i] = cached
+                continue
+        pending.append(i)
+    if not pending:
+        return answers
+
+    engine = engine or get_scheduler()
+    constraint = allowed = None
+    if choices and engine.supports_constraints:
+        constraint = _answer_trie(engine.tokenizer, choices)
+    elif choices:
+        if not _unconstrained_warned:
+            _unconstrained_warned.append(True)
+            log_event("warning", f"{type(engine).__name__} can't constrain decoding; "
+                                 f"short answers outside the given choices are dropped")
+        allowed = {choice.strip().lower(): choice for choice in choices}
+    window = window or MAX_QUEUE
+    for start in range(0, len(pending), window):
+        requests = []
+        for i in pending[start:start + window]:
+            try:
+                requests.append((i, engine.submit(
+                    prompts[i], max_new_tokens=max_new_tokens, do_sample=False, timeout=GENERATION_TIMEOUT_S,
+                    stop_on_newline=True, constraint=constraint
+                )))
+            except EngineBusy as e:
+                log_event("warning", f"Short answer generation rejected: {e}")
+        for i, request in requests:
+            try:
+                answers[i] = "".join(request).strip()
+                if allowed is not None:
+                    answers[i] = allowed.get(answers[i].lower(), "")
+            except GenerationTimeout as e:
+                log_event("warning", f"Short answer generation timed out: {e}")
+                continue
+            except Exception as e:
+                log_event("error", f"Short answer generation failed: {e}")
+                continue
+            if response_cache is not None and answers[i]:
+                response_cache.put(keys[i], answers[i], MODEL_ID)
+    return answers
 
 # Streaming text generator
-def generate_streaming_text(prompt, max_new_tokens=300, temperature=0.6):
+# With cache=True a repeated prompt is answered from utils/llm_cache.py and
+# replayed chunk by chunk. Sampling is kept as requested; greedy=True (or
+# HEALTHAI_LLM_CACHE_GREEDY=1 for every cacheable call) makes it deterministic.
+def generate_streaming_text(prompt, max_new_tokens=300, temperature=0.6, cache=False, greedy=None):
+    from utils.llm_engine import EngineBusy, GenerationTimeout
+
     if not prompt.strip():
         yield "⚠️ Prompt is empty. Please enter valid input."
         return
 
+    do_sample = not (CACHE_GREEDY if greedy is None else greedy) if cache else True
+    response_cache = get_response_cache() if cache else None
+    if response_cache is not None:
+        key = make_key(MODEL_ID, prompt, max_new_tokens=max_new_tokens, temperature=temperature, do_sample=do_sample)
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield from replay(cached)
+            return
+
     try:
-        # Prepare streaming generator
-        streamer = TextIteratorStreamer(
-            tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=True
+        # Queue the prompt; the scheduler batches it with other sessions'
+        # prompts and streams this prompt's tokens back as they are generated
+        request = get_scheduler().submit(
+            prompt, max_new_tokens=max_new_tokens, temperature=temperature,
+            do_sample=do_sample, timeout=GENERATION_TIMEOUT_S
         )
-        
-        # Tokenize input and move to appropriate device
-        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-
-        generation_kwargs = {
-            **inputs,
-            "streamer": streamer,
-            "max_new_tokens": max_new_tokens,
-            "temperature": temperature,
-            "do_sample": True
-        }
-
-        # Run model.generate in a separate thread to allow real-time streaming
-        thread = threading.Thread(target=model.generate, kwargs=generation_kwargs)
-        thread.start()
-
-        # Yield tokens one by one
-        for token in streamer:
+
+        # Yield tokens one by one; if the caller stops iterating (rerun,
+        # page change) the request is cancelled and stops using the model
+        chunks = []
+        for token in request:
+            chunks.append(token)
             yield token
 
+        # Only complete answers are cached
+        if response_cache is not None and "".join(chunks).strip():
+            response_cache.put(key, "".join(chunks), MODEL_ID)
+
+    except EngineBusy as e:
+        log_event("warning", f"Generation rejected: {e}")
+        yield "⚠️ The AI model is busy right now. Please try again in a moment."
+
+    except GenerationTimeout as e:
+        log_event("error", f"Streaming generation timed out: {e}")
+        yield "\n\n⚠️ Generation took too long and was stopped."
+
     except Exception as e:
         log_event("error", f"Streaming generation failed: {e}")
         yield "⚠️ Failed to generate treatment plan."
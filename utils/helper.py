@@ -1,56 +1,237 @@
+import copy
 import json
 import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from utils.logger import AsyncLogWriter, make_record
+from utils.storage import ConcurrentUpdateError, JSONPatientStore, get_store
 
-PATIENT_DB = "data/patients.json"
+PATIENT_DB = "data/patients.json"  # default JSON store; see utils/storage.py
 LOG_FILE = "logs/system.log"
 
-def log_event(event_type, message, to_file=True):
+# Logging: "text" or "json" lines, console echo "all", "errors" or "off"
+LOG_FORMAT = os.getenv("HEALTHAI_LOG_FORMAT", "text")
+LOG_CONSOLE = os.getenv("HEALTHAI_LOG_CONSOLE", "errors")
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("HEALTHAI_LOG_MAX_MESSAGE_CHARS", 1000))
+LOG_MAX_BYTES = int(os.getenv("HEALTHAI_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("HEALTHAI_LOG_BACKUP_COUNT", 5))
+LOG_ROTATE_SECONDS = float(os.getenv("HEALTHAI_LOG_ROTATE_SECONDS", 0)) or None
+
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+# Read cache bounds for decoded patient records
+CACHE_MAX_ENTRIES = int(os.getenv("HEALTHAI_CACHE_MAX_ENTRIES", 256))
+CACHE_MAX_BYTES = int(os.getenv("HEALTHAI_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+def _get_log_writer():
+    global _log_writer
+    if _log_writer is None:
+        with _log_writer_lock:
+            if _log_writer is None:
+                _log_writer = AsyncLogWriter(
+                    LOG_FILE,
+                    json_lines=LOG_FORMAT == "json",
+                    max_bytes=LOG_MAX_BYTES,
+                    backup_count=LOG_BACKUP_COUNT,
+                    rotate_seconds=LOG_ROTATE_SECONDS,
+                )
+    return _log_writer
+
+def log_event(event_type, message, to_file=True, patient_id=None, module=None, latency_ms=None):
     """
     Log a message with timestamp and event type.
-    Optionally write to a log file as well.
+    Optionally write to a log file as well; file writes are queued to a
+    background thread and never block the caller.
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    formatted = f"[{event_type.upper()}] {timestamp} - {message}"
-    print(formatted)
+    if module is None:
+        module = sys._getframe(1).f_globals.get("__name__")
+    record = make_record(event_type, message, patient_id, module, latency_ms, max_chars=LOG_MAX_MESSAGE_CHARS)
+
+    if LOG_CONSOLE == "all" or (LOG_CONSOLE == "errors" and event_type.lower() in ("warning", "error")):
+        print(f"[{event_type.upper()}] {record['timestamp']} - {record['message']}")
 
     if to_file:
-        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-        with open(LOG_FILE, "a") as f:
-            f.write(formatted + "\n")
+        _get_log_writer().submit(record)
+
+def get_log_stats():
+    """Written/dropped/queued counters of the background log writer."""
+    return _get_log_writer().stats()
+
+class PatientRecordCache:
+    """
+    Thread-safe LRU cache of decoded patient records, bounded by entry count
+    and by (approximate, JSON-encoded) size in bytes.
+
+    Entries are only valid for the store change token they were read under:
+    a token change made by another process clears the cache, while writes
+    made through this module bump ``version`` and drop just the affected
+    patient. Callers always get a deep copy, so mutating a returned record
+    never corrupts the cache.
+    """
+
+    _IDS = object()
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._token = None
+        self._lock = threading.Lock()
+
+    def _validate(self, token):
+        if token != self._token:
+            self._entries.clear()
+            self._bytes = 0
+            self._token = token
+
+    def get(self, key, token):
+        with self._lock:
+            if token is None:
+                self.misses += 1
+                return None
+            self._validate(token)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def put(self, key, value, token):
+        if token is None:
+            return
+        size = len(json.dumps(value))
+        with self._lock:
+            self._validate(token)
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (copy.deepcopy(value), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def note_write(self, patient_id, tokens):
+        """
+        Record a local write. ``tokens`` is (token before, token after) the
+        write as seen by the store with other writers excluded; other entries
+        are kept only if the cache was current right before this write.
+        """
+        with self._lock:
+            self.version += 1
+            if tokens is not None and self._token is not None and self._token == tokens[0]:
+                self._token = tokens[1]
+                for key in (patient_id, self._IDS):
+                    old = self._entries.pop(key, None)
+                    if old is not None:
+                        self._bytes -= old[1]
+            else:
+                self._entries.clear()
+                self._bytes = 0
+                self._token = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._token = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "version": self.version,
+            }
+
+
+_record_cache = PatientRecordCache()
+
+
+def get_cache_stats():
+    """Hit/miss counters and current size of the patient record cache."""
+    return _record_cache.stats()
 
 def load_patient_db():
     """
-    Load the entire patient database from a JSON file.
+    Load the entire patient database from the configured store.
     Returns an empty dict if not found or corrupted.
     """
-    if not os.path.exists(PATIENT_DB):
-        log_event("warning", f"{PATIENT_DB} not found. Returning empty database.")
+    store = get_store()
+    if isinstance(store, JSONPatientStore) and not any(
+        os.path.exists(path) for path in (store.path, store.journal_path)
+    ):
+        log_event("warning", f"{store.path} not found. Returning empty database.")
         return {}
 
     try:
-        with open(PATIENT_DB, "r") as f:
-            return json.load(f)
+        return store.load_all()
     except json.JSONDecodeError:
         log_event("error", f"Corrupted JSON in {PATIENT_DB}. Returning empty database.")
         return {}
 
+def _write(patient_id, write):
+    store = get_store()
+    try:
+        return write(store)
+    finally:
+        _record_cache.note_write(patient_id, store.last_write_tokens())
+
 def save_patient_db(patient_id, patient_record):
-    """Update a single patient's data in the JSON DB."""
-    os.makedirs(os.path.dirname(PATIENT_DB), exist_ok=True)
+    """
+    Update a single patient's data in the patient store.
+    Raises ConcurrentUpdateError if the record changed since it was read;
+    use modify_patient_record() to retry automatically.
+    """
+    _write(patient_id, lambda store: store.put_patient(patient_id, patient_record))
+
 
-    # Load full database
-    if os.path.exists(PATIENT_DB):
-        with open(PATIENT_DB, "r") as f:
-            db = json.load(f)
-    else:
-        db = {}
+def modify_patient_record(patient_id, modify, retries=5):
+    """
+    Read-modify-write a patient record with optimistic concurrency.
+    ``modify(record)`` edits the record in place and is re-run on a fresh
+    copy whenever another writer got there first.
+    """
+    for attempt in range(1, retries + 1):
+        record = get_patient_record(patient_id)
+        modify(record)
+        try:
+            save_patient_db(patient_id, record)
+            return record
+        except ConcurrentUpdateError as e:
+            _record_cache.clear()
+            log_event("warning", f"{e}; retrying ({attempt}/{retries})")
+            time.sleep(random.uniform(0, 0.05 * attempt))
+    raise ConcurrentUpdateError(patient_id, record.get("version"), None)
 
-    db[patient_id] = patient_record  # ✅ Correct usage now
 
-    # Save back updated DB
-    with open(PATIENT_DB, "w") as f:
-        json.dump(db, f, indent=4)
+# Called as listener(patient_id, visit, tokens) after every visit recorded
+# through update_patient_record; ``tokens`` is the store's (before, after)
+# change tokens for that write (see PatientStore.last_write_tokens), so
+# derived indexes can apply the visit instead of rebuilding from the store.
+_visit_listeners = []
+
+def add_visit_listener(listener):
+    if listener not in _visit_listeners:
+        _visit_listeners.append(listener)
 
 
 def update_patient_record(patient_id, new_data, metadata=None):
@@ -59,30 +240,37 @@ def update_patient_record(patient_id, new_data, metadata=None):
     If patient exists, appends a new visit and updates metadata.
     Otherwise, creates a new record.
     """
-    db = load_patient_db()
-
-    if patient_id not in db:
-        db[patient_id] = {
-            "metadata": metadata if metadata else {},
-            "visits": []
-        }
-        log_event("info", f"Created new patient record: {patient_id}")
-    else:
-        if metadata:
-            db[patient_id]["metadata"].update(metadata)
-            log_event("info", f"Updated metadata for: {patient_id}")
-
     new_data["timestamp"] = datetime.now().isoformat()
-    db[patient_id]["visits"].append(new_data)
+    created = _write(patient_id, lambda store: store.append_visit(patient_id, new_data, metadata))
+    tokens = get_store().last_write_tokens()
+    for listener in _visit_listeners:
+        try:
+            listener(patient_id, new_data, tokens)
+        except Exception as e:
+            log_event("error", f"Visit listener failed: {e}")
 
-    save_patient_db(patient_id, db[patient_id])  # ✅ FIXED here
-    log_event("info", f"Recorded new visit for: {patient_id}")
+    if created:
+        log_event("info", f"Created new patient record: {patient_id}", patient_id=patient_id)
+    elif metadata:
+        log_event("info", f"Updated metadata for: {patient_id}", patient_id=patient_id)
+    log_event("info", f"Recorded new visit for: {patient_id}", patient_id=patient_id)
 
 
 def get_patient_record(patient_id):
     """Get the full patient record: metadata and visit history."""
-    db = load_patient_db()
-    return db.get(patient_id, {})
+    store = get_store()
+    token = store.change_token()
+    record = _record_cache.get(patient_id, token)
+    if record is not None:
+        return record
+
+    try:
+        record = store.get_patient(patient_id)
+    except json.JSONDecodeError:
+        log_event("error", f"Corrupted JSON in {PATIENT_DB}. Returning empty record.")
+        return {}
+    _record_cache.put(patient_id, record, token)
+    return record
 
 def get_patient_history(patient_id):
     """Retrieve only visit history for a given patient ID."""
@@ -90,7 +278,19 @@ def get_patient_history(patient_id):
 
 def get_all_patient_ids():
     """List all registered patient IDs."""
-    return list(load_patient_db().keys())
+    store = get_store()
+    token = store.change_token()
+    patient_ids = _record_cache.get(PatientRecordCache._IDS, token)
+    if patient_ids is not None:
+        return patient_ids
+
+    try:
+        patient_ids = store.patient_ids()
+    except json.JSONDecodeError:
+        log_event("error", f"Corrupted JSON in {PATIENT_DB}. Returning no patients.")
+        return []
+    _record_cache.put(PatientRecordCache._IDS, patient_ids, token)
+    return patient_ids
 
 def get_patient_metadata(patient_id):
     """Get personal metadata (name, age, gender, etc.) for a patient."""
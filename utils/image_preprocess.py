@@ -0,0 +1,198 @@
+# utils/image_preprocess.py
+
+"""
+Decode-once preprocessing for X-ray uploads.
+
+Chest X-rays often arrive as 3000x3000+ PNG/JPEG exports, while the model
+only sees a few hundred pixels per side. Images are therefore decoded at
+reduced size where the format allows it (JPEG draft mode), shrunk with
+Pillow's reduce()-assisted resize to just above the processor's input
+resolution, and only then converted to RGB. Results are cached by content
+hash:
+
+- processor outputs (pixel tensors) in memory and under
+  HEALTHAI_IMAGE_CACHE (default data/image_cache), so reruns and repeat
+  uploads skip decoding and the processor entirely; the directory is kept
+  under HEALTHAI_IMAGE_CACHE_MAX_MB by dropping the least recently used files
+- small JPEG thumbnails for display, in memory
+
+    inputs = pixel_inputs(uploaded.getvalue(), processor)
+    st.image(thumbnail(uploaded.getvalue()))
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from utils.disk_cache import prune, touch
+from utils.helper import log_event
+
+IMAGE_CACHE_DIR = os.getenv("HEALTHAI_IMAGE_CACHE", "data/image_cache")
+IMAGE_CACHE_ENTRIES = int(os.getenv("HEALTHAI_IMAGE_CACHE_ENTRIES", 32))
+IMAGE_CACHE_MAX_BYTES = int(float(os.getenv("HEALTHAI_IMAGE_CACHE_MAX_MB", 1024)) * 1024 * 1024)
+# New files written between size checks of the cache directory
+PRUNE_INTERVAL = 32
+# Used when the processor doesn't say what resolution it resizes to
+DEFAULT_INPUT_SIZE = int(os.getenv("HEALTHAI_XRAY_INPUT_SIZE", 518))
+THUMBNAIL_SIZE = int(os.getenv("HEALTHAI_THUMBNAIL_SIZE", 512))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def input_size(processor):
+    """Shorter side, in pixels, that the processor resizes images to."""
+    image_processor = getattr(processor, "image_processor", processor)
+    for attr in ("crop_size", "size"):
+        size = getattr(image_processor, attr, None)
+        if isinstance(size, dict):
+            if "shortest_edge" in size:
+                return int(size["shortest_edge"])
+            if "height" in size and "width" in size:
+                return int(max(size["height"], size["width"]))
+        elif isinstance(size, int):
+            return size
+    return DEFAULT_INPUT_SIZE
+
+
+def prepare_image(data, min_side=DEFAULT_INPUT_SIZE):
+    """
+    Decode image bytes into an RGB image whose shorter side is at least
+    ``min_side`` (never upscaled), doing as little full-resolution work as possible.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    scale = min(width, height) / min_side
+    if scale > 1:
+        size = (max(1, round(width / scale)), max(1, round(height / scale)))
+        image.draft(image.mode if image.mode in ("L", "RGB") else "RGB", size)  # JPEG: decode at 1/2-1/8 scale
+        image = _to_8bit(image).resize(size, Image.LANCZOS, reducing_gap=3.0)
+    return _to_8bit(image).convert("RGB")
+
+
+def _to_8bit(image):
+    """16/32-bit grayscale (common in DICOM exports) -> L, stretched to its own range instead of clipped."""
+    if image.mode not in ("I", "I;16", "I;16B", "I;16L", "F"):
+        return image
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(image, dtype=np.float32)
+    low, high = float(pixels.min()), float(pixels.max())
+    pixels = (pixels - low) * (255.0 / (high - low)) if high > low else np.zeros_like(pixels)
+    return Image.fromarray(pixels.astype(np.uint8), mode="L")
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+_pixels = _LRU(IMAGE_CACHE_ENTRIES)
+_thumbnails = _LRU(IMAGE_CACHE_ENTRIES)
+_writes = [0]
+_writes_lock = threading.Lock()
+
+
+def _save(inputs, path, cache_dir):
+    import torch
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # A unique temp name, so two sessions caching the same image can't collide
+    with tempfile.NamedTemporaryFile(dir=cache_dir, prefix=".tmp-", delete=False) as f:
+        torch.save(inputs, f)
+    os.replace(f.name, path)
+    with _writes_lock:
+        _writes[0] += 1
+        check = (_writes[0] - 1) % PRUNE_INTERVAL == 0  # the first write, then every PRUNE_INTERVAL
+    if check:
+        prune(cache_dir, IMAGE_CACHE_MAX_BYTES, keep=(os.path.basename(path),))
+
+
+def pixel_inputs(data, processor, cache_dir=IMAGE_CACHE_DIR):
+    """
+    ``processor(images=..., return_tensors="pt")`` for the downscaled image,
+    cached by content hash and input size.
+    """
+    import torch
+
+    size = input_size(processor)
+    key = f"{content_hash(data)}_{size}"
+    inputs = _pixels.get(key)
+    if inputs is not None:
+        return inputs
+
+    path = os.path.join(cache_dir, key + ".pt") if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            inputs = torch.load(path, weights_only=True)
+            touch(path)
+        except Exception as e:
+            log_event("warning", f"Ignoring unreadable image cache entry {path}: {e}")
+    if inputs is None:
+        inputs = dict(processor(images=prepare_image(data, size), return_tensors="pt"))
+        if path:
+            _save(inputs, path, cache_dir)
+    _pixels.put(key, inputs)
+    return inputs
+
+
+def thumbnail(data, max_side=THUMBNAIL_SIZE):
+    """Small JPEG rendition of an uploaded image for display."""
+    key = (content_hash(data), max_side)
+    cached = _thumbnails.get(key)
+    if cached is not None:
+        return cached
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB" if image.mode != "L" else "L", (max_side, max_side))
+    image = _to_8bit(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=85)
+    _thumbnails.put(key, buffer.getvalue())
+    return buffer.getvalue()
+
+
+def clear_memory_cache():
+    _pixels.clear()
+    _thumbnails.clear()
+
+
+def cache_stats():
+    return {
+        "pixel_hits": _pixels.hits, "pixel_misses": _pixels.misses,
+        "thumbnail_hits": _thumbnails.hits, "thumbnail_misses": _thumbnails.misses,
+    }
@@ -0,0 +1,308 @@
+# utils/llm_cache.py
+
+"""
+Two-tier cache for LLM responses.
+
+Keys are built from (model id, the precision and snapshot it is loaded with,
+normalised prompt, generation parameters), so the same symptoms, diagnosis
+or uploaded report answered minutes ago is served without touching the model:
+
+- an in-process LRU of recent responses
+- a SQLite file shared by every process (data/llm_cache.db) with a TTL and a
+  total-size cap; the least recently used rows are evicted first
+
+Only completed generations are stored; cancelled, timed-out or failed ones
+are not. Configure with HEALTHAI_LLM_CACHE ("1"/"0"), HEALTHAI_LLM_CACHE_PATH,
+HEALTHAI_LLM_CACHE_TTL_S, HEALTHAI_LLM_CACHE_MAX_MB, HEALTHAI_LLM_CACHE_MEMORY
+and HEALTHAI_LLM_CACHE_GREEDY.
+
+    python -m utils.llm_cache stats
+    python -m utils.llm_cache clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_ENABLED = os.getenv("HEALTHAI_LLM_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("HEALTHAI_LLM_CACHE_PATH", "data/llm_cache.db")
+CACHE_TTL_S = float(os.getenv("HEALTHAI_LLM_CACHE_TTL_S", 7 * 24 * 3600))
+CACHE_MAX_BYTES = int(float(os.getenv("HEALTHAI_LLM_CACHE_MAX_MB", 64)) * 1024 * 1024)
+CACHE_MEMORY_ENTRIES = int(os.getenv("HEALTHAI_LLM_CACHE_MEMORY", 256))
+
+# Set to "1" to decode cacheable calls greedily, so a cached answer is the one
+# the model would give again rather than one sample out of many. Off by
+# default: callers keep their sampling settings unless they ask for greedy.
+CACHE_GREEDY = os.getenv("HEALTHAI_LLM_CACHE_GREEDY", "0") == "1"
+
+# Puts between full TTL/size sweeps of the disk cache; in between, the size
+# is tracked from this process's own writes
+SWEEP_INTERVAL = 256
+
+_WHITESPACE = re.compile(r"[ \t]+")
+
+
+def normalize_prompt(prompt):
+    """Ignore differences in line endings, trailing blanks and runs of spaces."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(_WHITESPACE.sub(" ", line).strip() for line in lines).strip()
+
+
+def model_revision(model_id):
+    """
+    Resolved precision and model store snapshot of ``model_id``, as recorded
+    by the model registry, so an int8 model or a new snapshot doesn't serve
+    the old one's answers.
+    """
+    from utils.model_registry import ModelNotRegistered, get_registry
+
+    try:
+        return get_registry().revision(model_id)
+    except ModelNotRegistered:
+        return {}
+
+
+def make_key(model_id, prompt, **params):
+    """Stable cache key for one generation call."""
+    if not params.get("do_sample", True):
+        # Greedy decoding ignores the sampling knobs
+        params = {k: v for k, v in params.items() if k not in ("temperature", "top_k", "top_p")}
+    payload = json.dumps([model_id, model_revision(model_id), normalize_prompt(prompt), params],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model_id TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used);
+    """
+
+    def __init__(self, path=CACHE_PATH, memory_entries=CACHE_MEMORY_ENTRIES,
+                 ttl_seconds=CACHE_TTL_S, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+        self._disk_bytes = None  # running estimate of the table size, None until counted
+        self._puts = 0
+        self._memory = OrderedDict()  # key -> (response, created_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, created_at, now):
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def _remember(self, key, response, created_at):
+        with self._lock:
+            self._memory[key] = (response, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+        if self.path:
+            conn = self._connect()
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                response, created_at = row
+                if self._expired(created_at, now):
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.expired += 1
+                else:
+                    conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._remember(key, response, created_at)
+                    self.disk_hits += 1
+                    return response
+
+        self.misses += 1
+        return None
+
+    def put(self, key, response, model_id=""):
+        now = time.time()
+        self._remember(key, response, now)
+        if not self.path:
+            return
+        size = len(response.encode("utf-8"))
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model_id, response, size, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model_id, response, size, now, now),
+        )
+        with self._lock:
+            self._puts += 1
+            sweep = self._disk_bytes is None or self._puts % SWEEP_INTERVAL == 0
+            if not sweep:
+                self._disk_bytes += size
+                sweep = bool(self.max_bytes) and self._disk_bytes > self.max_bytes
+        if sweep:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """Drop expired rows, then the least recently used ones until under max_bytes; recounts the size."""
+        if self.ttl_seconds:
+            self.expired += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            self._disk_bytes = total
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        # Walk the oldest rows until enough bytes are freed, then drop them in one statement
+        # (down to 90% of the cap, so the next few puts don't trigger another sweep)
+        excess, cutoff, count = total - int(self.max_bytes * 0.9), None, 0
+        for last_used, size in conn.execute("SELECT last_used, size FROM responses ORDER BY last_used"):
+            excess -= size
+            cutoff, count = last_used, count + 1
+            if excess <= 0:
+                break
+        self.evictions += conn.execute("DELETE FROM responses WHERE last_used <= ?", (cutoff,)).rowcount
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            self._connect().execute("DELETE FROM responses")
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        stats = {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "memory_entries": len(self._memory),
+        }
+        if self.path:
+            count, total = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            stats.update(disk_entries=count, disk_bytes=total)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when caching is disabled."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+def replay(text):
+    """Yield a cached response in word-sized chunks, like a live stream."""
+    yield from re.findall(r"\s*\S+|\s+$", text)
+
+
+def cached_generate(model_id, prompt, generate, **params):
+    """
+    Return ``generate()``'s text for this prompt, serving it from the cache
+    when the same model, prompt and parameters were answered before.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return generate()
+    key = make_key(model_id, prompt, **params)
+    response = cache.get(key)
+    if response is None:
+        response = generate()
+        if response:
+            cache.put(key, response, model_id)
+    return response
+
+
+def cached_generate_batch(model_id, prompts, generate_batch, **params):
+    """
+    Batch version of cached_generate: ``generate_batch(prompts)`` is called
+    once with only the prompts that are not cached and must return one text
+    per prompt.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return list(generate_batch(list(prompts)))
+    keys = [make_key(model_id, prompt, **params) for prompt in prompts]
+    responses = [cache.get(key) for key in keys]
+    missing = [i for i, response in enumerate(responses) if response is None]
+    if missing:
+        for i, response in zip(missing, generate_batch([prompts[i] for i in missing])):
+            responses[i] = response
+            if response:
+                cache.put(keys[i], response, model_id)
+    return responses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.llm_cache", description="LLM response cache tools")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=CACHE_PATH)
+    args = parser.parse_args(argv)
+
+    cache = ResponseCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {args.path}")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,805 @@
+# utils/llm_engine.py
+
+"""
+Inference scheduling for the shared text-generation model.
+
+Instead of every Streamlit session starting its own ``model.generate``
+thread, prompts are submitted to a single scheduler that groups concurrent
+requests into padded batches and streams each row's tokens back to the
+request that owns it.
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+_DONE = object()
+
+
+class TokenTrie:
+    """
+    Prefix tree over the token ids of a fixed set of answers (e.g. condition
+    names), used to restrict decoding to exactly one of them.
+    """
+
+    END = None  # key marking that a complete answer ends at this node
+
+    def __init__(self, sequences):
+        self.root = {}
+        self.size = 0
+        self.depth = 0  # longest answer in tokens
+        for ids in sequences:
+            if not ids:
+                continue
+            self.depth = max(self.depth, len(ids))
+            node = self.root
+            for token_id in ids:
+                node = node.setdefault(token_id, {})
+            if TokenTrie.END not in node:
+                node[TokenTrie.END] = True
+                self.size += 1
+
+    @classmethod
+    def from_strings(cls, tokenizer, answers, prefix=" "):
+        """Build from answer strings as they would follow the prompt (after a space by default)."""
+        return cls(tokenizer(prefix + answer, add_special_tokens=False).input_ids for answer in answers)
+
+    @staticmethod
+    def allowed(node, end_token_id):
+        allowed = [token_id for token_id in node if token_id is not TokenTrie.END]
+        if TokenTrie.END in node:
+            allowed.append(end_token_id)
+        return allowed
+
+    @staticmethod
+    def is_leaf(node):
+        return all(token_id is TokenTrie.END for token_id in node)
+
+
+class EngineBusy(RuntimeError):
+    """The admission queue is full; the caller should retry later."""
+
+
+class GenerationTimeout(TimeoutError):
+    """A request passed its deadline before generation finished."""
+
+
+class GenerationRequest:
+    """
+    A queued prompt; iterate over it to receive generated text chunks.
+
+    Abandoning the iteration (breaking out, or the generator being closed on
+    a Streamlit rerun) cancels the request, and the engine drops it at its
+    next decoding step. ``timeout`` sets a deadline in seconds from submission.
+
+    Short-answer options: ``stop_on_newline`` ends generation at the first
+    newline after some text, and ``constraint`` (a TokenTrie) restricts the
+    output to one of its answers.
+    """
+
+    def __init__(self, prompt, max_new_tokens=300, temperature=0.6, do_sample=True, timeout=None,
+                 stop_on_newline=False, constraint=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.do_sample = do_sample
+        self.stop_on_newline = stop_on_newline
+        self.constraint = constraint
+        if constraint is not None:
+            # Never cut a constrained answer off halfway through a name
+            self.max_new_tokens = max(max_new_tokens, constraint.depth)
+        self.submitted_at = time.perf_counter()
+        self.deadline = self.submitted_at + timeout if timeout else None
+        self.first_token_at = None
+        self.finished_at = None
+        self.num_tokens = 0
+        self.cancelled = False
+        self.error = None
+        self._chunks = queue.Queue()
+
+    @property
+    def batch_key(self):
+        """Requests can share one generate() call only if sampling matches."""
+        return (self.do_sample, round(self.temperature, 4) if self.do_sample else None)
+
+    @property
+    def stop_reason(self):
+        """Why the engine should stop working on this request, if it should."""
+        if self.cancelled:
+            return "cancelled"
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return "timeout"
+        return None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def emit(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if text:
+            self._chunks.put(text)
+
+    def finish(self, error=None):
+        if self.finished_at is None:
+            self.error = error
+            self.finished_at = time.perf_counter()
+            self._chunks.put(_DONE)
+
+    def __iter__(self):
+        try:
+            while True:
+                try:
+                    # Don't count on the engine to enforce the deadline: a
+                    # stuck or dead worker must not hang the caller
+                    chunk = self._chunks.get(
+                        timeout=None if self.deadline is None else max(self.deadline - time.perf_counter(), 0)
+                    )
+                except queue.Empty:
+                    self.finish(error=GenerationTimeout(
+                        f"generation exceeded its deadline after {self.num_tokens} tokens"
+                    ))
+                    continue
+                if chunk is _DONE:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield chunk
+        finally:
+            if self.finished_at is None:
+                self.cancel()
+
+
+class _IncrementalDecoder:
+    """Per-row text decoding with the same word-boundary buffering as TextIteratorStreamer."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.offset = 0
+
+    def push(self, token_id):
+        self.token_ids.append(token_id)
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        if text.endswith("\n"):
+            printable = text[self.offset:]
+            self.token_ids, self.offset = [], 0
+        else:
+            printable = text[self.offset:text.rfind(" ") + 1]
+            self.offset += len(printable)
+        return printable
+
+    def flush(self):
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        printable = text[self.offset:]
+        self.token_ids, self.offset = [], 0
+        return printable
+
+
+class _EngineBase:
+    """
+    Admission, shutdown and metrics shared by both engines. The queue is
+    bounded: once ``max_queue`` requests are waiting, submit() raises
+    EngineBusy instead of letting work pile up without limit.
+    """
+
+    thread_name = "llm-engine"
+    supports_constraints = True  # whether submit() can apply a TokenTrie ``constraint``
+
+    def __init__(self, tokenizer, model, max_batch_size=8, max_wait_ms=20, max_queue=64):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.eos_token_id = self.tokenizer.eos_token_id
+
+        self.requests_served = 0
+        self.tokens_generated = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.failed = 0
+
+        self._newline_ids = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+
+    def submit(self, prompt, max_new_tokens=300, temperature=0.6, do_sample=True, timeout=None,
+               stop_on_newline=False, constraint=None):
+        request = GenerationRequest(
+            prompt, max_new_tokens, temperature, do_sample, timeout, stop_on_newline, constraint
+        )
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self.rejected += 1
+            raise EngineBusy(f"generation queue is full ({self._queue.maxsize} waiting)")
+        return request
+
+    def close(self):
+        """Stop the worker once every queued and in-flight request has finished."""
+        self._queue.put(_DONE)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "active": self.active_count(),
+            "requests": self.requests_served,
+            "tokens": self.tokens_generated,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    def active_count(self):
+        raise NotImplementedError
+
+    def _run(self):
+        raise NotImplementedError
+
+    def newline_token_ids(self):
+        """Ids of every vocabulary token whose text contains a newline (built once)."""
+        if self._newline_ids is None:
+            texts = self.tokenizer.batch_decode([[i] for i in range(len(self.tokenizer))])
+            self._newline_ids = {i for i, text in enumerate(texts) if "\n" in text}
+        return self._newline_ids
+
+    def _ends_answer(self, request, token_id, has_text):
+        """Short-answer mode: a newline after some text ends the answer."""
+        return request.stop_on_newline and has_text and token_id in self.newline_token_ids()
+
+    def _stop_if_abandoned(self, request):
+        """Finish a cancelled or expired request; returns True if it was stopped."""
+        reason = request.stop_reason
+        if reason is None:
+            return False
+        if reason == "timeout":
+            self.timed_out += 1
+            request.finish(error=GenerationTimeout(f"generation exceeded its deadline after {request.num_tokens} tokens"))
+        else:
+            self.cancelled += 1
+            request.finish()
+        return True
+
+    def _complete(self, request, error=None):
+        if error is not None:
+            self.failed += 1
+        else:
+            self.requests_served += 1
+        request.finish(error=error)
+
+    def _fail_all(self, error, in_flight=()):
+        """
+        The worker loop itself failed: finish ``in_flight`` and every queued
+        request with ``error`` so no caller waits for a result that won't come.
+        """
+        pending = list(in_flight)
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _DONE:
+                self._stopping = True
+            else:
+                pending.append(request)
+        for request in pending:
+            if request.finished_at is None:
+                self._complete(request, error=error)
+
+
+class _BatchFanoutStreamer(BaseStreamer):
+    """Receives batched token ids from generate() and routes each row to its request."""
+
+    def __init__(self, engine, requests):
+        self.engine = engine
+        self.requests = requests
+        self.decoders = [_IncrementalDecoder(engine.tokenizer) for _ in requests]
+        self.done = [False] * len(requests)
+        self.has_text = [False] * len(requests)
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            # generate() first echoes the (padded) prompt ids
+            self._prompt_seen = True
+            return
+        for row, token_id in enumerate(value.view(-1).tolist()):
+            if self.done[row]:
+                continue
+            request = self.requests[row]
+            if token_id == self.engine.eos_token_id or self.engine._ends_answer(request, token_id, self.has_text[row]):
+                self._finish_row(row)
+                continue
+            if request.stop_on_newline and token_id not in self.engine.newline_token_ids():
+                self.has_text[row] = True
+            request.num_tokens += 1
+            self.engine.tokens_generated += 1
+            request.emit(self.decoders[row].push(token_id))
+            if request.num_tokens >= request.max_new_tokens:
+                self._finish_row(row)
+
+    def drop_abandoned(self):
+        for row, request in enumerate(self.requests):
+            if not self.done[row] and self.engine._stop_if_abandoned(request):
+                self.done[row] = True
+
+    def _finish_row(self, row):
+        self.done[row] = True
+        self.requests[row].emit(self.decoders[row].flush())
+        self.engine._complete(self.requests[row])
+
+    def end(self):
+        for row in range(len(self.requests)):
+            if not self.done[row]:
+                self._finish_row(row)
+
+    @property
+    def all_done(self):
+        return all(self.done)
+
+
+class _StopWhenAllRowsDone(StoppingCriteria):
+    """Ends generate() early once every row has finished or been abandoned."""
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.streamer.drop_abandoned()
+        return self.streamer.all_done
+
+
+class BatchingScheduler(_EngineBase):
+    """
+    Dynamic batching: the worker waits up to ``max_wait_ms`` after the first
+    queued request for more to arrive, then runs up to ``max_batch_size``
+    compatible prompts through one left-padded ``model.generate`` call.
+
+    Supports ``stop_on_newline``; TokenTrie constraints need the continuous
+    engine, so submit() rejects them here.
+    """
+
+    thread_name = "llm-batching-scheduler"
+    supports_constraints = False
+
+    def __init__(self, tokenizer, model, max_batch_size=8, max_wait_ms=20, max_queue=64):
+        super().__init__(tokenizer, model, max_batch_size, max_wait_ms, max_queue)
+        self.batches_run = 0
+        self._pending = deque()
+        self._current = []
+        self._thread.start()
+
+    def submit(self, prompt, max_new_tokens=300, temperature=0.6, do_sample=True, timeout=None,
+               stop_on_newline=False, constraint=None):
+        if constraint is not None:
+            raise ValueError("the batching scheduler can't constrain decoding; use the continuous engine")
+        return super().submit(prompt, max_new_tokens, temperature, do_sample, timeout, stop_on_newline)
+
+    def active_count(self):
+        return sum(1 for request in self._current if request.finished_at is None)
+
+    def stats(self):
+        stats = super().stats()
+        stats["queued"] += len(self._pending)
+        stats["batches"] = self.batches_run
+        stats["avg_batch_size"] = self.requests_served / self.batches_run if self.batches_run else 0.0
+        return stats
+
+    def _collect(self):
+        """Gather one batch of requests that can share a generate() call."""
+        if not self._pending:
+            self._pending.append(self._queue.get())
+        deadline = time.perf_counter() + self.max_wait
+        while len(self._pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                self._pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        if _DONE in self._pending:
+            self._stopping = True
+        self._pending = deque(
+            r for r in self._pending if r is not _DONE and not self._stop_if_abandoned(r)
+        )
+        if not self._pending:
+            return []
+
+        key = self._pending[0].batch_key
+        batch, rest = [], deque()
+        for request in self._pending:
+            if request.batch_key == key and len(batch) < self.max_batch_size:
+                batch.append(request)
+            else:
+                rest.append(request)
+        self._pending = rest
+        return batch
+
+    def _run(self):
+        while not (self._stopping and not self._pending and self._queue.empty()):
+            try:
+                batch = self._collect()
+                if not batch:
+                    continue
+                self._current = batch
+                try:
+                    self._generate(batch)
+                except Exception as e:
+                    for request in batch:
+                        if request.finished_at is None:
+                            self._complete(request, error=e)
+                self._current = []
+                self.batches_run += 1
+            except Exception as e:
+                self._fail_all(e, self._current + list(self._pending))
+                self._current, self._pending = [], deque()
+
+    @torch.no_grad()
+    def _generate(self, batch):
+        inputs = self.tokenizer(
+            [request.prompt for request in batch], return_tensors="pt", padding=True
+        ).to(self.model.device)
+        streamer = _BatchFanoutStreamer(self, batch)
+
+        generation_kwargs = {
+            **inputs,
+            "streamer": streamer,
+            "max_new_tokens": max(request.max_new_tokens for request in batch),
+            "do_sample": batch[0].do_sample,
+            "pad_token_id": self.tokenizer.pad_token_id,
+            "stopping_criteria": StoppingCriteriaList([_StopWhenAllRowsDone(streamer)]),
+        }
+        if batch[0].do_sample:
+            generation_kwargs["temperature"] = batch[0].temperature
+        self.model.generate(**generation_kwargs)
+
+
+class _Sequence:
+    """Decoding state for one request inside the continuous batch."""
+
+    def __init__(self, request, decoder, length):
+        self.request = request
+        self.decoder = decoder
+        self.length = length  # prompt + generated tokens held in the KV cache
+        self.last_token = None
+        self.has_text = False  # for stop_on_newline: leading newlines don't end the answer
+        self.trie_node = request.constraint.root if request.constraint is not None else None
+
+
+def _pad_left(tensor, width):
+    """Left-pad dim 2 of a KV tensor, or dim 1 of a mask, with zeros up to ``width``."""
+    dim = 2 if tensor.dim() == 4 else 1
+    missing = width - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+class ContinuousBatchingEngine(_EngineBase):
+    """
+    Iteration-level batching: every decoding step runs one forward pass over
+    all in-flight sequences. New requests are prefilled and join the batch
+    between steps; finished, cancelled or expired ones leave it immediately,
+    so a short prompt never waits behind a long generation.
+
+    The running KV cache is kept as one left-padded legacy tuple cache with a
+    matching attention mask. Admission pads and concatenates, retirement
+    selects the surviving rows and trims padding columns nobody needs.
+
+    Prompts that start with a registered prefix (a fixed instruction
+    preamble) skip re-encoding it: the prefix's KV cache is computed once,
+    kept in an LRU of ``max_prefixes`` entries, and only the rest of the
+    prompt is prefilled. ``prefixes`` may be a list shared with the caller.
+    """
+
+    thread_name = "llm-continuous-batching"
+
+    def __init__(self, tokenizer, model, max_batch_size=8, max_wait_ms=20, max_queue=64, top_k=50,
+                 prefixes=None, max_prefixes=8):
+        super().__init__(tokenizer, model, max_batch_size, max_wait_ms, max_queue)
+        self.top_k = top_k
+        self.prefixes = prefixes if prefixes is not None else []
+        self.max_prefixes = max_prefixes
+        self.steps_run = 0
+        self.prefix_hits = 0
+        self.prefix_tokens_saved = 0
+        self._prefix_cache = OrderedDict()  # prefix text -> (token ids, legacy past)
+        self._active = []
+        self._past = None
+        self._mask = None
+        self._thread.start()
+
+    def register_prefix(self, prefix):
+        if prefix and prefix not in self.prefixes:
+            self.prefixes.append(prefix)
+
+    def active_count(self):
+        return len(self._active)
+
+    def stats(self):
+        stats = super().stats()
+        stats["steps"] = self.steps_run
+        stats["prefix_hits"] = self.prefix_hits
+        stats["prefix_tokens_saved"] = self.prefix_tokens_saved
+        stats["prefixes_cached"] = len(self._prefix_cache)
+        return stats
+
+    # --- worker thread ---
+
+    def _take_new(self):
+        """Pull waiting requests that fit in the batch; block only when idle."""
+        new = []
+        room = self.max_batch_size - len(self._active)
+        if room <= 0:
+            return new
+        try:
+            if not self._active and not self._stopping:
+                new.append(self._queue.get())
+                # Idle engine: give concurrent submitters a moment to pile up
+                # so their prompts share one prefill.
+                deadline = time.perf_counter() + self.max_wait
+                while len(new) < room and new[-1] is not _DONE:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    new.append(self._queue.get(timeout=remaining))
+            while len(new) < room:
+                new.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if any(request is _DONE for request in new):
+            self._stopping = True
+        return [r for r in new if r is not _DONE and not self._stop_if_abandoned(r)]
+
+    def _run(self):
+        while True:
+            new = []
+            try:
+                new = self._take_new()
+                if new:
+                    batch = (self._active, self._past, self._mask)
+                    try:
+                        self._admit(new)
+                    except Exception as e:
+                        # Some groups may already be merged: put the batch back as
+                        # it was and fail every new request still running
+                        self._active, self._past, self._mask = batch
+                        for request in new:
+                            if request.finished_at is None:
+                                self._complete(request, error=e)
+                if self._active:
+                    self._retire([seq for seq in self._active if not self._stop_if_abandoned(seq.request)])
+                if self._active:
+                    try:
+                        self._step()
+                    except Exception as e:
+                        for seq in self._active:
+                            self._complete(seq.request, error=e)
+                        self._active, self._past, self._mask = [], None, None
+                elif self._stopping and self._queue.empty():
+                    return
+            except Exception as e:
+                # Anything else (taking requests, retiring rows) would otherwise
+                # kill the worker and leave every waiting request hanging
+                self._fail_all(e, new + [seq.request for seq in self._active])
+                self._active, self._past, self._mask = [], None, None
+
+    def _sample(self, logits, sequences):
+        """Pick the next token for each row with its own temperature."""
+        tokens = []
+        for row, seq in enumerate(sequences):
+            request = seq.request
+            row_logits = logits[row].float()
+            if seq.trie_node is not None:
+                allowed = torch.tensor(TokenTrie.allowed(seq.trie_node, self.eos_token_id), device=row_logits.device)
+                mask = torch.full_like(row_logits, float("-inf"))
+                mask[allowed] = 0
+                row_logits = row_logits + mask
+            if not request.do_sample or request.temperature <= 0:
+                tokens.append(int(row_logits.argmax()))
+                continue
+            row_logits = row_logits / request.temperature
+            if self.top_k:
+                threshold = torch.topk(row_logits, min(self.top_k, row_logits.shape[-1])).values[-1]
+                row_logits = row_logits.masked_fill(row_logits < threshold, float("-inf"))
+            tokens.append(int(torch.multinomial(torch.softmax(row_logits, dim=-1), 1)))
+        return tokens
+
+    def _emit(self, sequences, tokens):
+        """Stream each row's new token; return the sequences that are still running."""
+        running = []
+        for seq, token_id in zip(sequences, tokens):
+            request = seq.request
+            finished = token_id == self.eos_token_id or self._ends_answer(request, token_id, seq.has_text)
+            if not finished:
+                request.num_tokens += 1
+                self.tokens_generated += 1
+                request.emit(seq.decoder.push(token_id))
+                if request.stop_on_newline and token_id not in self.newline_token_ids():
+                    seq.has_text = True
+                if seq.trie_node is not None:
+                    seq.trie_node = seq.trie_node[token_id]
+                finished = request.num_tokens >= request.max_new_tokens or (
+                    seq.trie_node is not None and TokenTrie.is_leaf(seq.trie_node)
+                )
+            if finished:
+                request.emit(seq.decoder.flush())
+                self._complete(request)
+            else:
+                seq.last_token = token_id
+                running.append(seq)
+        return running
+
+    def _match_prefix(self, prompt):
+        matches = [prefix for prefix in self.prefixes if prompt.startswith(prefix) and prompt != prefix]
+        return max(matches, key=len) if matches else None
+
+    def _prefix_state(self, prefix):
+        """Token ids and KV cache of a registered prefix, computed on first use."""
+        state = self._prefix_cache.get(prefix)
+        if state is None:
+            ids = self.tokenizer(prefix).input_ids
+            out = self.model(
+                input_ids=torch.tensor([ids], device=self.model.device), use_cache=True
+            )
+            state = (ids, tuple((k, v) for k, v in out.past_key_values))
+            self._prefix_cache[prefix] = state
+            while len(self._prefix_cache) > self.max_prefixes:
+                self._prefix_cache.popitem(last=False)
+        self._prefix_cache.move_to_end(prefix)
+        return state
+
+    @torch.no_grad()
+    def _admit(self, requests):
+        """Prefill new prompts and merge their KV cache into the running batch."""
+        groups = OrderedDict()
+        for request in requests:
+            groups.setdefault(self._match_prefix(request.prompt), []).append(request)
+
+        plain = groups.pop(None, [])
+        for prefix, group in groups.items():
+            plain.extend(self._prefill_from_prefix(prefix, group))
+        if plain:
+            inputs = self.tokenizer(
+                [request.prompt for request in plain], return_tensors="pt", padding=True
+            ).to(self.model.device)
+            mask = inputs["attention_mask"]
+            out = self.model(
+                input_ids=inputs["input_ids"],
+                attention_mask=mask,
+                position_ids=(mask.cumsum(-1) - 1).clamp(min=0),
+                use_cache=True,
+            )
+            self._start(plain, out, mask)
+
+    def _prefill_from_prefix(self, prefix, requests):
+        """
+        Prefill only what follows ``prefix``, starting from its cached KV.
+        Returns the requests whose tokenisation does not split cleanly at the
+        prefix boundary; those are prefilled from scratch instead.
+        """
+        prefix_ids, prefix_past = self._prefix_state(prefix)
+        size = len(prefix_ids)
+        group, suffixes, fallback = [], [], []
+        for request in requests:
+            ids = self.tokenizer(request.prompt).input_ids
+            if ids[:size] == prefix_ids and len(ids) > size:
+                group.append(request)
+                suffixes.append(ids[size:])
+            else:
+                fallback.append(request)
+        if not group:
+            return fallback
+
+        device = self.model.device
+        width = max(len(ids) for ids in suffixes)
+        input_ids = torch.full((len(group), width), self.tokenizer.pad_token_id, dtype=torch.long, device=device)
+        suffix_mask = torch.zeros((len(group), width), dtype=torch.long, device=device)
+        for row, ids in enumerate(suffixes):
+            input_ids[row, width - len(ids):] = torch.tensor(ids, device=device)
+            suffix_mask[row, width - len(ids):] = 1
+
+        # [prefix | left-padded suffix]: padding sits between the two and is masked out
+        mask = torch.cat([suffix_mask.new_ones((len(group), size)), suffix_mask], dim=1)
+        past = tuple((k.expand(len(group), -1, -1, -1), v.expand(len(group), -1, -1, -1)) for k, v in prefix_past)
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=size + (suffix_mask.cumsum(-1) - 1).clamp(min=0),
+            past_key_values=past,
+            use_cache=True,
+        )
+        self.prefix_hits += len(group)
+        self.prefix_tokens_saved += size * len(group)
+        self._start(group, out, mask)
+        return fallback
+
+    def _start(self, requests, out, mask):
+        """Sample each prefilled prompt's first token and add the survivors to the batch."""
+        sequences = [
+            _Sequence(request, _IncrementalDecoder(self.tokenizer), int(length))
+            for request, length in zip(requests, mask.sum(-1).tolist())
+        ]
+        tokens = self._sample(out.logits[:, -1, :], sequences)
+        running = {id(seq) for seq in self._emit(sequences, tokens)}
+        keep = [row for row, seq in enumerate(sequences) if id(seq) in running]
+        if not keep:
+            return
+
+        index = torch.tensor(keep, device=mask.device)
+        past = tuple((k.index_select(0, index), v.index_select(0, index)) for k, v in out.past_key_values)
+        self._merge([sequences[row] for row in keep], past, mask.index_select(0, index))
+
+    def _merge(self, sequences, past, mask):
+        if self._past is None:
+            self._active, self._past, self._mask = sequences, past, mask
+            return
+        width = max(self._mask.shape[1], mask.shape[1])
+        self._past = tuple(
+            (torch.cat([_pad_left(k0, width), _pad_left(k1, width)]),
+             torch.cat([_pad_left(v0, width), _pad_left(v1, width)]))
+            for (k0, v0), (k1, v1) in zip(self._past, past)
+        )
+        self._mask = torch.cat([_pad_left(self._mask, width), _pad_left(mask, width)])
+        self._active = self._active + sequences
+
+    def _retire(self, running):
+        """Keep only ``running`` rows of the batch and trim padding columns nobody needs."""
+        if len(running) == len(self._active):
+            return
+        if not running:
+            self._active, self._past, self._mask = [], None, None
+            return
+        alive = {id(seq) for seq in running}
+        keep = torch.tensor(
+            [row for row, seq in enumerate(self._active) if id(seq) in alive], device=self._mask.device
+        )
+        mask = self._mask.index_select(0, keep)
+        # Drop leading columns that only held padding or retired rows' context
+        start = int((mask.sum(0) == 0).long().cumprod(0).sum())
+        self._mask = mask[:, start:]
+        self._past = tuple(
+            (k.index_select(0, keep)[:, :, start:], v.index_select(0, keep)[:, :, start:]) for k, v in self._past
+        )
+        self._active = running
+
+    @torch.no_grad()
+    def _step(self):
+        """One decoding iteration over every in-flight sequence."""
+        device = self._mask.device
+        input_ids = torch.tensor([[seq.last_token] for seq in self._active], device=device)
+        position_ids = torch.tensor([[seq.length] for seq in self._active], device=device)
+        mask = torch.cat([self._mask, self._mask.new_ones((len(self._active), 1))], dim=1)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=self._past,
+            use_cache=True,
+        )
+        self.steps_run += 1
+        for seq in self._active:
+            seq.length += 1
+        self._past, self._mask = out.past_key_values, mask
+
+        tokens = self._sample(out.logits[:, -1, :], self._active)
+        self._retire(self._emit(self._active, tokens))
@@ -0,0 +1,187 @@
+# utils/logger.py
+
+"""
+Background log writer used by utils.helper.log_event.
+
+Callers only build a small dict and put it on a bounded queue; a daemon
+thread formats records, writes them in batches and rotates the file by size
+or age. When the queue is full the record is dropped (after waiting at most
+``block_timeout`` seconds) and counted, so hot paths never wait on disk.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+_STOP = object()
+
+
+class AsyncLogWriter:
+    def __init__(
+        self,
+        path,
+        json_lines=False,
+        max_queue=10000,
+        batch_size=256,
+        flush_interval=0.5,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+        rotate_seconds=None,
+        block_timeout=0.0,
+    ):
+        self.path = path
+        self.json_lines = json_lines
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_seconds = rotate_seconds
+        self.block_timeout = block_timeout
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.batches = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._opened_at = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- producer side ---
+
+    def submit(self, record):
+        """Queue a record dict. Returns False if it had to be dropped."""
+        try:
+            if self.block_timeout:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written."""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5.0)
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "rotations": self.rotations,
+        }
+
+    # --- writer thread ---
+
+    def format(self, record):
+        if self.json_lines:
+            return json.dumps({k: v for k, v in record.items() if v is not None}, default=str)
+        line = f"[{record['event_type'].upper()}] {record['timestamp']} - {record['message']}"
+        extras = [f"{key}={record[key]}" for key in ("patient_id", "latency_ms") if record.get(key) is not None]
+        if extras:
+            line += f" ({', '.join(extras)})"
+        return line
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.monotonic() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        if self._file is None:
+            self._open()
+        self._file.write("\n".join(self.format(r) for r in batch) + "\n")
+        self._file.flush()
+        self.written += len(batch)
+        self.batches += 1
+        if self._should_rotate():
+            self._rotate()
+
+    def _run(self):
+        while True:
+            batch, waiters, stop = [], [], False
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                # Never let a logging failure kill the writer thread.
+                self.dropped += len(batch)
+                print(f"[ERROR] log writer failed: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+
+def make_record(event_type, message, patient_id=None, module=None, latency_ms=None, max_chars=None):
+    """Build a log record, truncating oversized payloads such as full LLM responses."""
+    message = str(message)
+    if max_chars and len(message) > max_chars:
+        message = f"{message[:max_chars]}… [+{len(message) - max_chars} chars]"
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "event_type": event_type,
+        "message": message,
+        "patient_id": patient_id,
+        "module": module,
+        "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+    }
@@ -0,0 +1,257 @@
+# utils/model_registry.py
+
+"""
+One place for every feature module to get its models from.
+
+Modules register a loader under a name and call ``get(name)`` when they need
+the model. The registry loads on first use, measures how much memory the
+loaded tensors occupy and keeps the total under a budget
+(HEALTHAI_MODEL_MEMORY_GB, 0 = unlimited) by evicting the least recently
+used models. An evicted model is simply loaded again the next time it is
+requested. Pinned models are never evicted, and neither are models that are
+currently in use.
+
+    from utils.model_registry import get_registry
+
+    registry = get_registry()
+    registry.register("whisper", load_whisper)
+    processor, model = registry.get("whisper")
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.helper import log_event
+
+MEMORY_BUDGET_BYTES = int(float(os.getenv("HEALTHAI_MODEL_MEMORY_GB", 16)) * 1024 ** 3)
+
+
+class ModelNotRegistered(KeyError):
+    """get() was called for a name nobody registered."""
+
+
+def _tensors(value):
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _tensors(item)
+    elif hasattr(value, "element_size"):
+        yield value
+
+
+def resident_bytes(obj):
+    """
+    Bytes held by the weights of any torch modules in ``obj``. Uses the
+    state dict so int8-quantized Linear layers (packed params) are counted.
+    """
+    total = 0
+    items = obj if isinstance(obj, (tuple, list)) else [obj]
+    for item in items:
+        if hasattr(item, "state_dict") and hasattr(item, "parameters"):
+            seen = set()
+            for tensor in _tensors(list(item.state_dict(keep_vars=True).values())):
+                if tensor.data_ptr() in seen:
+                    continue  # tied weights
+                seen.add(tensor.data_ptr())
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Entry:
+    def __init__(self, name, loader, pinned=False, size_hint=0, describe=None):
+        self.name = name
+        self.loader = loader
+        self.pinned = pinned
+        self.size_hint = size_hint
+        self.describe = describe
+        self.revision = None
+        self.value = None
+        self.bytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.last_load_seconds = None
+        self.last_used = None
+        self.in_use = 0
+        self.load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.value is not None
+
+    @property
+    def expected_bytes(self):
+        return self.bytes or self.size_hint
+
+
+class ModelRegistry:
+    def __init__(self, budget_bytes=MEMORY_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = {}
+        self._lru = OrderedDict()  # loaded model names, least recently used first
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, pinned=False, size_hint=0, describe=None):
+        """
+        Register ``loader`` (a no-argument callable returning the model, or a
+        tuple such as (tokenizer, model)) under ``name``. Re-registering a
+        name keeps an already loaded model. ``describe`` optionally returns
+        what the loader loads (e.g. resolved precision and snapshot), see revision().
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._entries[name] = _Entry(name, loader, pinned, size_hint, describe)
+            else:
+                entry.loader, entry.pinned = loader, pinned
+                entry.size_hint = size_hint or entry.size_hint
+                entry.describe = describe or entry.describe
+
+    def get(self, name):
+        """Return the loaded model, loading it (and evicting others) if needed."""
+        entry = self._entry(name)
+        with self._lock:
+            if entry.loaded:
+                return self._touch(entry)
+
+        with entry.load_lock:
+            if not entry.loaded:
+                with self._lock:
+                    self._make_room(entry.expected_bytes, keep=name)
+                started = time.perf_counter()
+                revision = entry.describe() if entry.describe else {}
+                value = entry.loader()
+                with self._lock:
+                    entry.value = value
+                    entry.revision = revision
+                    entry.bytes = resident_bytes(value)
+                    entry.loads += 1
+                    entry.last_load_seconds = time.perf_counter() - started
+                    self._lru[name] = True
+                    self._make_room(0, keep=name)
+                log_event(
+                    "info",
+                    f"Loaded model {name} ({entry.bytes / 1024 ** 2:.0f} MB)",
+                    latency_ms=entry.last_load_seconds * 1000
+                )
+        with self._lock:
+            return self._touch(entry)
+
+    @contextmanager
+    def use(self, name):
+        """Like get(), but the model cannot be evicted until the block exits."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+
+    def revision(self, name):
+        """
+        What ``name`` is (or will next be) loaded as, from its ``describe``
+        callable: worked out when the model loads, or once on first request
+        before that, so callers can use it on every call. {} if undescribed.
+        """
+        entry = self._entry(name)
+        if entry.revision is None:
+            revision = entry.describe() if entry.describe else {}
+            with self._lock:
+                if entry.revision is None:
+                    entry.revision = revision
+        return entry.revision
+
+    def evict(self, name):
+        with self._lock:
+            entry = self._entry(name)
+            if entry.loaded:
+                self._drop(entry)
+        self._release_memory()
+
+    def resident(self):
+        """Total bytes of all loaded models."""
+        with self._lock:
+            return sum(entry.bytes for entry in self._entries.values() if entry.loaded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": self.resident(),
+                "models": {
+                    name: {
+                        "loaded": entry.loaded,
+                        "bytes": entry.bytes,
+                        "pinned": entry.pinned,
+                        "in_use": entry.in_use,
+                        "loads": entry.loads,
+                        "evictions": entry.evictions,
+                        "last_load_seconds": entry.last_load_seconds,
+                        "last_used": entry.last_used,
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
+
+    def _entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            raise ModelNotRegistered(name)
+        return entry
+
+    def _touch(self, entry):
+        entry.last_used = time.time()
+        self._lru.move_to_end(entry.name)
+        return entry.value
+
+    def _make_room(self, incoming, keep):
+        """Evict least recently used models until ``incoming`` more bytes fit the budget."""
+        if not self.budget_bytes:
+            return
+        freed = False
+        for name in list(self._lru):
+            if self.resident() + incoming <= self.budget_bytes:
+                break
+            entry = self._entries[name]
+            if name == keep or entry.pinned or entry.in_use:
+                continue
+            self._drop(entry)
+            freed = True
+        if freed:
+            self._release_memory()
+        if self.resident() + incoming > self.budget_bytes:
+            log_event("warning", f"Model memory budget exceeded: {(self.resident() + incoming) / 1024 ** 3:.1f} GB "
+                                 f"needed, {self.budget_bytes / 1024 ** 3:.1f} GB allowed")
+
+    def _drop(self, entry):
+        entry.value = None
+        entry.evictions += 1
+        self._lru.pop(entry.name, None)
+        log_event("info", f"Evicted model {entry.name} ({entry.bytes / 1024 ** 2:.0f} MB)")
+
+    def _release_memory(self):
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide model registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -0,0 +1,216 @@
+# utils/model_store.py
+
+"""
+Local, versioned snapshots of the app's models in safetensors format.
+
+    python -m utils.model_store snapshot phi                 # from the Hub
+    python -m utils.model_store snapshot phi --dtype bfloat16 --version 2024-06
+    python -m utils.model_store snapshot phi --source /path/to/checkpoint
+    python -m utils.model_store list
+    python -m utils.model_store verify phi
+
+Each snapshot lives in <store>/<name>/<version>/ next to a manifest.json
+recording the source model id, dtype, and size and sha256 of every file;
+<store>/<name>/CURRENT names the version loaders use. The loaders call
+model_source(): when a snapshot exists they load it with local_files_only
+(safetensors weights are memory-mapped, no network round-trips), otherwise
+they fall back to the Hub model id as before. The store directory is
+HEALTHAI_MODEL_STORE (default data/model_store).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from utils.asr_models import ASR_MODELS, store_name
+from utils.helper import log_event
+
+MODEL_STORE = os.getenv("HEALTHAI_MODEL_STORE", "data/model_store")
+
+# name -> Hub id and the transformers classes used to load it
+MODELS = {
+    "phi": {"model_id": "microsoft/phi-1_5", "model_class": "AutoModelForCausalLM", "processor_class": "AutoTokenizer"},
+    "mistral": {"model_id": "mistralai/Mistral-7B-Instruct-v0.3", "model_class": "AutoModelForCausalLM",
+                "processor_class": "AutoTokenizer"},
+    "falcon": {"model_id": "tiiuae/falcon-7b-instruct", "model_class": "AutoModelForCausalLM",
+               "processor_class": "AutoTokenizer"},
+    "whisper": {"model_id": "openai/whisper-large-v3", "model_class": "AutoModelForSpeechSeq2Seq",
+                "processor_class": "AutoProcessor"},
+    "maira": {"model_id": "microsoft/maira-2", "model_class": "AutoModelForCausalLM",
+              "processor_class": "AutoProcessor", "trust_remote_code": True},
+}
+# Every speech model size selectable with HEALTHAI_ASR_MODEL ("whisper" is large-v3)
+MODELS.update({
+    store_name(name): {"model_id": spec["model_id"], "model_class": "AutoModelForSpeechSeq2Seq",
+                       "processor_class": "AutoProcessor"}
+    for name, spec in ASR_MODELS.items()
+})
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _model_dir(name, store=MODEL_STORE):
+    return os.path.join(store, name)
+
+
+def current_version(name, store=MODEL_STORE):
+    try:
+        with open(os.path.join(_model_dir(name, store), "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def model_revision(name, store=MODEL_STORE):
+    """Resolved precision and current snapshot version ``name`` loads with."""
+    from utils.precision import model_precision, resolve_precision
+
+    return {"precision": resolve_precision(model_precision(name)), "snapshot": current_version(name, store)}
+
+
+def snapshot_path(name, store=MODEL_STORE):
+    """Directory of the current snapshot of ``name``, or None if there is none."""
+    version = current_version(name, store)
+    if version is None:
+        return None
+    path = os.path.join(_model_dir(name, store), version)
+    return path if os.path.exists(os.path.join(path, "manifest.json")) else None
+
+
+def model_source(name, model_id, store=MODEL_STORE):
+    """
+    Return (path or model id, local) for a loader's from_pretrained call;
+    pass ``local_files_only=local`` so a snapshot never touches the network.
+    """
+    path = snapshot_path(name, store)
+    if path is None:
+        return model_id, False
+    return path, True
+
+
+def _write_manifest(path, name, source, dtype):
+    files = {}
+    for root, _, filenames in os.walk(path):
+        for filename in sorted(filenames):
+            if filename == "manifest.json":
+                continue
+            full = os.path.join(root, filename)
+            files[os.path.relpath(full, path)] = {"size": os.path.getsize(full), "sha256": _sha256(full)}
+    manifest = {
+        "name": name,
+        "source": source,
+        "dtype": dtype,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_bytes": sum(f["size"] for f in files.values()),
+        "files": files,
+    }
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _set_current(name, version, store):
+    pointer = os.path.join(_model_dir(name, store), "CURRENT")
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+
+
+def snapshot(name, source=None, version=None, dtype=None, store=MODEL_STORE):
+    """Download (or read) a model, save it as safetensors into the store and make it current."""
+    import torch
+    import transformers
+
+    spec = MODELS.get(name, {"model_class": "AutoModelForCausalLM", "processor_class": "AutoTokenizer"})
+    source = source or spec.get("model_id")
+    if source is None:
+        raise ValueError(f"Unknown model {name!r}; pass --source")
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(_model_dir(name, store), version)
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+
+    kwargs = {"trust_remote_code": True} if spec.get("trust_remote_code") else {}
+    if dtype:
+        kwargs["torch_dtype"] = getattr(torch, dtype)
+    model = getattr(transformers, spec["model_class"]).from_pretrained(source, **kwargs)
+    processor = getattr(transformers, spec["processor_class"]).from_pretrained(
+        source, trust_remote_code=kwargs.get("trust_remote_code", False)
+    )
+
+    tmp = path + ".partial"
+    model.save_pretrained(tmp, safe_serialization=True)
+    processor.save_pretrained(tmp)
+    manifest = _write_manifest(tmp, name, source, str(next(model.parameters()).dtype).replace("torch.", ""))
+    os.replace(tmp, path)
+    _set_current(name, version, store)
+    log_event("info", f"Snapshot {name}@{version} saved ({manifest['total_bytes'] / 1024 ** 2:.0f} MB)")
+    return path, manifest
+
+
+def verify(name, store=MODEL_STORE):
+    """Return the list of files whose size or checksum no longer match the manifest."""
+    path = snapshot_path(name, store)
+    if path is None:
+        raise FileNotFoundError(f"No snapshot for {name}")
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    bad = []
+    for relpath, expected in manifest["files"].items():
+        full = os.path.join(path, relpath)
+        if not os.path.exists(full) or os.path.getsize(full) != expected["size"] or _sha256(full) != expected["sha256"]:
+            bad.append(relpath)
+    return bad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.model_store", description="Local model snapshot store")
+    parser.add_argument("--store", default=MODEL_STORE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="Save a model into the store as safetensors")
+    snap.add_argument("names", nargs="+", help=f"One or more of: {', '.join(MODELS)}")
+    snap.add_argument("--source", help="Hub id or local checkpoint to read instead of the configured id")
+    snap.add_argument("--version", help="Snapshot version label (default: timestamp)")
+    snap.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], help="Convert weights before saving")
+
+    sub.add_parser("list", help="Show the current snapshot of every model")
+
+    ver = sub.add_parser("verify", help="Check a snapshot's files against its manifest")
+    ver.add_argument("names", nargs="+")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        for name in args.names:
+            path, manifest = snapshot(name, args.source, args.version, args.dtype, args.store)
+            print(f"{name}: {path} ({manifest['dtype']}, {manifest['total_bytes'] / 1024 ** 2:.0f} MB)")
+    elif args.command == "list":
+        for name in sorted(set(MODELS) | set(os.listdir(args.store) if os.path.isdir(args.store) else [])):
+            path = snapshot_path(name, args.store)
+            if path is None:
+                print(f"{name}: (none, loads from the Hub)")
+                continue
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            print(f"{name}: {current_version(name, args.store)} {manifest['dtype']} "
+                  f"{manifest['total_bytes'] / 1024 ** 2:.0f} MB from {manifest['source']}")
+    else:
+        failed = False
+        for name in args.names:
+            bad = verify(name, args.store)
+            print(f"{name}: {'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+            failed = failed or bool(bad)
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# utils/pdf_extract.py
+
+"""
+PDF text extraction for uploaded reports, cached per page.
+
+Uploads are identified by the sha256 of their bytes. Extracted page texts
+are stored under <HEALTHAI_PDF_CACHE>/<hash>/ (default data/pdf_cache), one
+file per page, so a Streamlit rerun or a second pass over the same report
+reads text files instead of parsing the PDF again, and a partly read
+document resumes where it stopped. When at least HEALTHAI_PDF_PARALLEL_PAGES
+pages are missing, they are extracted in blocks by a process pool of
+HEALTHAI_PDF_WORKERS processes; the workers write the pages they extract to
+the cache themselves, so that work is kept even when the reader stops early
+(e.g. the preview, which only needs the first pages). The cache is kept
+under HEALTHAI_PDF_CACHE_MAX_MB by dropping the least recently used
+documents.
+
+iter_pdf_pages() is a generator: pages come out in order as soon as they are
+ready, so a preview or the chunked summarizer can start before the rest of
+the document is parsed.
+
+    for text in iter_pdf_pages(uploaded_file.getvalue()):
+        ...
+"""
+
+import hashlib
+import io
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.disk_cache import prune, touch, write_atomic
+from utils.helper import log_event
+
+PDF_CACHE_DIR = os.getenv("HEALTHAI_PDF_CACHE", "data/pdf_cache")
+PDF_WORKERS = int(os.getenv("HEALTHAI_PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_PAGES = int(os.getenv("HEALTHAI_PDF_PARALLEL_PAGES", 32))
+PDF_BLOCK_PAGES = int(os.getenv("HEALTHAI_PDF_BLOCK_PAGES", 16))
+PDF_CACHE_MAX_BYTES = int(float(os.getenv("HEALTHAI_PDF_CACHE_MAX_MB", 512)) * 1024 * 1024)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _reader(data):
+    import PyPDF2
+
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _extract_block(path, pages, cache_directory):
+    """Worker: text of the given page numbers of the PDF at ``path``, also written to the page cache."""
+    with open(path, "rb") as f:
+        reader = _reader(f.read())
+    cache = _PageCache(cache_directory)
+    texts = []
+    for i in pages:
+        texts.append(reader.pages[i].extract_text() or "")
+        cache.put(i, texts[-1])
+    return texts
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    # spawn, not fork: the Streamlit server process runs many threads
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+class _PageCache:
+    def __init__(self, directory):
+        self.directory = directory
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            touch(self.directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def page_count(self):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path("pages"), encoding="utf-8") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set_page_count(self, count):
+        if self.directory:
+            write_atomic(self._path("pages"), str(count))
+
+    def get(self, page):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(f"{page:05d}.txt"), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, page, text):
+        if self.directory:
+            write_atomic(self._path(f"{page:05d}.txt"), text)
+
+
+def iter_pdf_pages(data, workers=PDF_WORKERS, cache_dir=PDF_CACHE_DIR, stats=None):
+    """
+    Yield the text of every page of the PDF in ``data`` (bytes), in order.
+    ``cache_dir=None`` disables the cache; ``stats`` (a dict) receives the
+    page count and how many pages came from the cache.
+    """
+    stats = stats if stats is not None else {}
+    digest = content_hash(data)
+    cache = _PageCache(os.path.join(cache_dir, digest) if cache_dir else None)
+    reader = None
+    count = cache.page_count()
+    if count is None:
+        reader = _reader(data)
+        count = len(reader.pages)
+        cache.set_page_count(count)
+        if cache_dir:
+            # A new document: make room for it
+            prune(cache_dir, PDF_CACHE_MAX_BYTES, keep=(digest,))
+    stats.update(pages=count, cached=0, extracted=0)
+
+    cached = {}
+    missing = []
+    for page in range(count):
+        text = cache.get(page)
+        if text is None:
+            missing.append(page)
+        else:
+            cached[page] = text
+
+    futures = {}
+    if workers > 1 and len(missing) >= PDF_PARALLEL_PAGES:
+        pool = _get_pool(workers)
+        # Workers read the PDF from a temp file instead of each being sent the bytes
+        with tempfile.NamedTemporaryFile("wb", suffix=".pdf", delete=False) as f:
+            f.write(data)
+        # The first block is extracted here, so the first page isn't held up by the pool
+        blocks = [missing[start:start + PDF_BLOCK_PAGES]
+                  for start in range(PDF_BLOCK_PAGES, len(missing), PDF_BLOCK_PAGES)]
+        remove_when_done = _remover(f.name, len(blocks))
+        for block in blocks:
+            future = pool.submit(_extract_block, f.name, block, cache.directory)
+            future.add_done_callback(remove_when_done)
+            for position, page in enumerate(block):
+                futures[page] = (future, position)
+
+    try:
+        for page in range(count):
+            if page in cached:
+                stats["cached"] += 1
+                yield cached.pop(page)
+                continue
+            if page in futures:
+                future, position = futures.pop(page)
+                text = future.result()[position]  # already cached by the worker
+            else:
+                reader = reader or _reader(data)
+                text = reader.pages[page].extract_text() or ""
+                cache.put(page, text)
+            stats["extracted"] += 1
+            yield text
+    finally:
+        # The caller stopped early: drop blocks that haven't started; running
+        # ones finish and cache their pages for the next read
+        for future, _ in futures.values():
+            future.cancel()
+
+
+def _remover(path, count):
+    """Done-callback that deletes ``path`` once ``count`` futures have finished or been cancelled."""
+    remaining = [count]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return done
+
+
+def extract_pdf_text(data, **kwargs):
+    """The whole document as one string, pages separated by newlines."""
+    try:
+        return "\n".join(iter_pdf_pages(data, **kwargs)).strip()
+    except Exception as e:
+        log_event("error", f"PDF extraction failed: {e}")
+        return ""
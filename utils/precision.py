@@ -0,0 +1,64 @@
+# utils/precision.py
+
+"""
+Precision modes for the text LLM and Whisper loaders.
+
+- "float32": full precision (the CPU default)
+- "bfloat16": half the memory of float32, supported by recent CPUs
+- "int8": float32 weights with every nn.Linear converted to int8 dynamic
+  quantization (torch.ao.quantization.quantize_dynamic), CPU only
+- "auto": float16 on CUDA, float32 on CPU (what the loaders always did)
+
+Each model reads HEALTHAI_PRECISION_<NAME> (e.g. HEALTHAI_PRECISION_PHI,
+HEALTHAI_PRECISION_MISTRAL, HEALTHAI_PRECISION_FALCON, HEALTHAI_PRECISION_WHISPER
+for every speech model size) and falls back to
+HEALTHAI_PRECISION, then "auto". torch is only imported when a mode is applied.
+"""
+
+import os
+
+from utils.helper import log_event
+
+PRECISIONS = ("auto", "float32", "bfloat16", "int8")
+
+
+def model_precision(name):
+    """Configured precision for the model registered under the short ``name``."""
+    precision = os.getenv(f"HEALTHAI_PRECISION_{name.upper()}", os.getenv("HEALTHAI_PRECISION", "auto")).lower()
+    if precision not in PRECISIONS:
+        log_event("warning", f"Unknown precision {precision!r} for {name}; using auto")
+        return "auto"
+    return precision
+
+
+def resolve_precision(precision):
+    """Turn "auto", and int8 on a GPU (unsupported), into a concrete mode."""
+    import torch
+
+    if precision == "auto":
+        return "float16" if torch.cuda.is_available() else "float32"
+    if precision == "int8" and torch.cuda.is_available():
+        log_event("warning", "int8 dynamic quantization is CPU-only; using float16 on CUDA")
+        return "float16"
+    return precision
+
+
+def load_dtype(precision):
+    """torch_dtype to pass to from_pretrained for a resolved precision."""
+    import torch
+
+    return {
+        "float16": torch.float16,
+        "bfloat16": torch.bfloat16,
+    }.get(precision, torch.float32)
+
+
+def apply_precision(model, precision):
+    """Post-load conversion: quantize Linear layers for int8, otherwise no-op."""
+    if precision != "int8":
+        return model
+    import torch
+
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
@@ -0,0 +1,748 @@
+# utils/storage.py
+
+"""
+Pluggable storage backends for the patient database.
+
+The helper functions in utils/helper.py delegate to one of these stores:
+
+- JSONPatientStore: the original single-file JSON database (data/patients.json)
+- SQLitePatientStore: an embedded SQLite engine with indexed patients/visits tables
+
+The backend is selected with the HEALTHAI_STORAGE environment variable
+("json" or "sqlite"). Migrate an existing JSON database with:
+
+    python -m utils.storage migrate --source data/patients.json --target data/patients.db
+
+and fold the JSON store's write journal into its snapshot with:
+
+    python -m utils.storage compact
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locks only
+    fcntl = None
+
+PATIENT_DB = "data/patients.json"
+SQLITE_DB = "data/patients.db"
+
+STORAGE_BACKEND = os.getenv("HEALTHAI_STORAGE", "json").lower()
+
+# Compact the JSON journal into a new snapshot once it grows past this size.
+JOURNAL_COMPACT_BYTES = int(os.getenv("HEALTHAI_JOURNAL_COMPACT_BYTES", 4 * 1024 * 1024))
+
+
+def _fsync_dir(path):
+    """Persist a rename by syncing the containing directory (POSIX only)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a record was changed by another writer since it was read."""
+
+    def __init__(self, patient_id, expected, current):
+        super().__init__(
+            f"Patient {patient_id} was modified concurrently "
+            f"(expected version {expected}, found {current})"
+        )
+        self.patient_id = patient_id
+        self.expected = expected
+        self.current = current
+
+
+_fallback_locks = {}
+_fallback_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _flock(path, exclusive=True):
+    """
+    Advisory file lock. Each call opens its own descriptor, so flock() also
+    excludes other threads of this process, not just other processes.
+    """
+    if fcntl is None:
+        with _fallback_locks_guard:
+            lock = _fallback_locks.setdefault(os.path.abspath(path), threading.RLock())
+        with lock:
+            yield
+        return
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _stat_token(*paths):
+    token = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            token.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            token.append(None)
+    return tuple(token)
+
+
+def _new_record(metadata=None):
+    return {"metadata": dict(metadata) if metadata else {}, "visits": []}
+
+
+class PatientStore:
+    """Interface shared by all patient storage backends."""
+
+    def get_patient(self, patient_id):
+        """Return the full record (metadata + visits) or {} if unknown."""
+        raise NotImplementedError
+
+    def put_patient(self, patient_id, record):
+        """Replace a patient's full record."""
+        raise NotImplementedError
+
+    def append_visit(self, patient_id, visit, metadata=None):
+        """Append one visit, creating the patient if needed. Returns True if created."""
+        raise NotImplementedError
+
+    def patient_ids(self):
+        raise NotImplementedError
+
+    def change_token(self):
+        """
+        A cheap value that changes whenever the stored data may have changed
+        (in this or another process). None disables read caching.
+        """
+        return None
+
+    def last_write_tokens(self):
+        """
+        (token just before, token just after) this thread's last
+        put_patient/append_visit, taken while no other writer could change
+        the data in between; None when the store can't tell.
+        """
+        return getattr(getattr(self, "_local", None), "write_tokens", None)
+
+    def get_metadata(self, patient_id):
+        return self.get_patient(patient_id).get("metadata", {})
+
+    def iter_patients(self):
+        """Yield (patient_id, record) pairs."""
+        for patient_id in self.patient_ids():
+            yield patient_id, self.get_patient(patient_id)
+
+    def load_all(self):
+        return dict(self.iter_patients())
+
+    def iter_visits(self):
+        """Yield (patient_id, metadata, visit) for every visit, in insertion order."""
+        for patient_id, record in self.iter_patients():
+            for visit in record.get("visits", []):
+                yield patient_id, record.get("metadata", {}), visit
+
+    def import_visits(self, rows):
+        """
+        Append many (patient_id, visit, metadata) rows as one transaction.
+        Returns the number of visits written.
+        """
+        raise NotImplementedError
+
+    def modify_patients(self, patient_ids, modify):
+        """
+        Apply ``modify(patient_id, record)`` (in place) to every existing
+        patient in ``patient_ids`` as one bulk write. Returns the number of patients written.
+        """
+        count = 0
+        for patient_id in patient_ids:
+            record = self.get_patient(patient_id)
+            if record:
+                modify(patient_id, record)
+                self.put_patient(patient_id, record)
+                count += 1
+        return count
+
+
+class JSONPatientStore(PatientStore):
+    """
+    The database is a JSON snapshot plus an append-only journal.
+
+    Writes append one JSON line to ``<path>.journal`` and fsync it, so a new
+    visit costs a single small write instead of re-serializing the whole
+    database. Reads replay the journal on top of the snapshot. ``compact()``
+    folds the journal into a fresh snapshot via an atomic rename; it runs in
+    the background once the journal grows past ``compact_threshold`` bytes.
+
+    Locking (advisory, shared between processes and threads):
+
+    - ``<path>.locks/<patient>.lock``: exclusive per patient for a write, so
+      writers to different patients proceed in parallel
+    - ``<path>.lock``: shared by readers and writers, exclusive only while
+      compaction rotates the journal or swaps in the new snapshot
+    - ``<path>.append.lock``: held just for the single journal write() call
+    """
+
+    def __init__(self, path=PATIENT_DB, compact_threshold=JOURNAL_COMPACT_BYTES):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compacting_path = path + ".journal.compacting"
+        self.lock_path = path + ".lock"
+        self.append_lock_path = path + ".append.lock"
+        self.compact_lock_path = path + ".compact.lock"
+        self.patient_lock_dir = path + ".locks"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._compactor = None
+        # patient_id -> version, kept in sync by replaying only new journal bytes
+        self._index = None
+        self._index_files = None
+        self._index_offset = 0
+        self._local = threading.local()
+
+    # --- reading ---
+
+    def _file_token(self):
+        return _stat_token(self.path, self.compacting_path, self.journal_path)
+
+    def change_token(self):
+        return self._file_token()
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _read_journal(self, path, start=0):
+        """Return (entries, offset just past the last complete line)."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        complete = data.rfind(b"\n") + 1
+        entries = []
+        for line in data[:complete].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn line from a crash mid-append is ignored.
+                continue
+        return entries, start + complete
+
+    def _pending_compaction(self):
+        """
+        How to replay ``<path>.journal.compacting``: None if absent or already
+        folded into the snapshot (a compaction crashed before removing it),
+        otherwise whether replay must skip visits the snapshot may hold.
+        """
+        try:
+            compacting = os.stat(self.compacting_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        try:
+            snapshot = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {"dedupe": False}
+        # The new snapshot is always written after the journal was rotated.
+        if snapshot > compacting:
+            return None
+        return {"dedupe": snapshot == compacting}
+
+    @staticmethod
+    def _apply(db, entry, dedupe=False):
+        patient_id = entry["patient_id"]
+        if entry["op"] == "put":
+            db[patient_id] = entry["record"]
+        elif entry["op"] == "visit":
+            record = db.get(patient_id)
+            if record is None:
+                record = db[patient_id] = _new_record(entry.get("metadata"))
+            elif entry.get("metadata"):
+                record["metadata"].update(entry["metadata"])
+            if not (dedupe and entry["visit"] in record["visits"]):
+                record["visits"].append(entry["visit"])
+                record["version"] = record.get("version", 0) + 1
+
+    def _load(self):
+        return self._load_with_offset()[0]
+
+    def _load_with_offset(self):
+        with _flock(self.lock_path, exclusive=False):
+            return self._read_all()
+
+    def _read_all(self):
+        """Snapshot plus journals; the caller holds the database lock."""
+        db = self._read_snapshot()
+        pending = self._pending_compaction()
+        if pending is not None:
+            for entry in self._read_journal(self.compacting_path)[0]:
+                self._apply(db, entry, **pending)
+        entries, offset = self._read_journal(self.journal_path)
+        for entry in entries:
+            self._apply(db, entry)
+        for record in db.values():
+            record.setdefault("version", 0)
+        return db, offset
+
+    def get_patient(self, patient_id):
+        return self._load().get(patient_id, {})
+
+    def patient_ids(self):
+        return list(self._load().keys())
+
+    def iter_patients(self):
+        return iter(self._load().items())
+
+    def load_all(self):
+        return self._load()
+
+    # --- writing ---
+
+    def _versions(self):
+        """Current patient versions, replaying only journal bytes not seen yet."""
+        with self._lock, _flock(self.lock_path, exclusive=False):
+            files = _stat_token(self.path, self.compacting_path)
+            if self._index is None or files != self._index_files:
+                db, offset = self._load_with_offset()
+                self._index = {pid: record["version"] for pid, record in db.items()}
+            else:
+                entries, offset = self._read_journal(self.journal_path, self._index_offset)
+                for entry in entries:
+                    patient_id = entry["patient_id"]
+                    if entry["op"] == "put":
+                        self._index[patient_id] = entry["record"].get("version", 0)
+                    else:
+                        self._index[patient_id] = self._index.get(patient_id, 0) + 1
+                offset = max(offset, self._index_offset)
+            self._index_files = files
+            self._index_offset = offset
+            return self._index
+
+    def _patient_lock_path(self, patient_id):
+        digest = hashlib.sha1(patient_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.patient_lock_dir, digest + ".lock")
+
+    def _append(self, entry):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            with _flock(self.append_lock_path):
+                # Writers hold the database lock shared, so only appends
+                # (serialised here) can change the files: the tokens around
+                # this write differ by exactly this entry
+                before = self._file_token()
+                end = os.fstat(fd).st_size
+                if end and os.lseek(fd, end - 1, os.SEEK_SET) >= 0 and os.read(fd, 1) != b"\n":
+                    # Terminate a torn line left by a crash so this entry stays intact.
+                    line = b"\n" + line
+                os.write(fd, line)
+                self._local.write_tokens = (before, self._file_token())
+            os.fsync(fd)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size >= self.compact_threshold:
+            self.compact_in_background()
+
+    def _write(self, patient_id, make_entry):
+        self._local.write_tokens = None
+        os.makedirs(self.patient_lock_dir, exist_ok=True)
+        with _flock(self._patient_lock_path(patient_id)), _flock(self.lock_path, exclusive=False):
+            current = self._versions().get(patient_id)
+            entry = make_entry(current)
+            self._append(entry)
+        return current is None
+
+    def put_patient(self, patient_id, record):
+        """
+        Replace a patient's record. If ``record`` carries a ``version`` (as
+        returned by get_patient) it must still be current, otherwise
+        ConcurrentUpdateError is raised instead of overwriting newer data.
+        On success ``record["version"]`` is advanced in place.
+        """
+        def make_entry(current):
+            current = current or 0
+            expected = record.get("version")
+            if expected is not None and expected != current:
+                raise ConcurrentUpdateError(patient_id, expected, current)
+            record["version"] = current + 1
+            return {"op": "put", "patient_id": patient_id, "record": record}
+
+        self._write(patient_id, make_entry)
+
+    def append_visit(self, patient_id, visit, metadata=None):
+        return self._write(
+            patient_id,
+            lambda current: {"op": "visit", "patient_id": patient_id, "visit": visit, "metadata": metadata},
+        )
+
+    # --- compaction ---
+
+    def compact(self):
+        """Fold the journal into a new snapshot. Returns the number of entries folded."""
+        with _flock(self.compact_lock_path):
+            # Rotate the journal so appends continue into a fresh file while we fold.
+            with _flock(self.lock_path):
+                pending = self._pending_compaction()
+                if pending is None:
+                    if os.path.exists(self.compacting_path):
+                        os.remove(self.compacting_path)
+                    if not os.path.exists(self.journal_path):
+                        return 0
+                    os.replace(self.journal_path, self.compacting_path)
+                    pending = {"dedupe": False}
+
+            db = self._read_snapshot()
+            entries = self._read_journal(self.compacting_path)[0]
+            for entry in entries:
+                self._apply(db, entry, **pending)
+
+            tmp_path = self._write_temp_snapshot(db)
+            with _flock(self.lock_path):
+                os.replace(tmp_path, self.path)
+                _fsync_dir(self.path)
+                os.remove(self.compacting_path)
+            return len(entries)
+
+    def _write_temp_snapshot(self, db):
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(db, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def import_visits(self, rows):
+        """
+        Bulk import: fold the journal and all rows into one new snapshot under
+        the exclusive database lock, so the import lands atomically (or not
+        at all) with a single rewrite instead of one journal entry per visit.
+        """
+        with _flock(self.compact_lock_path), _flock(self.lock_path):
+            db, _ = self._read_all()
+            count = 0
+            for patient_id, visit, metadata in rows:
+                self._apply(db, {"op": "visit", "patient_id": patient_id, "visit": visit, "metadata": metadata})
+                count += 1
+            os.replace(self._write_temp_snapshot(db), self.path)
+            for path in (self.journal_path, self.compacting_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            _fsync_dir(self.path)
+        return count
+
+    def modify_patients(self, patient_ids, modify):
+        """Like import_visits: every change lands in one new snapshot under the exclusive lock."""
+        with _flock(self.compact_lock_path), _flock(self.lock_path):
+            db, _ = self._read_all()
+            count = 0
+            for patient_id in patient_ids:
+                record = db.get(patient_id)
+                if record is None:
+                    continue
+                modify(patient_id, record)
+                record["version"] = record.get("version", 0) + 1
+                count += 1
+            if count:
+                os.replace(self._write_temp_snapshot(db), self.path)
+                for path in (self.journal_path, self.compacting_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                _fsync_dir(self.path)
+        return count
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, name="patient-db-compactor", daemon=True)
+            self._compactor.start()
+
+
+class SQLitePatientStore(PatientStore):
+    """
+    Patients and visits in SQLite. Point lookups and single-visit appends
+    go through the primary key / (patient_id, timestamp) index instead of
+    re-reading the whole database.
+
+    Writes run in ``BEGIN IMMEDIATE`` transactions; each patient row carries
+    a version that put_patient() checks before replacing the record.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id TEXT PRIMARY KEY,
+            metadata   TEXT NOT NULL DEFAULT '{}',
+            version    INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS visits (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT NOT NULL REFERENCES patients(patient_id),
+            timestamp  TEXT,
+            data       TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_visits_patient ON visits(patient_id, id);
+        CREATE INDEX IF NOT EXISTS idx_visits_timestamp ON visits(timestamp);
+    """
+
+    def __init__(self, path=SQLITE_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+        with self._transaction() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(patients)")]
+            if "version" not in columns:
+                conn.execute("ALTER TABLE patients ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        # Streamlit serves each session from its own thread; sqlite3
+        # connections must not be shared across threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, track=False):
+        """
+        A write transaction. With ``track`` the change tokens around it are
+        recorded for last_write_tokens(), unless another connection committed
+        in between (PRAGMA data_version only moves for other connections).
+        """
+        conn = self._connect()
+        if track:
+            self._local.write_tokens = None
+        conn.execute("BEGIN IMMEDIATE")
+        if track:
+            before = self.change_token()
+            (data_version,) = conn.execute("PRAGMA data_version").fetchone()
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if track:
+            after = self.change_token()
+            if conn.execute("PRAGMA data_version").fetchone()[0] == data_version:
+                self._local.write_tokens = (before, after)
+
+    def change_token(self):
+        # In WAL mode every commit grows the -wal file and checkpoints rewrite the db.
+        return _stat_token(self.path, self.path + "-wal")
+
+    def _visits(self, conn, patient_id):
+        rows = conn.execute(
+            "SELECT data FROM visits WHERE patient_id = ? ORDER BY id", (patient_id,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_patient(self, patient_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT metadata, version FROM patients WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        if row is None:
+            return {}
+        return {"metadata": json.loads(row[0]), "visits": self._visits(conn, patient_id), "version": row[1]}
+
+    def get_metadata(self, patient_id):
+        row = self._connect().execute(
+            "SELECT metadata FROM patients WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _insert_visits(self, conn, patient_id, visits):
+        conn.executemany(
+            "INSERT INTO visits (patient_id, timestamp, data) VALUES (?, ?, ?)",
+            [(patient_id, v.get("timestamp"), json.dumps(v)) for v in visits],
+        )
+
+    def _replace(self, conn, patient_id, record, version):
+        conn.execute(
+            "INSERT INTO patients (patient_id, metadata, version) VALUES (?, ?, ?) "
+            "ON CONFLICT(patient_id) DO UPDATE SET metadata = excluded.metadata, version = excluded.version",
+            (patient_id, json.dumps(record.get("metadata", {})), version),
+        )
+        conn.execute("DELETE FROM visits WHERE patient_id = ?", (patient_id,))
+        self._insert_visits(conn, patient_id, record.get("visits", []))
+
+    def put_patient(self, patient_id, record):
+        """Replace a record; see JSONPatientStore.put_patient for version semantics."""
+        with self._transaction(track=True) as conn:
+            row = conn.execute(
+                "SELECT version FROM patients WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            current = row[0] if row else 0
+            expected = record.get("version")
+            if expected is not None and expected != current:
+                raise ConcurrentUpdateError(patient_id, expected, current)
+            self._replace(conn, patient_id, record, current + 1)
+        record["version"] = current + 1
+
+    def append_visit(self, patient_id, visit, metadata=None):
+        with self._transaction(track=True) as conn:
+            row = conn.execute(
+                "SELECT metadata FROM patients WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            created = row is None
+            if created:
+                conn.execute(
+                    "INSERT INTO patients (patient_id, metadata, version) VALUES (?, ?, 1)",
+                    (patient_id, json.dumps(metadata or {})),
+                )
+            else:
+                merged = json.loads(row[0])
+                merged.update(metadata or {})
+                conn.execute(
+                    "UPDATE patients SET metadata = ?, version = version + 1 WHERE patient_id = ?",
+                    (json.dumps(merged), patient_id),
+                )
+            self._insert_visits(conn, patient_id, [visit])
+        return created
+
+    def patient_ids(self):
+        rows = self._connect().execute("SELECT patient_id FROM patients ORDER BY rowid")
+        return [pid for (pid,) in rows]
+
+    def iter_patients(self):
+        conn = self._connect()
+        for patient_id, metadata, version in conn.execute(
+            "SELECT patient_id, metadata, version FROM patients ORDER BY rowid"
+        ).fetchall():
+            yield patient_id, {
+                "metadata": json.loads(metadata),
+                "visits": self._visits(conn, patient_id),
+                "version": version,
+            }
+
+    def iter_visits(self):
+        # A single ordered scan; rows are streamed from the cursor, never
+        # materialised as a whole.
+        metadata_cache = {}
+        rows = self._connect().execute(
+            "SELECT v.patient_id, p.metadata, v.data FROM visits v "
+            "JOIN patients p ON p.patient_id = v.patient_id ORDER BY p.rowid, v.id"
+        )
+        for patient_id, metadata, data in rows:
+            if patient_id not in metadata_cache:
+                metadata_cache.clear()
+                metadata_cache[patient_id] = json.loads(metadata)
+            yield patient_id, metadata_cache[patient_id], json.loads(data)
+
+    def import_visits(self, rows, chunk_size=1000):
+        count = 0
+        rows = iter(rows)
+        with self._transaction() as conn:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                conn.executemany(
+                    "INSERT INTO patients (patient_id, metadata, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT(patient_id) DO UPDATE SET "
+                    "metadata = json_patch(metadata, excluded.metadata), version = version + 1",
+                    [(pid, json.dumps(metadata or {})) for pid, _, metadata in chunk],
+                )
+                conn.executemany(
+                    "INSERT INTO visits (patient_id, timestamp, data) VALUES (?, ?, ?)",
+                    [(pid, visit.get("timestamp"), json.dumps(visit)) for pid, visit, _ in chunk],
+                )
+                count += len(chunk)
+        return count
+
+    def modify_patients(self, patient_ids, modify):
+        count = 0
+        with self._transaction() as conn:
+            for patient_id in patient_ids:
+                row = conn.execute(
+                    "SELECT metadata, version FROM patients WHERE patient_id = ?", (patient_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                record = {"metadata": json.loads(row[0]), "visits": self._visits(conn, patient_id), "version": row[1]}
+                modify(patient_id, record)
+                self._replace(conn, patient_id, record, row[1] + 1)
+                count += 1
+        return count
+
+    def import_records(self, records):
+        """Bulk-load {patient_id: record} in a single transaction."""
+        count = 0
+        with self._transaction() as conn:
+            for patient_id, record in records:
+                self._replace(conn, patient_id, record, record.get("version", 0))
+                count += 1
+        return count
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store for the configured backend."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STORAGE_BACKEND == "sqlite":
+                    _store = SQLitePatientStore(os.getenv("HEALTHAI_SQLITE_DB", SQLITE_DB))
+                elif STORAGE_BACKEND == "json":
+                    _store = JSONPatientStore(os.getenv("HEALTHAI_PATIENT_DB", PATIENT_DB))
+                else:
+                    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
+    return _store
+
+
+def migrate_json_to_sqlite(source=PATIENT_DB, target=SQLITE_DB):
+    """One-shot import of a patients.json file (and its journal) into a SQLite store."""
+    db = JSONPatientStore(source).load_all()
+    return SQLitePatientStore(target).import_records(db.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.storage", description="Patient DB storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="Import patients.json into a SQLite database")
+    migrate.add_argument("--source", default=PATIENT_DB)
+    migrate.add_argument("--target", default=SQLITE_DB)
+
+    compact = sub.add_parser("compact", help="Fold the JSON write journal into the snapshot")
+    compact.add_argument("--path", default=PATIENT_DB)
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        count = migrate_json_to_sqlite(args.source, args.target)
+        print(f"Imported {count} patient(s) from {args.source} into {args.target}")
+        print("Set HEALTHAI_STORAGE=sqlite to use the new database.")
+    elif args.command == "compact":
+        count = JSONPatientStore(args.path).compact()
+        print(f"Folded {count} journal entr{'y' if count == 1 else 'ies'} into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# utils/streaming.py
+
+"""
+Throttled rendering of streamed LLM output into a Streamlit placeholder.
+
+Re-rendering the whole response for every token is quadratic in the response
+length and floods the websocket. StreamRenderer buffers chunks in a list and
+updates the placeholder at most once per ``interval_ms``, or sooner once
+``max_pending`` chunks are waiting; finish() always renders the final text.
+
+    renderer = StreamRenderer(st.empty(), cursor="▌")
+    for chunk in generate_streaming_text(prompt):
+        renderer.push(chunk)
+    text = renderer.finish()
+"""
+
+import os
+import time
+
+RENDER_INTERVAL_MS = float(os.getenv("HEALTHAI_STREAM_RENDER_MS", 100))
+RENDER_MAX_PENDING = int(os.getenv("HEALTHAI_STREAM_RENDER_TOKENS", 64))
+
+
+class StreamRenderer:
+    def __init__(self, placeholder, template=None, cursor="", unsafe_allow_html=False,
+                 interval_ms=RENDER_INTERVAL_MS, max_pending=RENDER_MAX_PENDING):
+        """
+        ``template`` formats the accumulated text for display (e.g. wrap it in
+        an HTML box); ``cursor`` is appended while streaming only.
+        """
+        self.placeholder = placeholder
+        self.template = template or (lambda text: text)
+        self.cursor = cursor
+        self.unsafe_allow_html = unsafe_allow_html
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+
+        self.tokens = 0
+        self.renders = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._chunks = []
+        self._pending = 0
+        self._last_render = 0.0
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def push(self, chunk):
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self.tokens += 1
+        self._pending += 1
+        now = time.perf_counter()
+        if now - self._last_render >= self.interval or self._pending >= self.max_pending:
+            self._render(self.text + self.cursor, now)
+
+    def finish(self):
+        """Render the complete text without the cursor and return it."""
+        self.finished_at = time.perf_counter()
+        text = self.text
+        self._render(text, self.finished_at)
+        return text
+
+    def _render(self, text, now):
+        self.placeholder.markdown(self.template(text), unsafe_allow_html=self.unsafe_allow_html)
+        self.renders += 1
+        self._pending = 0
+        self._last_render = now
+
+    @property
+    def tokens_per_s(self):
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {"tokens": self.tokens, "renders": self.renders, "tokens_per_s": self.tokens_per_s}
@@ -0,0 +1,125 @@
+# utils/transcription.py
+
+"""
+Streaming Whisper transcription for recordings of any length.
+
+Whisper only looks at 30 s of audio at a time, so long recordings are read
+window by window: each 30 s window (overlapping the previous one by
+HEALTHAI_ASR_OVERLAP_S seconds) is loaded from disk on its own, mixed down to
+mono and resampled to 16 kHz. HEALTHAI_ASR_BATCH_SIZE windows go through the
+model per generate call, and the words repeated in the overlap are dropped
+when the texts are stitched. Memory is bounded by one batch of windows and
+time grows linearly with duration.
+
+With HEALTHAI_ASR_VAD=1, windows with (almost) no frames louder than
+HEALTHAI_ASR_VAD_DB dBFS are skipped without running the model.
+
+    for segment in iter_transcription("query.wav", processor, model):
+        print(f"[{segment['start']:.0f}s] {segment['text']}")
+"""
+
+import os
+
+import torch
+import torchaudio
+
+SAMPLE_RATE = 16000
+WINDOW_S = 30.0
+OVERLAP_S = float(os.getenv("HEALTHAI_ASR_OVERLAP_S", 2))
+BATCH_SIZE = int(os.getenv("HEALTHAI_ASR_BATCH_SIZE", 4))
+VAD_ENABLED = os.getenv("HEALTHAI_ASR_VAD", "0") == "1"
+VAD_THRESHOLD_DB = float(os.getenv("HEALTHAI_ASR_VAD_DB", -45))
+VAD_MIN_SPEECH = 0.02  # share of 30 ms frames above the threshold for a window to count as speech
+
+
+def iter_windows(path, window_s=WINDOW_S, overlap_s=OVERLAP_S):
+    """Yield (start seconds, mono 16 kHz float32 samples) for consecutive overlapping windows."""
+    rate = torchaudio.info(path).sample_rate
+    window = int(window_s * rate)
+    step = max(1, int((window_s - overlap_s) * rate))
+    resample = torchaudio.transforms.Resample(rate, SAMPLE_RATE) if rate != SAMPLE_RATE else None
+
+    offset = 0
+    while True:
+        waveform, _ = torchaudio.load(path, frame_offset=offset, num_frames=window)
+        if waveform.numel() == 0:
+            return
+        samples = waveform.mean(dim=0)
+        if resample is not None:
+            samples = resample(samples)
+        yield offset / rate, samples
+        if waveform.shape[1] < window:
+            return
+        offset += step
+
+
+def is_speech(samples, threshold_db=VAD_THRESHOLD_DB, min_speech=VAD_MIN_SPEECH):
+    """Energy-based voice activity check over 30 ms frames."""
+    frame = int(0.03 * SAMPLE_RATE)
+    usable = samples.shape[0] // frame * frame
+    if usable == 0:
+        return False
+    rms = samples[:usable].reshape(-1, frame).pow(2).mean(dim=1).sqrt()
+    loud = 20 * torch.log10(rms.clamp_min(1e-10)) > threshold_db
+    return loud.float().mean().item() >= min_speech
+
+
+def _normalize_word(word):
+    return word.lower().strip(".,!?;:\"'")
+
+
+def stitch(previous, text, max_words=20):
+    """Drop the words at the start of ``text`` that repeat the end of ``previous`` (the window overlap)."""
+    tail = previous.split()[-max_words:]
+    words = text.split()
+    for n in range(min(len(tail), len(words)), 0, -1):
+        if [_normalize_word(w) for w in tail[-n:]] == [_normalize_word(w) for w in words[:n]]:
+            return " ".join(words[n:])
+    return text.strip()
+
+
+def _transcribe(processor, model, windows, generate_kwargs):
+    features = processor(
+        [window[1].numpy() for window in windows], sampling_rate=SAMPLE_RATE, return_tensors="pt"
+    ).input_features
+    features = features.to(model.device, dtype=next(model.parameters()).dtype)
+    with torch.no_grad():
+        predicted_ids = model.generate(features, **generate_kwargs)
+    return processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+
+def iter_transcription(path, processor, model, batch_size=BATCH_SIZE, vad=VAD_ENABLED,
+                       window_s=WINDOW_S, overlap_s=OVERLAP_S, **generate_kwargs):
+    """
+    Yield {"start", "end", "text"} segments (seconds, stitched text) as each
+    batch of windows is transcribed.
+    """
+    previous = ""
+    batch = []
+    after_gap = False  # a skipped window means there is no overlap to de-duplicate
+
+    def flush():
+        nonlocal previous
+        texts = _transcribe(processor, model, batch, generate_kwargs)
+        for (start, samples, gap), raw in zip(batch, texts):
+            text = stitch("" if gap else previous, raw)
+            previous = raw
+            if text:
+                yield {"start": start, "end": start + samples.shape[0] / SAMPLE_RATE, "text": text}
+        batch.clear()
+
+    for start, samples in iter_windows(path, window_s, overlap_s):
+        if vad and not is_speech(samples):
+            after_gap = True
+            continue
+        batch.append((start, samples, after_gap))
+        after_gap = False
+        if len(batch) == batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,256 @@
+# utils/xray_batch.py
+
+"""
+Batch X-ray analysis for radiology backlogs.
+
+    python -m utils.xray_batch films/ more_films.zip --output data/xray_reports/backlog --batch-size 8
+
+Images come from folders, .zip archives, single files or Streamlit uploads.
+Worker processes decode them (HEALTHAI_XRAY_WORKERS), the main process
+groups them into batches of ``batch_size`` for one processor +
+model.generate call each, and every finished batch is appended to
+<output>/reports.jsonl and fsynced. Re-running a job with the same output
+directory skips the images already in reports.jsonl, so an interrupted
+backlog resumes where it stopped. Images whose whole batch failed (e.g. the
+model ran out of memory) are recorded with "retry": true and analysed again
+on the next run; later records for a name supersede earlier ones.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.helper import log_event
+from utils.image_preprocess import DEFAULT_INPUT_SIZE, prepare_image
+
+XRAY_WORKERS = int(os.getenv("HEALTHAI_XRAY_WORKERS", min(4, os.cpu_count() or 1)))
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+REPORTS_FILE = "reports.jsonl"
+
+_upload_digests = {}  # Streamlit file_id -> content hash, so reruns don't re-hash
+
+
+def iter_sources(paths):
+    """Yield (name, loader) for every image in the given folders, zip files and image files."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in sorted(os.walk(path)):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS):
+                        full = os.path.join(root, filename)
+                        yield os.path.relpath(full, os.path.dirname(path.rstrip(os.sep))), _file_loader(full)
+        elif path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                members = sorted(n for n in archive.namelist() if n.lower().endswith(IMAGE_EXTENSIONS))
+            for member in members:
+                yield f"{os.path.basename(path)}/{member}", _zip_loader(path, member)
+        else:
+            yield os.path.basename(path), _file_loader(path)
+
+
+def upload_job_id(files):
+    """
+    Job id for a set of Streamlit uploads, from their names and contents:
+    the same files resume the same job, different files never share one.
+    """
+    digests = []
+    for file in files:
+        file_id = getattr(file, "file_id", None)
+        digest = _upload_digests.get(file_id) if file_id else None
+        if digest is None:
+            digest = hashlib.sha256(file.getvalue()).hexdigest()
+            if file_id:
+                _upload_digests[file_id] = digest
+        digests.append(f"{file.name}:{digest}")
+    return hashlib.sha256("\n".join(sorted(digests)).encode()).hexdigest()[:16]
+
+
+def iter_uploads(files):
+    """(name, loader) pairs for Streamlit uploads; .zip uploads are expanded."""
+    for file in files:
+        data = file.getvalue()
+        if file.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                members = sorted(n for n in archive.namelist() if n.lower().endswith(IMAGE_EXTENSIONS))
+            for member in members:
+                yield f"{file.name}/{member}", _zip_bytes_loader(data, member)
+        else:
+            yield file.name, _bytes_loader(data)
+
+
+def _file_loader(path):
+    def load():
+        with open(path, "rb") as f:
+            return f.read()
+    return load
+
+
+def _zip_loader(path, member):
+    def load():
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(member)
+    return load
+
+
+def _zip_bytes_loader(data, member):
+    # Members are decompressed only when their image is decoded
+    def load():
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return archive.read(member)
+    return load
+
+
+def _bytes_loader(data):
+    return lambda: data
+
+
+def decode_image(data, min_side=DEFAULT_INPUT_SIZE):
+    """Worker: image bytes -> RGB PIL image downscaled to the model's input resolution."""
+    return prepare_image(data, min_side)
+
+
+def load_done(output_dir):
+    """Names already finished by earlier runs of this job (batch failures marked "retry" are not)."""
+    done = set()
+    try:
+        with open(os.path.join(output_dir, REPORTS_FILE), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    name = record["name"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue  # torn line from an interrupted run
+                if record.get("retry"):
+                    done.discard(name)
+                else:
+                    done.add(name)
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _append(output_dir, records):
+    with open(os.path.join(output_dir, REPORTS_FILE), "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _decoded(pool, sources, window, image_size):
+    """Yield (name, image or None, error) in order, keeping at most ``window`` decodes in flight."""
+    pending = []
+    for name, load in sources:
+        try:
+            data = load()
+        except OSError as e:
+            pending.append((name, None, str(e)))
+        else:
+            image = pool.submit(decode_image, data, image_size) if pool else decode_image(data, image_size)
+            pending.append((name, image, None))
+        while len(pending) > window:
+            yield _resolve(*pending.pop(0))
+    while pending:
+        yield _resolve(*pending.pop(0))
+
+
+def _resolve(name, image, error):
+    if image is not None and hasattr(image, "result"):
+        try:
+            image = image.result()
+        except Exception as e:
+            return name, None, str(e)
+    return name, image, error
+
+
+def run_batch(sources, output_dir, analyze, batch_size=8, workers=XRAY_WORKERS, progress=None,
+              image_size=DEFAULT_INPUT_SIZE):
+    """
+    Analyse every image from ``sources`` ((name, loader) pairs) not yet in
+    ``output_dir``. ``analyze(images)`` returns one report per image, e.g.
+    models.xray_analysis.analyze_xray_images. ``progress(stats)`` is called
+    after every batch. Images are downscaled in the workers to a shorter
+    side of ``image_size`` before they reach the processor. Returns the
+    stats dict.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_done(output_dir)
+    # Only names and loaders are listed (for the total); image bytes are read lazily
+    sources = list(sources)
+    listed = len(sources)
+    sources = [(name, load) for name, load in sources if name not in done]
+    stats = {"total": len(sources), "skipped": listed - len(sources), "analysed": 0, "failed": 0,
+             "seconds": 0.0, "images_per_minute": 0.0}
+    started = time.perf_counter()
+
+    def flush(batch):
+        names = [name for name, _ in batch]
+        try:
+            reports = analyze([image for _, image in batch])
+            records = [{"name": name, "report": report} for name, report in zip(names, reports)]
+            stats["analysed"] += len(records)
+        except Exception as e:
+            log_event("error", f"X-ray batch failed: {e}")
+            # Not the images' fault (OOM, model error): analyse them again on resume
+            records = [{"name": name, "error": str(e), "retry": True} for name in names]
+            stats["failed"] += len(records)
+        _append(output_dir, records)
+        stats["seconds"] = time.perf_counter() - started
+        stats["images_per_minute"] = stats["analysed"] * 60 / stats["seconds"] if stats["seconds"] else 0.0
+        if progress is not None:
+            progress(stats)
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) if workers > 1 else None
+    try:
+        batch = []
+        for name, image, error in _decoded(pool, sources, 2 * batch_size, image_size):
+            if image is None:
+                # Unreadable files are recorded as failed (and not retried on resume)
+                _append(output_dir, [{"name": name, "error": error}])
+                stats["failed"] += 1
+                continue
+            batch.append((name, image))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    log_event("xray_report", f"Batch analysis in {output_dir}: {stats['analysed']} analysed, "
+                             f"{stats['failed']} failed, {stats['images_per_minute']:.1f} images/min")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.xray_batch", description="Batch X-ray analysis")
+    parser.add_argument("paths", nargs="+", help="Image files, folders or .zip archives")
+    parser.add_argument("--output", required=True, help="Job directory for reports.jsonl (resumable)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=XRAY_WORKERS, help="Image decoding processes")
+    parser.add_argument("--image-size", type=int, default=DEFAULT_INPUT_SIZE,
+                        help="Shorter side images are downscaled to before the processor")
+    args = parser.parse_args(argv)
+
+    from models.xray_analysis import analyze_xray_images
+
+    def show(stats):
+        print(f"{stats['analysed'] + stats['failed']}/{stats['total']} images, "
+              f"{stats['images_per_minute']:.1f} images/min", flush=True)
+
+    stats = run_batch(iter_sources(args.paths), args.output, analyze_xray_images,
+                      args.batch_size, args.workers, progress=show, image_size=args.image_size)
+    print(f"Done: {stats['analysed']} analysed, {stats['failed']} failed, {stats['skipped']} already done; "
+          f"reports in {os.path.join(args.output, REPORTS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()